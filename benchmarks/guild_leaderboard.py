@@ -0,0 +1,87 @@
+"""
+Guild leaderboard latency with every member ID inlined into the SQL text (old) versus
+passed as one bigint[] parameter (new), at several guild sizes.
+
+Needs a scratch PostgreSQL database with the bot's tables. It seeds members with IDs in
+a reserved range and deletes them afterwards.
+Run from the src directory: DATABASE_URL=... python ../benchmarks/guild_leaderboard.py
+"""
+
+# pylint: disable=wrong-import-position
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("TOKEN", "benchmark")
+sys.path.insert(0, os.getcwd())
+
+import asyncpg
+
+import database
+from modules.general import GUILD_LEADERBOARD
+
+GUILD_SIZES = (1000, 50000, 250000)
+RUNS = 5
+GUILD_ID = 1
+BASE_ID = 7 * 10 ** 18
+
+LEGACY_QUERY = """
+SELECT id,M.member,tier,COALESCE(wsum,0) as waifu_sum,wallet,(COALESCE(wsum, 0)+wallet) as total
+FROM members M LEFT JOIN (
+SELECT member_id,sum(purchased_for) as wsum FROM purchased_waifu
+WHERE guild = {guild} GROUP BY member_id) PW ON (M.id = PW.member_id)
+WHERE (wallet > 0 OR COALESCE(wsum, 0) > 0) AND M.member in {mlist}
+ORDER BY total DESC LIMIT 10;
+"""
+
+
+async def timed(func):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+async def main():
+    database.prepare_tables()
+    conn = await asyncpg.connect(os.environ["DATABASE_URL"])
+    member_ids = [BASE_ID + i for i in range(max(GUILD_SIZES))]
+
+    await conn.copy_records_to_table(
+        "members",
+        records=[(i, random.randint(1, 100000)) for i in member_ids],
+        columns=["member", "wallet"],
+    )
+    try:
+        print(f"{'members':>8} {'old SQL':>10} {'old ms':>9} {'new SQL':>8} {'new ms':>9}")
+        for size in GUILD_SIZES:
+            members = member_ids[:size]
+
+            async def legacy(members=members):
+                query = LEGACY_QUERY.format(guild=GUILD_ID, mlist=tuple(members))
+                await conn.fetch(query)
+
+            async def prepared(members=members):
+                await conn.fetch(GUILD_LEADERBOARD.sql, GUILD_ID, members)
+
+            legacy_size = len(LEGACY_QUERY.format(guild=GUILD_ID, mlist=tuple(members)))
+            print(
+                f"{size:>8} {legacy_size / 1024:>8.0f}KB {await timed(legacy):>9.2f} "
+                f"{len(GUILD_LEADERBOARD.sql):>7}B {await timed(prepared):>9.2f}"
+            )
+    finally:
+        await conn.execute(
+            "DELETE FROM members WHERE member >= $1 AND member < $2;",
+            BASE_ID,
+            BASE_ID + len(member_ids),
+        )
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
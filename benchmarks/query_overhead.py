@@ -0,0 +1,150 @@
+"""
+Client-side cost per hot query call, end to end through the engine: a SQLAlchemy
+expression run with engine.fetch_one/fetch_all (old) versus PreparedQuery, which goes
+through engine.fetch_prepared (new). Both acquire and release a pooled connection, read
+a column of the result and are timed by the pool metrics. Calls run from CONCURRENCY
+tasks at once, like command handlers. The pool hands out stub asyncpg connections that
+answer after one event loop turn and, like asyncpg, refuse a second query while one is in
+progress. The numbers leave out the network and the server; on a real database each call
+also pays one round trip.
+
+Run from the src directory: python ../benchmarks/query_overhead.py
+"""
+
+# pylint: disable=wrong-import-position,protected-access
+import asyncio
+import os
+import sys
+import time
+
+import asyncpg
+
+os.environ.setdefault("TOKEN", "benchmark")
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/benchmark")
+sys.path.insert(0, os.getcwd())
+
+import database
+from modules.waifu import WAIFU_SEARCH, generate_search_query
+
+N = 5000
+CONCURRENCY = 10
+SEARCH_ROWS = 30
+
+
+class StubRow(dict):
+    # Stands in for an asyncpg Record: indexable by column name and by position.
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return super().__getitem__(key)
+
+
+WAIFU_ROW = StubRow(
+    id=1,
+    name="Rem",
+    from_anime="Re:Zero",
+    gender="f",
+    price=1000,
+    description="",
+    image_url=None,
+)
+WALLET_ROW = StubRow(wallet=500, **{f"column_{i}": None for i in range(6)})
+
+
+class StubConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.busy = False
+
+    async def _answer(self, sql):
+        if self.busy:
+            raise asyncpg.InterfaceError("another operation is in progress")
+        self.busy = True
+        try:
+            await asyncio.sleep(0)
+        finally:
+            self.busy = False
+        self.pool.queries += 1
+        return WAIFU_ROW if "waifu" in sql else WALLET_ROW
+
+    async def fetchrow(self, sql, *_args):
+        return await self._answer(sql)
+
+    async def fetchval(self, sql, *_args):
+        return (await self._answer(sql))[0]
+
+    async def fetch(self, sql, *_args):
+        return [await self._answer(sql)] * SEARCH_ROWS
+
+
+class StubPool:
+    def __init__(self):
+        self.queries = 0
+        self.idle = []
+
+    async def acquire(self, timeout=None):  # pylint: disable=unused-argument
+        return self.idle.pop() if self.idle else StubConnection(self)
+
+    async def release(self, connection):
+        self.idle.append(connection)
+
+
+def make_engine():
+    engine = database.InstrumentedDatabase(os.environ["DATABASE_URL"])
+    engine._backend._pool = StubPool()
+    engine.is_connected = True
+    database.ENGINE = engine
+    return engine
+
+
+async def legacy_wallet(engine):
+    # The query fetch_wallet built before PreparedQuery.
+    query = database.Member.select().where(database.Member.c.member == 252297314394308608)
+    row = await engine.fetch_one(query=query)
+    return row[database.Member.c.wallet]
+
+
+async def prepared_wallet(_engine):
+    return await database.MEMBER_WALLET.fetch_val(member=252297314394308608)
+
+
+async def legacy_search(engine):
+    # The same expression the old generate_search_query built, with the input inlined.
+    query = generate_search_query().params(search="Rem", limit=SEARCH_ROWS)
+    return [row["name"] for row in await engine.fetch_all(query=query)]
+
+
+async def prepared_search(_engine):
+    # WAIFU_SEARCH is marked for the replica; with no READ_DATABASE_URL that is the primary.
+    return [row["name"] for row in await WAIFU_SEARCH.fetch_all(search="Rem", limit=SEARCH_ROWS)]
+
+
+async def report(name, func, engine):
+    pool = engine.pool._pool
+
+    async def worker():
+        for _ in range(N // CONCURRENCY):
+            await func(engine)
+
+    before = pool.queries
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    per_call = (time.perf_counter() - start) / N * 1e6
+    assert pool.queries - before == N, "every call must reach a connection"
+    print(f"{name:<18}{per_call:>10.2f} µs/call")
+
+
+async def main():
+    engine = make_engine()
+    print(
+        f"{N} calls each from {CONCURRENCY} tasks against stub connections, "
+        "excluding the database round trip.\n"
+    )
+    await report("wallet (old)", legacy_wallet, engine)
+    await report("wallet (new)", prepared_wallet, engine)
+    await report("search (old)", legacy_search, engine)
+    await report("search (new)", prepared_search, engine)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+Random roll cost at several catalog sizes: `ORDER BY random() LIMIT 1` over a copy of the
+waifu table (old) versus the in-process sampler, uniform and price-band weighted (new).
+
+The SQL half needs a scratch PostgreSQL database; it creates and drops its own table.
+Pass --local-only to time just the sampler.
+Run from the src directory: DATABASE_URL=... python ../benchmarks/roll_sampling.py
+"""
+
+# pylint: disable=wrong-import-position
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("TOKEN", "benchmark")
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/benchmark")
+sys.path.insert(0, os.getcwd())
+
+import asyncpg
+
+import catalog
+import config
+import sampler
+
+SIZES = (10000, 100000, 1000000)
+SQL_RUNS = 20
+SAMPLES = 100000
+
+
+def fake_catalog(size):
+    columns = catalog.WaifuColumns()
+    for i in range(size):
+        columns.append(
+            {
+                "id": i + 1,
+                "name": f"Waifu {i}",
+                "from_anime": f"Series {i % 5000}",
+                "gender": "f",
+                "price": random.randint(100, 500000),
+                "description": None,
+                "image_url": None,
+            }
+        )
+    return columns
+
+
+def time_sampler(weighting):
+    rolls = sampler.WaifuSampler(weighting=weighting)
+    rolls.sample()  # Builds the alias table outside the timing.
+    start = time.perf_counter()
+    for _ in range(SAMPLES):
+        rolls.sample()
+    return (time.perf_counter() - start) / SAMPLES * 1e6
+
+
+async def time_sql(conn, columns):
+    await conn.execute("DROP TABLE IF EXISTS waifu_roll_benchmark;")
+    await conn.execute(
+        "CREATE TABLE waifu_roll_benchmark (id bigint PRIMARY KEY, name text, "
+        "from_anime text, gender char(1), price bigint, description text, image_url text);"
+    )
+    await conn.copy_records_to_table(
+        "waifu_roll_benchmark",
+        records=zip(columns.ids, columns.names, columns.series, columns.prices),
+        columns=["id", "name", "from_anime", "price"],
+    )
+    await conn.execute("ANALYZE waifu_roll_benchmark;")
+    timings = []
+    for _ in range(SQL_RUNS):
+        start = time.perf_counter()
+        await conn.fetchrow("SELECT * FROM waifu_roll_benchmark ORDER BY random() LIMIT 1;")
+        timings.append((time.perf_counter() - start) * 1e6)
+    await conn.execute("DROP TABLE waifu_roll_benchmark;")
+    return statistics.median(timings)
+
+
+async def main():
+    conn = None
+    if "--local-only" not in sys.argv:
+        conn = await asyncpg.connect(config.DATABASE_URL)
+
+    print(f"{'rows':>9} {'SQL µs':>10} {'uniform µs':>11} {'price_band µs':>14}")
+    for size in SIZES:
+        catalog.WAIFUS.columns = fake_catalog(size)
+        catalog.WAIFUS.generation += 1
+        sql_us = await time_sql(conn, catalog.WAIFUS.columns) if conn else float("nan")
+        print(
+            f"{size:>9,} {sql_us:>10.1f} {time_sampler('uniform'):>11.2f} "
+            f"{time_sampler('price_band'):>14.2f}"
+        )
+
+    if conn:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
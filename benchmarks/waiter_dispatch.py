@@ -0,0 +1,160 @@
+"""
+Per-event cost with 1,000 pending prompts (confirmations, paginators and coin drops spread
+over 200 channels): discord.py's wait_for, which runs every check on every event (old),
+versus the indexed WaiterRegistry (new). Events are unrelated chat messages and reactions,
+the common case, plus a final pass that answers every prompt.
+
+Run from the src directory: python ../benchmarks/waiter_dispatch.py
+"""
+
+# pylint: disable=wrong-import-position
+import asyncio
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("TOKEN", "benchmark")
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/benchmark")
+sys.path.insert(0, os.getcwd())
+
+import discord
+
+import waiters
+
+WAITERS = 1000
+CHANNELS = 200
+EVENTS = 20000
+
+
+def fake_message(channel_id, author_id, content="hello"):
+    return SimpleNamespace(
+        id=random.getrandbits(60),
+        channel=SimpleNamespace(id=channel_id),
+        author=SimpleNamespace(id=author_id, bot=False),
+        content=content,
+    )
+
+
+def fake_reaction(message_id):
+    return SimpleNamespace(message=SimpleNamespace(id=message_id), emoji="➡")
+
+
+def prompts():
+    # (kind, channel, author or message ID): mostly confirmations, some paginators and drops.
+    kinds = random.choices(["confirm", "paginate", "drop"], weights=[6, 3, 1], k=WAITERS)
+    return [(kind, random.randrange(CHANNELS), random.getrandbits(60)) for kind in kinds]
+
+
+def register_legacy(client, pending):
+    tasks = []
+    for kind, channel, target in pending:
+        if kind == "confirm":
+
+            def check(m, channel=channel, author=target):
+                return m.channel.id == channel and m.author.id == author
+
+            event = "message"
+        elif kind == "paginate":
+
+            def check(reaction, user, message_id=target):
+                return not user.bot and reaction.message.id == message_id
+
+            event = "reaction_add"
+        else:
+
+            def check(m, channel=channel):
+                return m.channel.id == channel and not m.author.bot and m.content == "collect"
+
+            event = "message"
+        tasks.append(asyncio.ensure_future(client.wait_for(event, check=check, timeout=600)))
+    return tasks
+
+
+def register_indexed(registry, pending):
+    tasks = []
+    for kind, channel, target in pending:
+        if kind == "confirm":
+            waiter = registry.wait_for_message(channel, target, timeout=600)
+        elif kind == "paginate":
+            waiter = registry.wait_for_reaction(
+                target, check=lambda _reaction, user: not user.bot, timeout=600
+            )
+        else:
+            waiter = registry.wait_for_message(
+                channel, check=lambda m: not m.author.bot and m.content == "collect", timeout=600
+            )
+        tasks.append(asyncio.ensure_future(waiter))
+    return tasks
+
+
+def noise():
+    user = SimpleNamespace(id=1, bot=False)
+    for _ in range(EVENTS):
+        if random.random() < 0.8:
+            yield "message", (fake_message(random.randrange(CHANNELS), random.getrandbits(60)),)
+        else:
+            yield "reaction_add", (fake_reaction(random.getrandbits(60)), user)
+
+
+def answers(pending):
+    user = SimpleNamespace(id=1, bot=False)
+    for kind, channel, target in pending:
+        if kind == "confirm":
+            yield "message", (fake_message(channel, target, "yes"),)
+        elif kind == "paginate":
+            yield "reaction_add", (fake_reaction(target), user)
+        else:
+            yield "message", (fake_message(channel, 2, "collect"),)
+
+
+async def run(name, dispatch, register, pending, events):
+    tasks = register(pending)
+    await asyncio.sleep(0)  # Let every waiter register.
+
+    start = time.perf_counter()
+    for event, args in events:
+        dispatch(event, *args)
+    noise_us = (time.perf_counter() - start) / EVENTS * 1e6
+
+    start = time.perf_counter()
+    for event, args in answers(pending):
+        dispatch(event, *args)
+    answer_us = (time.perf_counter() - start) / WAITERS * 1e6
+
+    await asyncio.wait(tasks, timeout=1)
+    done = sum(task.done() and task.exception() is None for task in tasks)
+    for task in tasks:
+        task.cancel()
+    print(f"{name:>16} {noise_us:>14.2f} {answer_us:>14.2f} {done:>9,}/{WAITERS:,}")
+
+
+async def main():
+    pending = prompts()
+    events = list(noise())
+    print(f"{'':>16} {'µs per event':>14} {'µs per answer':>14} {'answered':>15}")
+
+    client = discord.Client(loop=asyncio.get_event_loop())
+    await run(
+        "bot.wait_for", client.dispatch, lambda p: register_legacy(client, p), pending, events
+    )
+
+    registry = waiters.WaiterRegistry()
+    handlers = {
+        "message": lambda m: registry.on_message(m).send(None),
+        "reaction_add": lambda r, u: registry.on_reaction_add(r, u).send(None),
+    }
+
+    def dispatch(event, *args):
+        try:
+            handlers[event](*args)
+        except StopIteration:
+            pass
+
+    await run("WaiterRegistry", dispatch, lambda p: register_indexed(registry, p), pending, events)
+    print(f"Indexed checks per event: {registry.checks_per_event:.03f}")
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,149 @@
+import collections
+import logging
+import time
+
+import sqlalchemy as sa
+
+import config
+import database
+import invalidation
+
+GUILD_ROW = database.PreparedQuery(
+    "guild_row",
+    database.Guild.select().where(database.Guild.c.guild == sa.bindparam("guild")),
+)
+
+PROFILE_COLUMNS = [
+    database.Member.c.id,
+    database.Member.c.member,
+    database.Member.c.tier,
+    database.Member.c.last_dailies,
+    database.Member.c.last_hourlies,
+    database.Member.c.last_reward,
+]
+MEMBER_PROFILE = database.PreparedQuery(
+    "member_profile",
+    sa.select(PROFILE_COLUMNS).where(database.Member.c.member == sa.bindparam("member")),
+)
+
+
+class GuildSettingsCache:
+    """
+    In-memory copy of the guild table keyed by guild ID. Rows are loaded lazily on first
+    use (or in bulk at startup) and kept current by writing settings changes through it.
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    async def load(self):
+        engine = await database.prepare_engine()
+        rows = await engine.fetch_all(query=database.Guild.select(), site="guild_settings_load")
+        self._rows = {row["guild"]: row for row in rows}
+        logging.info("Loaded settings for %d guilds.", len(self._rows))
+
+    async def get(self, guild_id):
+        row = self._rows.get(guild_id)
+        if row is not None:
+            self.hits += 1
+            return row
+
+        self.misses += 1
+        row = await GUILD_ROW.fetch_one(guild=guild_id)
+        if row is not None:
+            self._rows[guild_id] = row
+        return row
+
+    async def set(self, guild_id, **values):
+        engine = await database.prepare_engine()
+        query = (
+            database.Guild.update(None)
+            .where(database.Guild.c.guild == guild_id)
+            .values(**values)
+            .returning(*database.Guild.c)
+        )
+        row = await engine.fetch_one(query=query, site="guild_settings_set")
+        if row is not None:
+            self._rows[guild_id] = row
+        return row
+
+    def evict(self, guild_id):
+        self._rows.pop(guild_id, None)
+
+    def clear(self):
+        self._rows.clear()
+
+
+class MemberProfileCache:
+    """
+    Bounded LRU of member profiles (internal ID, tier and the last_* reward timestamps),
+    keyed by Discord user ID. Entries expire after `ttl` seconds so tier changes made
+    outside the bot are picked up; changes made by the bot are written through `set`.
+    Wallets are not cached, they change on nearly every command.
+    """
+
+    def __init__(self, max_size=config.MEMBER_CACHE_SIZE, ttl=config.MEMBER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._profiles = collections.OrderedDict()  # member ID -> (expiry, profile)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def _store(self, member_id, row):
+        self._profiles[member_id] = (
+            time.monotonic() + self.ttl,
+            {column.name: row[column.name] for column in PROFILE_COLUMNS},
+        )
+        self._profiles.move_to_end(member_id)
+        while len(self._profiles) > self.max_size:
+            self._profiles.popitem(last=False)
+        return self._profiles[member_id][1]
+
+    async def get(self, member_id):
+        entry = self._profiles.get(member_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            self._profiles.move_to_end(member_id)
+            return entry[1]
+
+        self.misses += 1
+        row = await MEMBER_PROFILE.fetch_one(member=member_id)
+        if row is None:
+            self._profiles.pop(member_id, None)
+            return None
+        return self._store(member_id, row)
+
+    async def set(self, member_id, **values):
+        engine = await database.prepare_engine()
+        query = (
+            database.Member.update(None)
+            .where(database.Member.c.member == member_id)
+            .values(**values)
+            .returning(*PROFILE_COLUMNS)
+        )
+        row = await engine.fetch_one(query=query, site="member_profile_set")
+        if row is None:
+            self._profiles.pop(member_id, None)
+            return None
+        return self._store(member_id, row)
+
+    def evict(self, member_id):
+        self._profiles.pop(member_id, None)
+
+    def clear(self):
+        self._profiles.clear()
+
+
+GUILD_SETTINGS = GuildSettingsCache()
+MEMBER_PROFILES = MemberProfileCache()
+
+invalidation.BUS.subscribe("guild", GUILD_SETTINGS.evict, GUILD_SETTINGS.clear)
+invalidation.BUS.subscribe("member", MEMBER_PROFILES.evict, MEMBER_PROFILES.clear)
@@ -0,0 +1,166 @@
+import array
+import asyncio
+import bisect
+import logging
+import random
+import sys
+import time
+
+import sqlalchemy as sa
+
+import config
+import database
+import invalidation
+
+COLUMNS = ("id", "name", "from_anime", "gender", "price", "description", "image_url")
+ATTRIBUTES = {
+    "id": "ids",
+    "name": "names",
+    "from_anime": "series",
+    "price": "prices",
+    "description": "descriptions",
+    "image_url": "image_urls",
+}
+
+
+class WaifuColumns:
+    """
+    One loaded copy of the waifu table as parallel arrays sorted by ID. IDs and prices are
+    int64 arrays and genders a uint32 array of code points (0 for none), so any character
+    the column holds fits; names and series are interned, so a series shared by many
+    waifus is stored once. Never mutated; a refresh builds a new one.
+    """
+
+    __slots__ = ("ids", "prices", "genders", "names", "series", "descriptions", "image_urls")
+
+    def __init__(self):
+        self.ids = array.array("q")
+        self.prices = array.array("q")
+        self.genders = array.array("I")
+        self.names = []
+        self.series = []
+        self.descriptions = []
+        self.image_urls = []
+
+    def append(self, row):
+        self.ids.append(row["id"])
+        self.prices.append(row["price"])
+        self.genders.append(ord(row["gender"]) if row["gender"] else 0)
+        self.names.append(sys.intern(row["name"]))
+        self.series.append(sys.intern(row["from_anime"]))
+        self.descriptions.append(row["description"])
+        self.image_urls.append(row["image_url"])
+
+    @property
+    def nbytes(self):
+        # Arrays and list slots, plus every distinct string object once.
+        total = sum(sys.getsizeof(c) for c in (self.ids, self.prices, self.genders))
+        strings = {}
+        for column in (self.names, self.series, self.descriptions, self.image_urls):
+            total += sys.getsizeof(column)
+            for value in column:
+                if value is not None:
+                    strings[id(value)] = value
+        return total + sum(sys.getsizeof(s) for s in strings.values())
+
+
+class WaifuRecord:  # pylint: disable=too-few-public-methods
+    """
+    Read-only view of one catalog entry. Indexed by column name like the rows returned
+    from the database, so it can be used wherever a waifu row was. It keeps its own
+    WaifuColumns, so it stays valid across catalog refreshes.
+    """
+
+    __slots__ = ("_columns", "_index")
+
+    def __init__(self, columns, index):
+        self._columns = columns
+        self._index = index
+
+    def __getitem__(self, key):
+        if key == "gender":
+            code = self._columns.genders[self._index]
+            return chr(code) if code else None
+        return getattr(self._columns, ATTRIBUTES[key])[self._index]
+
+
+class WaifuCatalog:
+    """
+    The waifu table held in memory, served from a WaifuColumns that is swapped whole on
+    refresh. Reloaded every CATALOG_REFRESH_INTERVAL seconds, and shortly after any waifu
+    row changes (through the invalidation bus).
+    """
+
+    def __init__(self):
+        self.columns = WaifuColumns()
+        self.generation = 0
+        self._stale = None
+        self._task = None
+
+    def __len__(self):
+        return len(self.columns.ids)
+
+    def get(self, waifu_id):
+        columns = self.columns
+        idx = bisect.bisect_left(columns.ids, waifu_id)
+        if idx < len(columns.ids) and columns.ids[idx] == waifu_id:
+            return WaifuRecord(columns, idx)
+        return None
+
+    def random(self):
+        # None until the catalog has loaded at least one waifu.
+        columns = self.columns
+        if not columns.ids:
+            return None
+        return WaifuRecord(columns, random.randrange(len(columns.ids)))
+
+    async def load(self):
+        start = time.perf_counter()
+        columns = WaifuColumns()
+
+        engine = await database.prepare_engine()
+        query = sa.select([getattr(database.Waifu.c, c) for c in COLUMNS]).order_by(
+            database.Waifu.c.id
+        )
+        async for row in engine.iterate(query=query):
+            columns.append(row)
+
+        self.columns = columns
+        self.generation += 1
+        logging.info(
+            "Loaded %d waifus into the catalog in %.2f ms (%.2f MiB per 100k).",
+            len(self),
+            (time.perf_counter() - start) * 1000,
+            self.bytes_per_100k() / 1048576,
+        )
+
+    def bytes_per_100k(self):
+        return self.columns.nbytes * 100000 / len(self) if self.columns.ids else 0
+
+    def mark_stale(self, _waifu_id=None):
+        if self._stale is not None:
+            self._stale.set()
+
+    def start(self):
+        if self._task is None:
+            self._stale = asyncio.Event()
+            # Detached, so its Connection is never one a command handler is using.
+            self._task = database.detached(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._stale.wait(), config.CATALOG_REFRESH_INTERVAL)
+                await asyncio.sleep(config.CATALOG_REFRESH_DELAY)  # Batch bulk edits.
+            except asyncio.TimeoutError:
+                pass
+            self._stale.clear()
+            try:
+                await self.load()
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Failed to refresh the waifu catalog.")
+
+
+WAIFUS = WaifuCatalog()
+
+invalidation.BUS.subscribe("waifu", WAIFUS.mark_stale, WAIFUS.mark_stale)
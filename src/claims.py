@@ -0,0 +1,223 @@
+import array
+import bisect
+import collections
+import logging
+import time
+
+import sqlalchemy as sa
+
+import catalog
+import config
+import database
+import invalidation
+
+BLOCK_BYTES = 64  # 512 catalog entries per popcount block
+POPCOUNT = bytes(bin(byte).count("1") for byte in range(256))
+
+GUILD_CLAIMS = database.PreparedQuery(
+    "guild_claims",
+    sa.select([database.PurchasedWaifu.c.waifu_id]).where(
+        database.PurchasedWaifu.c.guild == sa.bindparam("guild")
+    ),
+)
+
+
+class ClaimBitmap:
+    """
+    Waifus claimed in one guild, one bit per catalog index of a WaifuColumns. Popcounts of
+    every BLOCK_BYTES of bits are kept in a Fenwick tree, so the k-th unclaimed entry is
+    found in O(log n) blocks plus a scan of one block. The padding bits past the last
+    entry are set, so they never count as unclaimed.
+    """
+
+    __slots__ = ("columns", "bits", "tree", "claimed")
+
+    def __init__(self, columns):
+        self.columns = columns
+        size = len(columns.ids)
+        self.bits = bytearray((size + 7) // 8)
+        blocks = -(-len(self.bits) // BLOCK_BYTES)
+        self.tree = array.array("I", bytes(4 * (blocks + 1)))  # 1-based Fenwick tree
+        self.claimed = 0
+        for idx in range(size, len(self.bits) * 8):
+            self._set(idx)
+        self.claimed = 0
+
+    def __len__(self):
+        return self.claimed
+
+    def __contains__(self, waifu_id):
+        idx = self._index(waifu_id)
+        return idx is not None and self.bits[idx >> 3] >> (idx & 7) & 1 == 1
+
+    def __iter__(self):
+        # Claimed waifu IDs in ID order.
+        for idx, waifu_id in enumerate(self.columns.ids):
+            if self.bits[idx >> 3] >> (idx & 7) & 1:
+                yield waifu_id
+
+    @property
+    def nbytes(self):
+        return len(self.bits) + self.tree.itemsize * len(self.tree)
+
+    def _index(self, waifu_id):
+        ids = self.columns.ids
+        idx = bisect.bisect_left(ids, waifu_id)
+        return idx if idx < len(ids) and ids[idx] == waifu_id else None
+
+    def _count(self, idx, delta):
+        node = idx // (BLOCK_BYTES * 8) + 1
+        while node < len(self.tree):
+            self.tree[node] += delta
+            node += node & -node
+        self.claimed += delta
+
+    def _set(self, idx):
+        mask = 1 << (idx & 7)
+        if not self.bits[idx >> 3] & mask:
+            self.bits[idx >> 3] |= mask
+            self._count(idx, 1)
+
+    def add(self, waifu_id):
+        idx = self._index(waifu_id)
+        if idx is not None:
+            self._set(idx)
+
+    def discard(self, waifu_id):
+        idx = self._index(waifu_id)
+        if idx is None:
+            return
+        mask = 1 << (idx & 7)
+        if self.bits[idx >> 3] & mask:
+            self.bits[idx >> 3] &= ~mask
+            self._count(idx, -1)
+
+    @property
+    def unclaimed(self):
+        return len(self.columns.ids) - self.claimed
+
+    def nth_unclaimed(self, nth):
+        """
+        Catalog index of the nth (from 0) unclaimed entry, for 0 <= nth < unclaimed.
+        """
+        block_bits = BLOCK_BYTES * 8
+        block, step = 0, 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            # Tree node block + step covers `step` blocks starting at `block`.
+            node = block + step
+            if node < len(self.tree) and nth >= step * block_bits - self.tree[node]:
+                nth -= step * block_bits - self.tree[node]
+                block = node
+            step >>= 1
+
+        pos = block * BLOCK_BYTES
+        while nth >= 8 - POPCOUNT[self.bits[pos]]:
+            nth -= 8 - POPCOUNT[self.bits[pos]]
+            pos += 1
+
+        byte = self.bits[pos]
+        for bit in range(8):
+            if not byte >> bit & 1:
+                if nth == 0:
+                    return pos * 8 + bit
+                nth -= 1
+        raise IndexError(nth)
+
+
+class ClaimRegistry:
+    """
+    Per-guild ClaimBitmaps, built lazily from purchased_waifu and kept for the
+    `max_guilds` most recently used guilds. The bot updates them as it writes
+    purchased_waifu rows; writes by other processes evict the guild through the
+    invalidation bus. A bitmap is rebuilt against the new catalog after a refresh.
+    Only for displays and unclaimed rolls: buying and trading read ownership from the
+    database, since a bitmap can lag behind another process's write.
+    """
+
+    def __init__(self, waifus=catalog.WAIFUS, max_guilds=config.CLAIM_BITMAP_GUILDS):
+        self.waifus = waifus
+        self.max_guilds = max_guilds
+        self._bitmaps = collections.OrderedDict()  # guild ID -> ClaimBitmap
+        self._loading = collections.defaultdict(list)  # guild ID -> writes seen by each load
+        self.hits = 0
+        self.loads = 0
+
+    def __len__(self):
+        return len(self._bitmaps)
+
+    @property
+    def nbytes(self):
+        return sum(bitmap.nbytes for bitmap in self._bitmaps.values())
+
+    async def get(self, guild_id):
+        columns = self.waifus.columns
+        bitmap = self._bitmaps.get(guild_id)
+        if bitmap is not None and bitmap.columns is columns:
+            self.hits += 1
+            self._bitmaps.move_to_end(guild_id)
+            return bitmap
+
+        fresh = ClaimBitmap(columns)
+        if bitmap is not None:
+            for waifu_id in bitmap:  # Catalog refreshed, remap the claims we have.
+                fresh.add(waifu_id)
+        else:
+            fresh = await self._load(guild_id, fresh)
+        self._bitmaps[guild_id] = fresh
+        self._bitmaps.move_to_end(guild_id)
+        while len(self._bitmaps) > self.max_guilds:
+            self._bitmaps.popitem(last=False)
+        return fresh
+
+    async def _load(self, guild_id, bitmap):
+        start = time.perf_counter()
+        self.loads += 1
+        writes = []  # (add, waifu ID)
+        self._loading[guild_id].append(writes)
+        try:
+            rows = await GUILD_CLAIMS.fetch_all(guild=guild_id)
+        finally:
+            self._loading[guild_id].remove(writes)
+            if not self._loading[guild_id]:
+                del self._loading[guild_id]
+        for row in rows:
+            bitmap.add(row["waifu_id"])
+        # Writes that finished while we were reading may be missing from the rows.
+        for add, waifu_id in writes:
+            (bitmap.add if add else bitmap.discard)(waifu_id)
+        logging.debug(
+            "Loaded %d claims of guild %d in %.2f ms.",
+            len(bitmap),
+            guild_id,
+            (time.perf_counter() - start) * 1000,
+        )
+        return bitmap
+
+    async def is_claimed(self, guild_id, waifu_id):
+        return waifu_id in await self.get(guild_id)
+
+    def _record(self, guild_id, waifu_ids, add):
+        loads = self._loading.get(guild_id, ())
+        bitmap = self._bitmaps.get(guild_id)
+        for waifu_id in waifu_ids:
+            for writes in loads:
+                writes.append((add, waifu_id))
+            if bitmap is not None:
+                (bitmap.add if add else bitmap.discard)(waifu_id)
+
+    def claim(self, guild_id, *waifu_ids):
+        self._record(guild_id, waifu_ids, True)
+
+    def release(self, guild_id, *waifu_ids):
+        self._record(guild_id, waifu_ids, False)
+
+    def evict(self, guild_id):
+        self._bitmaps.pop(guild_id, None)
+
+    def clear(self):
+        self._bitmaps.clear()
+
+
+CLAIMS = ClaimRegistry()
+
+invalidation.BUS.subscribe("claims", CLAIMS.evict, CLAIMS.clear)
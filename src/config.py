@@ -1,4 +1,5 @@
 import os
+import socket
 
 from aiohttp import BasicAuth
 from dotenv import load_dotenv
@@ -24,6 +25,22 @@ if proxy_str:
 
 # Database
 DATABASE_URL = os.environ["DATABASE_URL"]
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")  # None to read everything from the primary.
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))  # seconds
+REPLICA_LAG_CHECK_INTERVAL = int(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "10"))  # seconds
+# Postgres application_name of this process, used to skip our own cache invalidations.
+INSTANCE_NAME = os.getenv("INSTANCE_NAME", f"pinocchio-{socket.gethostname()}-{os.getpid()}")[:63]
+DATABASE_POOL_MIN_SIZE = int(os.getenv("DATABASE_POOL_MIN_SIZE", "5"))
+DATABASE_POOL_MAX_SIZE = int(os.getenv("DATABASE_POOL_MAX_SIZE", "20"))
+DATABASE_ACQUIRE_TIMEOUT = float(os.getenv("DATABASE_ACQUIRE_TIMEOUT", "10"))  # seconds
+MEMBER_SYNC_CHUNK_SIZE = int(os.getenv("MEMBER_SYNC_CHUNK_SIZE", "5000"))
+KNOWN_IDS_PENDING_LIMIT = int(os.getenv("KNOWN_IDS_PENDING_LIMIT", "10000"))
+LEDGER_FLUSH_ROWS = int(os.getenv("LEDGER_FLUSH_ROWS", "500"))
+LEDGER_FLUSH_INTERVAL_MS = int(os.getenv("LEDGER_FLUSH_INTERVAL_MS", "2000"))
+PASSIVE_FLUSH_INTERVAL = int(os.getenv("PASSIVE_FLUSH_INTERVAL", "5"))  # seconds
+ROLL_QUOTA_FLUSH_INTERVAL = int(os.getenv("ROLL_QUOTA_FLUSH_INTERVAL", "5"))  # seconds
+MEMBER_CACHE_SIZE = int(os.getenv("MEMBER_CACHE_SIZE", "50000"))
+MEMBER_CACHE_TTL = int(os.getenv("MEMBER_CACHE_TTL", "300"))  # seconds
 
 # Bot
 SELL_WAIFU_DEPRECIATION = float(os.getenv("SELL_WAIFU_DEPRECIATION", "0.6"))
@@ -37,6 +54,21 @@ DONATOR_TIER_2 = int(os.getenv("DONATOR_TIER_2", "2"))
 DEV_TIER = int(os.getenv("DEV_TIER", "5"))
 ROLL_INTERVAL = int(os.getenv("ROLL_INTERVAL", "10800"))  # seconds
 PRICE_CUT = float(os.getenv("PRICE_CUT", "0.08"))
+ROLL_WEIGHTING = os.getenv("ROLL_WEIGHTING", "uniform")  # uniform or price_band
+# (price ceiling, relative weight) for price_band rolls; pricier waifus are rarer.
+ROLL_PRICE_BANDS = ((1000, 8), (10000, 4), (100000, 2))
+CATALOG_REFRESH_INTERVAL = int(os.getenv("CATALOG_REFRESH_INTERVAL", "3600"))  # seconds
+CATALOG_REFRESH_DELAY = int(os.getenv("CATALOG_REFRESH_DELAY", "5"))  # seconds
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+# String IDs one fuzzy search may count; the most common query trigrams beyond it are skipped.
+SEARCH_MAX_POSTINGS = int(os.getenv("SEARCH_MAX_POSTINGS", "200000"))
+CLAIM_BITMAP_GUILDS = int(os.getenv("CLAIM_BITMAP_GUILDS", "5000"))
+LOCAL_SEARCH = os.getenv("LOCAL_SEARCH", "True").lower() != "false"  # False to search in SQL.
+GUILD_LEADERBOARD_TTL = int(os.getenv("GUILD_LEADERBOARD_TTL", "60"))  # seconds
+GUILD_LEADERBOARD_CACHE_SIZE = int(os.getenv("GUILD_LEADERBOARD_CACHE_SIZE", "1000"))
+PAGINATION_CACHE_PAGES = int(os.getenv("PAGINATION_CACHE_PAGES", "3"))  # per session
+LOCK_TTL = int(os.getenv("LOCK_TTL", "300"))  # seconds before a held lock is presumed leaked
+LOCK_BACKEND = os.getenv("LOCK_BACKEND", "local")  # local, or advisory to lock across processes
 
 # Music
 MUSIC_CACHE_DIR = os.getenv("MUSIC_CACHE_DIR", "./cache/")
@@ -1,10 +1,42 @@
+import array
+import asyncio
+import bisect
+import collections
+import contextlib
+import contextvars
+import datetime
+import itertools
 import logging
+import sys
+import time
+import weakref
 
+import asyncpg
 import sqlalchemy as sa
 from databases import Database
+from databases.core import Connection
+from databases.backends.postgres import PostgresBackend, PostgresConnection
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql.util import find_tables
 
 import errors
-from config import DATABASE_URL
+import metrics
+from config import (
+    DATABASE_ACQUIRE_TIMEOUT,
+    DATABASE_POOL_MAX_SIZE,
+    DATABASE_POOL_MIN_SIZE,
+    DATABASE_URL,
+    INSTANCE_NAME,
+    KNOWN_IDS_PENDING_LIMIT,
+    LEDGER_FLUSH_INTERVAL_MS,
+    LEDGER_FLUSH_ROWS,
+    MEMBER_SYNC_CHUNK_SIZE,
+    PASSIVE_FLUSH_INTERVAL,
+    READ_DATABASE_URL,
+    REPLICA_LAG_CHECK_INTERVAL,
+    REPLICA_MAX_LAG,
+    SELL_WAIFU_DEPRECIATION,
+)
 
 logging.basicConfig(level=logging.INFO)
 
@@ -68,7 +100,142 @@ PurchasedWaifu = sa.Table(
     sa.Column("favorite", sa.Boolean, nullable=False, server_default="f"),
 )
 
-tables = [Member, Guild, Waifu, PurchasedWaifu]
+CoinLedger = sa.Table(
+    "coin_ledger",
+    meta,
+    sa.Column("id", sa.BigInteger, primary_key=True, nullable=False),
+    sa.Column("member", sa.BigInteger, nullable=False, index=True),
+    sa.Column("delta", sa.BigInteger, nullable=False),
+    # opening, daily, hourly, vote, drop, passive, buy, sell, trade, transfer, discoin, dev
+    # or dedupe
+    sa.Column("reason", sa.String(length=16), nullable=False),
+    sa.Column("created_at", sa.DateTime, nullable=False),
+)
+
+# Wallet plus waifu value per member, kept current by the triggers below.
+MemberNetworth = sa.Table(
+    "member_networth",
+    meta,
+    sa.Column(
+        "member_id",
+        sa.BigInteger,
+        sa.ForeignKey("members.id", ondelete="CASCADE"),
+        primary_key=True,
+        nullable=False,
+    ),
+    sa.Column("member", sa.BigInteger, nullable=False),
+    sa.Column("wallet", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("waifu_sum", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("total", sa.BigInteger, nullable=False, server_default="0", index=True),
+)
+
+# Roll token buckets, written back from quota.ROLLS. Rows idle for ROLL_INTERVAL are full.
+RollQuota = sa.Table(
+    "roll_quota",
+    meta,
+    sa.Column("guild", sa.BigInteger, primary_key=True, nullable=False),
+    sa.Column("member", sa.BigInteger, primary_key=True, nullable=False),
+    sa.Column("tokens", sa.Float, nullable=False),
+    sa.Column("updated_at", sa.DateTime, nullable=False, index=True),
+)
+
+tables = [Member, Guild, Waifu, PurchasedWaifu, CoinLedger, MemberNetworth, RollQuota]
+
+INVALIDATION_CHANNEL = "cache_invalidation"
+
+triggers = [
+    """
+CREATE OR REPLACE FUNCTION member_networth_wallet() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO member_networth (member_id, member, wallet, waifu_sum, total)
+    VALUES (NEW.id, NEW.member, NEW.wallet, 0, NEW.wallet)
+    ON CONFLICT (member_id) DO UPDATE
+    SET wallet = EXCLUDED.wallet, total = EXCLUDED.wallet + member_networth.waifu_sum;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+    """,
+    """
+CREATE OR REPLACE FUNCTION member_networth_waifus() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE member_networth
+        SET waifu_sum = waifu_sum - OLD.purchased_for, total = total - OLD.purchased_for
+        WHERE member_id = OLD.member_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE member_networth
+        SET waifu_sum = waifu_sum + NEW.purchased_for, total = total + NEW.purchased_for
+        WHERE member_id = NEW.member_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+    """,
+    "DROP TRIGGER IF EXISTS member_networth_wallet ON members;",
+    """
+CREATE TRIGGER member_networth_wallet AFTER INSERT OR UPDATE OF wallet ON members
+FOR EACH ROW EXECUTE PROCEDURE member_networth_wallet();
+    """,
+    "DROP TRIGGER IF EXISTS member_networth_waifus ON purchased_waifu;",
+    """
+CREATE TRIGGER member_networth_waifus
+AFTER INSERT OR DELETE OR UPDATE OF member_id, purchased_for ON purchased_waifu
+FOR EACH ROW EXECUTE PROCEDURE member_networth_waifus();
+    """,
+    # Cache invalidation: arguments are the entity name and its key column.
+    f"""
+CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS trigger AS $$
+DECLARE
+    changed JSONB;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := to_jsonb(OLD);
+    ELSE
+        changed := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify('{INVALIDATION_CHANNEL}', json_build_object(
+        'entity', TG_ARGV[0],
+        'key', (changed ->> TG_ARGV[1])::BIGINT,
+        'sent_at', extract(epoch FROM clock_timestamp()),
+        'origin', current_setting('application_name')
+    )::TEXT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+    """,
+    "DROP TRIGGER IF EXISTS cache_invalidation ON guild;",
+    """
+CREATE TRIGGER cache_invalidation AFTER UPDATE OR DELETE ON guild
+FOR EACH ROW EXECUTE PROCEDURE notify_cache_invalidation('guild', 'guild');
+    """,
+    "DROP TRIGGER IF EXISTS cache_invalidation ON members;",
+    """
+CREATE TRIGGER cache_invalidation
+AFTER DELETE OR UPDATE OF tier, last_dailies, last_hourlies, last_reward ON members
+FOR EACH ROW EXECUTE PROCEDURE notify_cache_invalidation('member', 'member');
+    """,
+    "DROP TRIGGER IF EXISTS cache_invalidation ON waifu;",
+    """
+CREATE TRIGGER cache_invalidation AFTER INSERT OR UPDATE OR DELETE ON waifu
+FOR EACH ROW EXECUTE PROCEDURE notify_cache_invalidation('waifu', 'id');
+    """,
+    "DROP TRIGGER IF EXISTS cache_invalidation ON purchased_waifu;",
+    """
+CREATE TRIGGER cache_invalidation AFTER INSERT OR UPDATE OF waifu_id, guild OR DELETE
+ON purchased_waifu FOR EACH ROW EXECUTE PROCEDURE notify_cache_invalidation('claims', 'guild');
+    """,
+]
+
+NETWORTH_REBUILD_QUERY = """
+INSERT INTO member_networth (member_id, member, wallet, waifu_sum, total)
+SELECT M.id, M.member, M.wallet, COALESCE(wsum, 0), M.wallet + COALESCE(wsum, 0)
+FROM members M
+LEFT JOIN (select member_id, sum(purchased_for) as wsum from purchased_waifu group by member_id) PW
+ON (M.id = PW.member_id)
+ON CONFLICT (member_id) DO UPDATE
+SET wallet = EXCLUDED.wallet, waifu_sum = EXCLUDED.waifu_sum, total = EXCLUDED.total;
+"""
 
 indexes = [
     sa.Index(
@@ -78,6 +245,19 @@ indexes = [
         PurchasedWaifu.c.waifu_id,
         unique=True,
     ),
+    # Owner lookups (details, buy, randomroll, trade) filter on guild and waifu only.
+    sa.Index(
+        "purchased_waifu_guild_waifu",
+        PurchasedWaifu.c.guild,
+        PurchasedWaifu.c.waifu_id,
+        unique=True,
+    ),
+    # Lets the leaderboards sum purchased_for per member with an index-only scan.
+    sa.Index(
+        "purchased_waifu_member_value",
+        PurchasedWaifu.c.member_id,
+        PurchasedWaifu.c.purchased_for,
+    ),
     # PostgreSQL indexes for better search
     sa.Index(
         "idx_trgm_name",
@@ -93,118 +273,766 @@ indexes = [
     ),
 ]
 
+# Migrations (see migrate.py) that clear the rows a unique index would reject.
+INDEX_MIGRATIONS = {"purchased_waifu_guild_waifu": "dedupe_purchases"}
+
+
+class InstrumentedConnection(PostgresConnection):
+    async def acquire(self):
+        backend = self._database
+        start = time.perf_counter()
+        backend.waiting += 1
+        try:
+            self._connection = await backend._pool.acquire(  # pylint: disable=protected-access
+                timeout=backend.acquire_timeout
+            )
+        finally:
+            backend.waiting -= 1
+            backend.acquire_wait.observe((time.perf_counter() - start) * 1000)
+        backend.in_use += 1
+
+    async def release(self):
+        await super().release()
+        self._database.in_use -= 1
+
+
+class InstrumentedBackend(PostgresBackend):
+    """
+    asyncpg backend that enforces an acquire timeout and tracks pool usage.
+    """
+
+    def __init__(self, database_url, acquire_timeout=None, **options):
+        super().__init__(database_url, **options)
+        self.acquire_timeout = acquire_timeout
+        self.in_use = 0
+        self.waiting = 0
+        self.acquire_wait = metrics.LatencyHistogram()
+
+    def connection(self):
+        return InstrumentedConnection(self, self._dialect)
+
+
+def _statement_site(query):
+    # Latency key for calls that pass no `site`: the statement kind and its tables.
+    if isinstance(query, str):
+        return "sql"
+    names = sorted({table.name for table in find_tables(query, include_crud=True)})
+    return " ".join([query.__visit_name__, *names])
+
+
+class InstrumentedDatabase(Database):
+    """
+    Database with configurable pool limits and per-call-site query latency histograms.
+    Call sites label themselves with `site`; unlabelled calls are keyed by statement.
+    """
+
+    def __init__(self, url, acquire_timeout=None, **options):
+        super().__init__(url, **options)
+        self._backend = InstrumentedBackend(self.url, acquire_timeout, **self.options)
+        self.query_latency = collections.defaultdict(metrics.LatencyHistogram)
+
+    @property
+    def pool(self):
+        return self._backend
+
+    def connection(self):
+        # databases keeps the Connection in a ContextVar, which every task copies from the
+        # code that created it, so one opened before bot.start() would be shared by every
+        # event handler. Keyed by task as well, each task gets a Connection of its own.
+        task = asyncio.current_task()
+        try:
+            owner, connection = self._connection_context.get()
+            if owner() is task:
+                return connection
+        except LookupError:
+            pass
+        connection = Connection(self._backend)
+        self._connection_context.set((weakref.ref(task), connection))
+        return connection
+
+    @contextlib.contextmanager
+    def _timed(self, site):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.query_latency[site].observe((time.perf_counter() - start) * 1000)
+
+    @contextlib.asynccontextmanager
+    async def dedicated_connection(self):
+        """
+        An asyncpg connection acquired from the pool for the caller alone: not the task's
+        Connection, so never inside a transaction some command has open on it.
+        """
+        connection = self._backend.connection()
+        await connection.acquire()
+        try:
+            yield connection.raw_connection
+        finally:
+            await connection.release()
+
+    # The query methods below add a `site` keyword to the databases signatures.
+    # pylint: disable=arguments-differ
+    async def fetch_all(self, query, values=None, site=None):
+        with self._timed(site or _statement_site(query)):
+            return await super().fetch_all(query, values)
+
+    async def fetch_one(self, query, values=None, site=None):
+        with self._timed(site or _statement_site(query)):
+            return await super().fetch_one(query, values)
+
+    async def fetch_val(self, query, values=None, column=0, site=None):
+        with self._timed(site or _statement_site(query)):
+            return await super().fetch_val(query, values, column=column)
+
+    async def execute(self, query, values=None, site=None):
+        with self._timed(site or _statement_site(query)):
+            return await super().execute(query, values)
+
+    async def execute_many(self, query, values, site=None):
+        with self._timed(site or _statement_site(query)):
+            return await super().execute_many(query, values)
+
+    async def fetch_prepared(self, method, site, sql, args):
+        with self._timed(site):
+            async with self.connection() as connection:
+                # The lock databases takes around its own queries on this connection.
+                async with connection._query_lock:  # pylint: disable=protected-access
+                    return await getattr(connection.raw_connection, method)(sql, *args)
+
+
 ENGINE = None
 
 
+def _make_engine(url):
+    return InstrumentedDatabase(
+        url,
+        acquire_timeout=DATABASE_ACQUIRE_TIMEOUT,
+        min_size=DATABASE_POOL_MIN_SIZE,
+        max_size=DATABASE_POOL_MAX_SIZE,
+        server_settings={"application_name": INSTANCE_NAME},
+    )
+
+
 async def prepare_engine():
     global ENGINE
     if ENGINE is None:
-        ENGINE = Database(DATABASE_URL)
+        ENGINE = _make_engine(DATABASE_URL)
         await ENGINE.connect()
     return ENGINE
 
 
+def detached(coroutine):
+    """
+    Run `coroutine` as a task started from an empty context, so the Connection and other
+    context variables it sets are never inherited by tasks the caller creates later.
+    """
+    return contextvars.Context().run(asyncio.ensure_future, coroutine)
+
+
+async def warm_up():
+    # Opens the pool (min_size connections) at boot instead of on the first command.
+    engine = await prepare_engine()
+    await engine.fetch_val(query="SELECT 1", site="warm_up")
+    logging.info(
+        "Database pool ready with %d to %d connections.",
+        DATABASE_POOL_MIN_SIZE,
+        DATABASE_POOL_MAX_SIZE,
+    )
+
+
+# Seconds the replica is behind. NULL while no WAL receiver runs (the primary is gone or
+# streaming broke), as "replayed everything received" then says nothing about the primary;
+# zero while streaming with nothing left to replay, so an idle primary is not lag.
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END;
+"""
+REPLICA_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError)
+
+
+class ReadReplica:
+    """
+    Runs read-only queries on the READ_DATABASE_URL pool. Call sites opt in explicitly;
+    anything that must see its own recent writes keeps using prepare_engine(). Falls back
+    to the primary when no replica is configured, when it errors, or when its replay lag
+    is above REPLICA_MAX_LAG. The lag is re-checked every REPLICA_LAG_CHECK_INTERVAL.
+    """
+
+    def __init__(self, url=READ_DATABASE_URL):
+        self.url = url
+        self.engine = None
+        self.lag = float("inf")  # Unusable until the first check.
+        self.checked_at = float("-inf")
+        self.reads = 0
+        self.fallbacks = 0
+
+    def _mark_unusable(self, err):
+        logging.warning("Read replica unavailable, using the primary: %s", err)
+        self.lag = float("inf")
+        self.checked_at = time.monotonic()
+
+    async def _usable(self):
+        if self.url is None:
+            return False
+        if time.monotonic() - self.checked_at < REPLICA_LAG_CHECK_INTERVAL:
+            return self.lag <= REPLICA_MAX_LAG
+
+        self.checked_at = time.monotonic()  # Concurrent reads use the last result meanwhile.
+        try:
+            if self.engine is None:
+                engine = _make_engine(self.url)
+                await engine.connect()
+                self.engine = engine
+            lag = await self.engine.fetch_val(query=REPLICA_LAG_QUERY, site="replica_lag")
+        except REPLICA_ERRORS as err:
+            self._mark_unusable(err)
+            return False
+        if lag is None:
+            self._mark_unusable("not streaming from the primary")
+        else:
+            self.lag = float(lag)
+        return self.lag <= REPLICA_MAX_LAG
+
+    async def _run(self, method, *args, **kwargs):
+        if await self._usable():
+            try:
+                result = await getattr(self.engine, method)(*args, **kwargs)
+                self.reads += 1
+                return result
+            except REPLICA_ERRORS as err:
+                self._mark_unusable(err)
+        if self.url is not None:
+            self.fallbacks += 1
+        engine = await prepare_engine()
+        return await getattr(engine, method)(*args, **kwargs)
+
+    async def fetch_all(self, query, values=None, site=None):
+        return await self._run("fetch_all", query, values, site=site)
+
+    async def fetch_one(self, query, values=None, site=None):
+        return await self._run("fetch_one", query, values, site=site)
+
+    async def fetch_val(self, query, values=None, site=None):
+        return await self._run("fetch_val", query, values, site=site)
+
+    async def fetch_prepared(self, method, site, sql, args):
+        return await self._run("fetch_prepared", method, site, sql, args)
+
+
+READ_REPLICA = ReadReplica()
+
+
+class PreparedQuery:
+    """
+    A hot query compiled to SQL once at import. It runs straight on the asyncpg connection,
+    which keeps it as a server-side prepared statement, so calls skip SQLAlchemy compilation
+    and the databases row wrapper. Rows are plain asyncpg Records, indexed by column name.
+    """
+
+    dialect = postgresql.dialect(paramstyle="pyformat")
+
+    def __init__(self, name, query, replica=False):
+        compiled = query.compile(dialect=self.dialect)
+        self.name = name
+        self.replica = replica
+        self.params = sorted(compiled.params)
+        self.sql = compiled.string % {p: f"${i}" for i, p in enumerate(self.params, start=1)}
+        PREPARED_QUERIES[name] = self
+
+    def _args(self, values):
+        return [values[param] for param in self.params]
+
+    async def _engine(self):
+        # Read-only statements marked `replica` go through READ_REPLICA.
+        return READ_REPLICA if self.replica else await prepare_engine()
+
+    async def fetch_all(self, **values):
+        engine = await self._engine()
+        return await engine.fetch_prepared("fetch", self.name, self.sql, self._args(values))
+
+    async def fetch_one(self, **values):
+        engine = await self._engine()
+        return await engine.fetch_prepared("fetchrow", self.name, self.sql, self._args(values))
+
+    async def fetch_val(self, **values):
+        engine = await self._engine()
+        return await engine.fetch_prepared("fetchval", self.name, self.sql, self._args(values))
+
+
+PREPARED_QUERIES = {}
+
+MEMBER_WALLET = PreparedQuery(
+    "member_wallet",
+    sa.select([Member.c.wallet]).where(Member.c.member == sa.bindparam("member")),
+)
+WAIFU_OWNER = PreparedQuery(
+    "waifu_owner",
+    PurchasedWaifu.select()
+    .where(PurchasedWaifu.c.guild == sa.bindparam("guild"))
+    .where(PurchasedWaifu.c.waifu_id == sa.bindparam("waifu_id")),
+)
+
+
 def create_index(index, engine):
     conn = engine.connect()
     result = conn.execute(
         f"SELECT exists(SELECT 1 from pg_indexes where indexname = '{index.name}') as ix_exists;",
     ).first()
-    if not result.ix_exists:
+    if result.ix_exists:
+        return
+    try:
         index.create(engine)
+    except sa.exc.IntegrityError:
+        if index.name in INDEX_MIGRATIONS:
+            logging.error(
+                "Cannot create %s over duplicate rows, run `python migrate.py %s` first.",
+                index.name,
+                INDEX_MIGRATIONS[index.name],
+            )
+        raise
 
 
-def prepare_tables():
+def prepare_tables(with_indexes=True):
     # Easier to use sqlalchemy to create tables.
     engine = sa.create_engine(DATABASE_URL)
+    new_ledger = not engine.has_table(CoinLedger.name)
+    new_networth = not engine.has_table(MemberNetworth.name)
     for table in tables:
         table.create(engine, checkfirst=True)
-    for index in indexes:
-        create_index(index, engine)
+    for trigger in triggers:
+        engine.execute(sa.text(trigger))
+    if new_networth:
+        engine.execute(sa.text(NETWORTH_REBUILD_QUERY))
+    if new_ledger:
+        # Open the ledger with the current balances so it can be replayed from day one.
+        engine.execute(
+            CoinLedger.insert(None).from_select(
+                ["member", "delta", "reason", "created_at"],
+                sa.select(
+                    [Member.c.member, Member.c.wallet, sa.literal("opening"), sa.func.now()]
+                ).where(Member.c.wallet != 0),
+            )
+        )
+    if with_indexes:
+        for index in indexes:
+            create_index(index, engine)
 
 
-async def make_member_profile(members_list):
+class SnowflakeRegistry:
+    """
+    Compact set of snowflakes confirmed to exist in a table. The bulk of IDs live in a
+    sorted int64 array; IDs confirmed afterwards go to a small set that is merged into
+    the array once it grows past `pending_limit`.
+    """
+
+    def __init__(self, pending_limit=KNOWN_IDS_PENDING_LIMIT):
+        self.pending_limit = pending_limit
+        self._sorted = array.array("q")
+        self._pending = set()
+
+    def __contains__(self, snowflake):
+        if snowflake in self._pending:
+            return True
+        idx = bisect.bisect_left(self._sorted, snowflake)
+        return idx < len(self._sorted) and self._sorted[idx] == snowflake
+
+    def __len__(self):
+        return len(self._sorted) + len(self._pending)
+
+    @property
+    def nbytes(self):
+        return self._sorted.itemsize * len(self._sorted) + sys.getsizeof(self._pending)
+
+    def load(self, snowflakes):
+        self._sorted = array.array("q", sorted(snowflakes))
+        self._pending = set()
+
+    def update(self, snowflakes):
+        for snowflake in snowflakes:
+            if snowflake not in self:
+                self._pending.add(snowflake)
+        if len(self._pending) > self.pending_limit:
+            self.load(itertools.chain(self._sorted, self._pending))
+
+
+KNOWN_MEMBERS = SnowflakeRegistry()
+KNOWN_GUILDS = SnowflakeRegistry()
+
+
+async def load_known_ids():
     engine = await prepare_engine()
-    create_query_values = []
-    creating_ids = []
+    for registry, column in ((KNOWN_MEMBERS, Member.c.member), (KNOWN_GUILDS, Guild.c.guild)):
+        ids = array.array("q")
+        async for row in engine.iterate(query=sa.select([column])):
+            ids.append(row[0])
+        registry.load(ids)
+        logging.info(
+            "Loaded %d known %s IDs (%.2f KiB).",
+            len(registry),
+            column.table.name,
+            registry.nbytes / 1024,
+        )
+
 
-    for member in members_list:
-        if member.id in creating_ids:
+def unique_ids(objects):
+    # Streams the IDs of discord objects, skipping duplicates (members in many guilds).
+    seen = set()
+    for obj in objects:
+        if obj.id in seen:
             continue
-        exists_query = Member.count(None).where(  # pylint: disable=no-member
-            Member.c.member == member.id
+        seen.add(obj.id)
+        yield obj.id
+
+
+async def bulk_sync(
+    table, column, ids, defaults=None, known=None, chunk_size=MEMBER_SYNC_CHUNK_SIZE
+):
+    """
+    Insert any IDs missing from the table, one INSERT ... ON CONFLICT DO NOTHING per chunk.
+    IDs already in the `known` registry are skipped without touching the database.
+    Returns the total number of rows inserted.
+    """
+    engine = await prepare_engine()
+    defaults = defaults or {}
+    ids = iter(ids)
+    if known is not None:
+        ids = (i for i in ids if i not in known)
+    total_inserted = 0
+
+    for chunk_num in itertools.count(1):
+        chunk = list(itertools.islice(ids, chunk_size))
+        if not chunk:
+            break
+
+        start = time.perf_counter()
+        query = (
+            postgresql.insert(table)
+            .values([{column.name: i, **defaults} for i in chunk])
+            .on_conflict_do_nothing(index_elements=[column])
+            .returning(column)
+        )
+        inserted = len(await engine.fetch_all(query=query, site=f"bulk_sync_{table.name}"))
+        total_inserted += inserted
+        if known is not None:
+            known.update(chunk)
+        logging.info(
+            "Synced %s chunk %d: inserted %d of %d rows in %.2f ms.",
+            table.name,
+            chunk_num,
+            inserted,
+            len(chunk),
+            (time.perf_counter() - start) * 1000,
         )
-        res = await engine.fetch_val(query=exists_query)
 
-        if res == 0:
-            creating_ids.append(member.id)
-            create_query_values.append({"member": member.id, "wallet": 0})
-            logging.debug("Creating profile for member %s.", member.name)
+    return total_inserted
 
-    if len(create_query_values) > 0:
-        create_query = Member.insert(None)
-        await engine.execute_many(query=create_query, values=create_query_values)
+
+async def make_member_profile(members_list):
+    return await bulk_sync(
+        Member, Member.c.member, unique_ids(members_list), {"wallet": 0}, KNOWN_MEMBERS
+    )
 
 
 async def make_guild_entry(guilds_list):
+    return await bulk_sync(Guild, Guild.c.guild, unique_ids(guilds_list), known=KNOWN_GUILDS)
+
+
+async def fetch_wallet(member):
+    wallet = await MEMBER_WALLET.fetch_val(member=member.id)
+    if wallet is None:
+        raise errors.NoneBalance
+    # Passive income still in PASSIVE_INCOME is left out, remove_money cannot spend it yet.
+    return wallet
+
+
+class LedgerWriter:
+    """
+    Buffers coin ledger rows in memory and COPYs them into the table every
+    `max_rows` rows or `interval_ms` milliseconds, whichever comes first.
+    Rows recorded inside transaction() are held back until it commits.
+    """
+
+    def __init__(self, max_rows=LEDGER_FLUSH_ROWS, interval_ms=LEDGER_FLUSH_INTERVAL_MS):
+        self.max_rows = max_rows
+        self.interval = interval_ms / 1000
+        self._pending = []
+        self._deferred = contextvars.ContextVar("ledger_deferred", default=None)
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, member_id, delta, reason):
+        row = (member_id, delta, reason, datetime.datetime.now())
+        deferred = self._deferred.get()
+        if deferred is not None:
+            deferred.append(row)
+            return
+        self._queue([row])
+
+    @contextlib.contextmanager
+    def deferred(self):
+        """
+        Hold back the rows recorded in this block, queue them if it exits cleanly and
+        drop them if it raises. Nested blocks hand their rows to the enclosing one.
+        """
+        outer = self._deferred.get()
+        rows = []
+        token = self._deferred.set(rows)
+        try:
+            yield
+        finally:
+            self._deferred.reset(token)
+        if outer is not None:
+            outer.extend(rows)
+        elif rows:
+            self._queue(rows)
+
+    def _queue(self, rows):
+        self._pending.extend(rows)
+
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = detached(self._run())
+        if len(self._pending) >= self.max_rows:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        engine = await prepare_engine()
+        try:
+            async with engine.dedicated_connection() as connection:
+                await connection.copy_records_to_table(
+                    CoinLedger.name,
+                    records=rows,
+                    columns=["member", "delta", "reason", "created_at"],
+                )
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Failed to flush %d coin ledger rows, retrying later.", len(rows))
+            self._pending[:0] = rows
+
+
+LEDGER = LedgerWriter()
+
+
+@contextlib.asynccontextmanager
+async def transaction():
+    """
+    engine.transaction() for balance changes: their coin ledger rows are only queued once
+    it has committed, so a rollback leaves no rows for money that never moved.
+    """
     engine = await prepare_engine()
-    create_query_values = []
-    creating_ids = []
+    with LEDGER.deferred():
+        async with engine.transaction():
+            yield engine
 
-    for guild in guilds_list:
-        if guild.id in creating_ids:
-            continue
-        exists_query = Guild.count(None).where(  # pylint: disable=no-member
-            Guild.c.guild == guild.id
-        )
-        res = await engine.fetch_val(query=exists_query)
-
-        if res == 0:
-            creating_ids.append(guild.id)
-            create_query_values.append(
-                {
-                    "guild": guild.id,
-                }
+
+class PassiveIncomeBuffer:
+    """
+    Write-behind accumulator for passive income. Credits are summed per member in memory
+    and applied with a single UPDATE every `interval` seconds.
+    """
+
+    def __init__(self, interval=PASSIVE_FLUSH_INTERVAL):
+        self.interval = interval
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self._pending = {}
+        self._task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def credit(self, member, amount):
+        self._pending[member.id] = self._pending.get(member.id, 0) + amount
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+
+        start = time.perf_counter()
+        engine = await prepare_engine()
+        # unnest() keeps the statement text constant, so its prepared plan is reused.
+        query = """
+UPDATE members SET wallet = wallet + v.delta
+FROM unnest(CAST(:members AS BIGINT[]), CAST(:deltas AS BIGINT[])) AS v(member, delta)
+WHERE members.member = v.member
+RETURNING v.member, v.delta;
+        """
+        try:
+            credited = await engine.fetch_all(
+                query=query,
+                values={"members": list(pending.keys()), "deltas": list(pending.values())},
+                site="passive_income_flush",
             )
-        logging.debug("Creating entry for guild %s.", guild.name)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Failed to flush passive income for %d members.", len(pending))
+            for member_id, amount in pending.items():
+                self._pending[member_id] = self._pending.get(member_id, 0) + amount
+            return
 
-    if len(create_query_values) > 0:
-        create_query = Guild.insert(None)
-        await engine.execute_many(query=create_query, values=create_query_values)
+        for row in credited:
+            LEDGER.record(row["member"], row["delta"], "passive")
+        self.flushes += 1
+        self.last_flush_ms = (time.perf_counter() - start) * 1000
 
 
-async def fetch_wallet(member):
+PASSIVE_INCOME = PassiveIncomeBuffer()
+
+
+async def verify_ledger(limit=10):
+    """
+    Rebuild every wallet from the coin ledger and diff it against members.wallet.
+    Returns the number of mismatched members and the `limit` largest mismatches.
+    """
+    await LEDGER.flush()
     engine = await prepare_engine()
-    fetch_query = Member.select().where(Member.c.member == member.id)
-    resp = await engine.fetch_one(query=fetch_query)
-    if resp is None:
-        raise errors.NoneBalance
+    query = """
+SELECT M.member, M.wallet, COALESCE(L.total, 0) AS ledger_wallet
+FROM members M LEFT JOIN (
+SELECT member, sum(delta) AS total FROM coin_ledger GROUP BY member) L ON (M.member = L.member)
+WHERE M.wallet <> COALESCE(L.total, 0)
+ORDER BY abs(M.wallet - COALESCE(L.total, 0)) DESC;
+    """
+    mismatches = await engine.fetch_all(query=query, site="verify_ledger")
+    return len(mismatches), mismatches[:limit]
+
+
+async def rebuild_networth():
+    engine = await prepare_engine()
+    async with engine.transaction():
+        # Block writers so the rebuilt totals match the tables exactly.
+        await engine.execute(
+            query="LOCK TABLE members, purchased_waifu IN SHARE MODE;", site="rebuild_networth"
+        )
+        await engine.execute(query=NETWORTH_REBUILD_QUERY, site="rebuild_networth")
+
 
-    return resp[Member.c.wallet]
+async def check_networth(limit=10):
+    """
+    Compare member_networth against totals computed from members and purchased_waifu.
+    Returns the number of inconsistent members and the first `limit` of them.
+    """
+    engine = await prepare_engine()
+    query = """
+SELECT M.member, N.total AS networth_total, M.wallet + COALESCE(wsum, 0) AS actual_total
+FROM members M
+LEFT JOIN member_networth N ON (M.id = N.member_id)
+LEFT JOIN (select member_id, sum(purchased_for) as wsum from purchased_waifu group by member_id) PW
+ON (M.id = PW.member_id)
+WHERE N.total IS DISTINCT FROM M.wallet + COALESCE(wsum, 0)
+OR N.wallet IS DISTINCT FROM M.wallet;
+    """
+    mismatches = await engine.fetch_all(query=query, site="check_networth")
+    return len(mismatches), mismatches[:limit]
 
 
-async def add_money(member, amount):
+async def add_money(member, amount, reason):
     amount = abs(amount)
-    current_balance = await fetch_wallet(member)
     engine = await prepare_engine()
     update_query = (
         Member.update(None)
         .where(Member.c.member == member.id)
         .values(wallet=Member.c.wallet + amount)
+        .returning(Member.c.wallet)
     )
-    await engine.execute(update_query)
-    return current_balance + amount
+    balance = await engine.fetch_val(query=update_query, site="add_money")
+    if balance is None:
+        raise errors.NoneBalance
+    LEDGER.record(member.id, amount, reason)
+    return balance
 
 
-async def remove_money(member, amount):
+async def remove_money(member, amount, reason):
     amount = abs(amount)
-    current_balance = await fetch_wallet(member)
-    if current_balance - amount < 0:
-        raise errors.NotEnoughBalance
     engine = await prepare_engine()
     update_query = (
         Member.update(None)
         .where(Member.c.member == member.id)
+        .where(Member.c.wallet >= amount)
         .values(wallet=Member.c.wallet - amount)
+        .returning(Member.c.wallet)
+    )
+    balance = await engine.fetch_val(query=update_query, site="remove_money")
+    if balance is None:
+        await fetch_wallet(member)  # Raises NoneBalance if there is no profile at all.
+        raise errors.NotEnoughBalance
+    LEDGER.record(member.id, -amount, reason)
+    return balance
+
+
+async def transfer_money(sender, receiver, amount, reason):
+    async with transaction():
+        balance = await remove_money(sender, amount, reason)
+        await add_money(receiver, amount, reason)
+    return balance
+
+
+async def sell_waifus(member, guild_id, purchase_ids):
+    """
+    Delete the member's purchases with these IDs and pay back SELL_WAIFU_DEPRECIATION of
+    what they cost, in one transaction. Only the rows the DELETE returns are paid for, so
+    a waifu sold or traded away in the meantime earns nothing. Returns the deleted rows
+    (waifu_id and purchased_for) and the payout.
+    """
+    query = (
+        PurchasedWaifu.delete(None)
+        .where(PurchasedWaifu.c.id.in_(purchase_ids))
+        .where(PurchasedWaifu.c.guild == guild_id)
+        .where(PurchasedWaifu.c.member == member.id)
+        .returning(PurchasedWaifu.c.waifu_id, PurchasedWaifu.c.purchased_for)
+    )
+    async with transaction() as engine:
+        sold = await engine.fetch_all(query=query, site="sell_waifus")
+        payout = int(sum(row["purchased_for"] for row in sold) * SELL_WAIFU_DEPRECIATION)
+        if payout:
+            await add_money(member, payout, "sell")
+    return sold, payout
+
+
+async def buy_waifu(member, member_id, guild_id, waifu_id, price):
+    """
+    Give the waifu to the member and charge them `price`, in one transaction. The insert
+    goes first and backs off if anyone in the guild owns the waifu already, so nobody is
+    charged for a waifu they did not get. Returns the new balance, or None if it was taken.
+    """
+    query = (
+        postgresql.insert(PurchasedWaifu)
+        .values(
+            member_id=member_id,
+            waifu_id=waifu_id,
+            guild=guild_id,
+            member=member.id,
+            purchased_for=price,
+        )
+        .on_conflict_do_nothing()
+        .returning(PurchasedWaifu.c.id)
     )
-    await engine.execute(update_query)
-    return current_balance - amount
+    async with transaction() as engine:
+        if await engine.fetch_val(query=query, site="buy_waifu") is None:
+            return None
+        return await remove_money(member, price, "buy")
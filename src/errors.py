@@ -9,6 +9,10 @@ class NotEnoughBalance(Exception):
     pass
 
 
+class WaifuNotOwned(Exception):
+    pass
+
+
 class LockedCommand(commands.CheckFailure):
     pass
 
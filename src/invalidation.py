@@ -0,0 +1,94 @@
+import asyncio
+import collections
+import json
+import logging
+import time
+
+import asyncpg
+
+import config
+import database
+import metrics
+
+RECONNECT_DELAY = 5  # seconds
+
+
+class InvalidationBus:  # pylint: disable=too-many-instance-attributes
+    """
+    Cross-process cache invalidation over Postgres LISTEN/NOTIFY. The cache_invalidation
+    triggers NOTIFY an (entity, key) payload whenever a cached row changes, whoever changed
+    it; every process LISTENs on a dedicated connection and evicts the matching entries.
+    Notifications sent by this process are skipped, its caches are already written through.
+    """
+
+    def __init__(self, channel=database.INVALIDATION_CHANNEL):
+        self.channel = channel
+        self._subscribers = collections.defaultdict(list)  # entity -> [(evict, clear)]
+        self._task = None
+        self._connection = None
+        self.listening = False
+        self.received = 0
+        self.skipped = 0
+        # Trigger commit to eviction, by the database clock against ours.
+        self.lag = metrics.LatencyHistogram()
+
+    def subscribe(self, entity, evict, clear):
+        # evict(key) drops one entry; clear() drops everything after a missed window.
+        self._subscribers[entity].append((evict, clear))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.listening = False
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    async def _run(self):
+        first_connect = True
+        while True:
+            try:
+                self._connection = await asyncpg.connect(
+                    config.DATABASE_URL,
+                    server_settings={"application_name": f"{config.INSTANCE_NAME}-listener"},
+                )
+            except (OSError, asyncpg.PostgresError):
+                logging.exception("Could not connect the cache invalidation listener.")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            closed = asyncio.Event()
+            self._connection.add_termination_listener(lambda _conn: closed.set())
+            await self._connection.add_listener(self.channel, self._on_notify)
+            if not first_connect:
+                # Anything may have changed while we were not listening.
+                for subscribers in self._subscribers.values():
+                    for _evict, clear in subscribers:
+                        clear()
+            first_connect = False
+            self.listening = True
+            logging.info("Listening for cache invalidations on %s.", self.channel)
+
+            await closed.wait()
+            self.listening = False
+            logging.warning("Cache invalidation listener disconnected, reconnecting.")
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def _on_notify(self, _connection, _pid, _channel, payload):
+        message = json.loads(payload)
+        self.received += 1
+        if message["origin"] == config.INSTANCE_NAME:
+            self.skipped += 1
+            return
+
+        self.lag.observe(max(time.time() - message["sent_at"], 0) * 1000)
+        for evict, _clear in self._subscribers[message["entity"]]:
+            evict(message["key"])
+
+
+BUS = InvalidationBus()
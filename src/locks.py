@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import logging
+import time
+
+import asyncpg
+
+import config
+
+
+class AdvisoryBackend:
+    """
+    Postgres session advisory locks taken on one dedicated connection, so a lock is held
+    exactly as long as we keep it (or until the connection drops). Calls are serialized,
+    asyncpg connections run one query at a time.
+    """
+
+    def __init__(self):
+        self._connection = None
+        self._mutex = None
+
+    @staticmethod
+    def lock_id(name):
+        digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big", signed=True)
+
+    async def _query(self, sql, lock_id):
+        if self._mutex is None:
+            self._mutex = asyncio.Lock()
+        async with self._mutex:
+            if self._connection is None or self._connection.is_closed():
+                self._connection = await asyncpg.connect(
+                    config.DATABASE_URL,
+                    server_settings={"application_name": f"{config.INSTANCE_NAME}-locks"},
+                )
+            return await self._connection.fetchval(sql, lock_id)
+
+    async def try_lock(self, name):
+        # Fails closed: without the database nothing says another process is not holding it.
+        try:
+            return await self._query("SELECT pg_try_advisory_lock($1);", self.lock_id(name))
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+            logging.exception("Could not take advisory lock %s, treating it as held.", name)
+            return False
+
+    async def unlock(self, name):
+        try:
+            await self._query("SELECT pg_advisory_unlock($1);", self.lock_id(name))
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+            logging.exception("Could not release advisory lock %s.", name)
+
+    async def close(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+
+ADVISORY = AdvisoryBackend()
+
+
+class _Entry:  # pylint: disable=too-few-public-methods
+    __slots__ = ("lock", "owner", "acquired_at", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.owner = None
+        self.acquired_at = 0.0
+        self.refs = 0  # Holder plus waiters; the entry is dropped when this reaches 0.
+
+
+class LockManager:
+    """
+    Per-key asyncio locks that remember who holds them. A key only has an entry while
+    someone holds or waits for it, so idle keys take no memory. A lock held for longer
+    than `ttl` seconds is presumed leaked and handed to the next acquirer. With the
+    "advisory" backend a held lock is also a Postgres advisory lock, which covers every
+    process sharing the database; the advisory part is always a try, never a wait, and
+    is not acquired when the database cannot be reached.
+    """
+
+    def __init__(self, namespace, ttl=config.LOCK_TTL, backend=config.LOCK_BACKEND):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.advisory = ADVISORY if backend == "advisory" else None
+        self._entries = {}
+        self.acquired = 0
+        self.contended = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def held(self):
+        return sum(1 for entry in self._entries.values() if entry.lock.locked())
+
+    async def acquire(self, key, owner, wait=False):
+        """
+        Lock `key` for `owner`. Returns False right away if it is held and `wait` is not
+        set, or if another process holds the advisory lock.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+        if entry.lock.locked() and time.monotonic() - entry.acquired_at > self.ttl:
+            logging.warning("Lock %s:%s held by %s expired.", self.namespace, key, entry.owner)
+            self.expired += 1
+            await self._release(key, entry)
+            entry = self._entries.setdefault(key, entry)
+        if entry.lock.locked():
+            self.contended += 1
+            if not wait:
+                return False
+
+        entry.refs += 1
+        try:
+            await entry.lock.acquire()
+        except asyncio.CancelledError:
+            self._unref(key, entry)
+            raise
+        entry.owner = owner
+        entry.acquired_at = time.monotonic()
+
+        if self.advisory is not None and not await self.advisory.try_lock(
+            f"{self.namespace}:{key}"
+        ):
+            self.contended += 1
+            entry.owner = None
+            entry.lock.release()
+            self._unref(key, entry)
+            return False
+        self.acquired += 1
+        return True
+
+    async def release(self, key, owner):
+        entry = self._entries.get(key)
+        if entry is not None and entry.lock.locked() and entry.owner == owner:
+            await self._release(key, entry)
+
+    async def _release(self, key, entry):
+        if self.advisory is not None:
+            await self.advisory.unlock(f"{self.namespace}:{key}")
+        entry.owner = None
+        entry.lock.release()
+        self._unref(key, entry)
+
+    def _unref(self, key, entry):
+        entry.refs -= 1
+        if entry.refs == 0 and self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def summary(self):
+        return (
+            f"{self.held:,} held, {len(self):,} keys, {self.acquired:,} acquired, "
+            f"{self.contended:,} contended, {self.expired:,} expired"
+        )
+
+
+COMMANDS = LockManager("command")
+PURCHASES = LockManager("buy")
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import signal
 
 import config
 import modules
@@ -17,8 +18,12 @@ if __name__ == "__main__":
         logging.basicConfig(level=logging.DEBUG)
 
     loop = asyncio.get_event_loop()
+    # docker stop sends SIGTERM; closing the bot makes main() return so buffers get flushed.
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, lambda: asyncio.ensure_future(modules.bot.close()))
 
     try:
         loop.run_until_complete(main())
-    except KeyboardInterrupt:
+    finally:
+        loop.run_until_complete(modules.before_stop())
         loop.close()
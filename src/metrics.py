@@ -0,0 +1,41 @@
+import bisect
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram in milliseconds. Percentiles are reported as the
+    upper bound of the bucket they fall in.
+    """
+
+    BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, elapsed_ms):
+        self.counts[bisect.bisect_left(self.BUCKETS_MS, elapsed_ms)] += 1
+        self.total += 1
+        self.sum_ms += elapsed_ms
+
+    @property
+    def mean(self):
+        return self.sum_ms / self.total if self.total else 0.0
+
+    def percentile(self, pct):
+        if self.total == 0:
+            return 0.0
+        rank = self.total * pct / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.BUCKETS_MS[i] if i < len(self.BUCKETS_MS) else float("inf")
+        return float("inf")
+
+    def summary(self):
+        return (
+            f"n={self.total:,}, avg {self.mean:.02f} ms, "
+            f"p50 ≤{self.percentile(50):g} ms, p95 ≤{self.percentile(95):g} ms"
+        )
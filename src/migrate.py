@@ -0,0 +1,73 @@
+"""
+One-off data migrations, run by hand when a startup step refuses to go on without them:
+
+    cd src && python migrate.py <name>
+
+Each runs in one transaction and logs every row it changes.
+"""
+
+import logging
+import sys
+
+import sqlalchemy as sa
+
+import database
+
+# Keeps the first purchase of each waifu in a guild; later ones are deleted and refunded.
+DEDUPE_PURCHASES_QUERY = """
+WITH removed AS (
+    DELETE FROM purchased_waifu P USING purchased_waifu K
+    WHERE P.guild = K.guild AND P.waifu_id = K.waifu_id AND P.id > K.id
+    RETURNING P.guild, P.waifu_id, P.member, P.purchased_for
+), refunds AS (
+    UPDATE members M SET wallet = wallet + R.total
+    FROM (SELECT member, sum(purchased_for) AS total FROM removed GROUP BY member) R
+    WHERE M.member = R.member
+    RETURNING M.member, R.total
+), ledger AS (
+    INSERT INTO coin_ledger (member, delta, reason, created_at)
+    SELECT member, total, 'dedupe', now() FROM refunds
+)
+SELECT guild, waifu_id, member, purchased_for FROM removed ORDER BY guild, waifu_id;
+"""
+
+
+def dedupe_purchases(engine):
+    """
+    Clears the way for the unique purchased_waifu_guild_waifu index, which duplicate
+    purchases from before the buy transaction block. Returns the removed purchases.
+    """
+    with engine.begin() as conn:
+        removed = conn.execute(sa.text(DEDUPE_PURCHASES_QUERY)).fetchall()
+    for row in removed:
+        logging.warning(
+            "Removed the purchase of waifu %d in guild %d by %d, refunded %d.",
+            row.waifu_id,
+            row.guild,
+            row.member,
+            row.purchased_for,
+        )
+    logging.info("Removed %d duplicate purchases.", len(removed))
+    return removed
+
+
+MIGRATIONS = {
+    "dedupe_purchases": dedupe_purchases,
+}
+
+
+def main(names):
+    unknown = [name for name in names if name not in MIGRATIONS]
+    if not names or unknown:
+        sys.exit(f"Usage: python migrate.py {' | '.join(MIGRATIONS)}")
+
+    # Tables, triggers and ledger as at startup, but not the indexes the migrations unblock.
+    database.prepare_tables(with_indexes=False)
+    engine = sa.create_engine(database.DATABASE_URL)
+    for name in names:
+        logging.info("Running migration %s.", name)
+        MIGRATIONS[name](engine)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
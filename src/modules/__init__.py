@@ -5,9 +5,17 @@ import discord
 from discoin import Client as Discoin
 from discord.ext import commands
 
+import cache
+import catalog
+import claims
 import config
 import database
 import errors
+import invalidation
+import locks
+import quota
+import trigram
+import waiters
 
 from . import handlers
 from .admin import AdminCommands
@@ -35,19 +43,38 @@ bot = commands.AutoShardedBot(
 )
 
 bot.discoin_client = None
+waiters.WAITERS.attach(bot)
 
 
 async def before_start():
     # Actions to execute before bot starts.
     database.prepare_tables()
+    # Boot queries run in tasks of their own; see database.detached.
+    await database.detached(database.warm_up())
+    await database.detached(database.load_known_ids())
+    await database.detached(catalog.WAIFUS.load())
+    catalog.WAIFUS.start()
+    await trigram.WAIFU_INDEX.rebuild()
+    invalidation.BUS.start()
+    quota.ROLL_QUOTA.start()
     if config.DISCOIN_TOKEN:
         bot.discoin_client = Discoin(config.DISCOIN_TOKEN, config.DISCOIN_SELF_CURRENCY)
 
 
+async def before_stop():
+    # Actions to execute after the bot stops.
+    await invalidation.BUS.stop()
+    await quota.ROLL_QUOTA.flush()
+    await database.PASSIVE_INCOME.flush()
+    await database.LEDGER.flush()
+    await locks.ADVISORY.close()
+
+
 @bot.event
 async def on_ready():
     logging.info("Logged in as %s - %s.", bot.user, bot.user.id)
     await database.make_guild_entry(bot.guilds)
+    await cache.GUILD_SETTINGS.load()
     await database.make_member_profile(bot.get_all_members())
     logging.info("All done, bot is ready to go!")
 
@@ -70,6 +97,12 @@ async def on_guild_join(guild):
     await database.make_member_profile(guild.members)
 
 
+@bot.event
+async def on_guild_remove(guild):
+    cache.GUILD_SETTINGS.evict(guild.id)
+    claims.CLAIMS.evict(guild.id)
+
+
 @bot.event
 async def on_command_error(ctx, error):
     # This prevents any commands with local handlers being handled here in on_command_error.
@@ -5,6 +5,8 @@ import discord
 import sqlalchemy as sa
 from discord.ext import commands
 
+import cache
+import claims
 import database
 import utils
 
@@ -58,13 +60,10 @@ class AdminCommands(commands.Cog, name="Admin"):
     async def get_settings(self, ctx, setting: str):
         setting = setting.lower().strip()
 
-        engine = await database.prepare_engine()
-
-        query = database.Guild.select().where(database.Guild.c.guild == ctx.guild.id)
-        db_guild = await engine.fetch_one(query=query)
+        db_guild = await cache.GUILD_SETTINGS.get(ctx.guild.id)
 
         if setting == "wlchannel":
-            wlchannel = db_guild[database.Guild.c.join_leave_channel]
+            wlchannel = db_guild["join_leave_channel"]
             wlchannel = ctx.guild.get_channel(wlchannel) if wlchannel is not None else None
             wlchannel = wlchannel.mention if wlchannel is not None else "`Disabled`"
             return await ctx.send(
@@ -72,15 +71,15 @@ class AdminCommands(commands.Cog, name="Admin"):
             )
 
         if setting == "welcometext":
-            text = db_guild[database.Guild.c.welcome_str] or "`Disabled`"
+            text = db_guild["welcome_str"] or "`Disabled`"
             return await ctx.send(f"Current welcome text: {text}")
 
         if setting == "leavetext":
-            text = db_guild[database.Guild.c.leave_str] or "`Disabled`"
+            text = db_guild["leave_str"] or "`Disabled`"
             return await ctx.send(f"Current leave text: {text}")
 
         if setting == "coindrops":
-            text = "`Enabled`" if db_guild[database.Guild.c.coin_drops] else "`Disabled`"
+            text = "`Enabled`" if db_guild["coin_drops"] else "`Disabled`"
             return await ctx.send(f"Coin drop status: {text}")
 
         return await ctx.send("Setting not found!")
@@ -93,31 +92,28 @@ class AdminCommands(commands.Cog, name="Admin"):
     ):
         setting = setting.lower().strip()
 
-        engine = await database.prepare_engine()
-        query = database.Guild.update(None).where(database.Guild.c.guild == ctx.guild.id)
-
         if setting == "wlchannel":
             if not isinstance(value, discord.TextChannel):
                 return await ctx.send("Invalid value! Enter a channel.")
-            await engine.execute(query=query, values={"join_leave_channel": value.id})
+            await cache.GUILD_SETTINGS.set(ctx.guild.id, join_leave_channel=value.id)
             return await ctx.send(f"Welcome/leave channel set to {value.mention}")
 
         if setting == "welcometext":
             if not isinstance(value, str):
                 return await ctx.send("Invalid value! Enter text.")
-            await engine.execute(query=query, values={"welcome_str": value})
+            await cache.GUILD_SETTINGS.set(ctx.guild.id, welcome_str=value)
             return await ctx.send(f"Welcome text set to {value}")
 
         if setting == "leavetext":
             if not isinstance(value, str):
                 return await ctx.send("Invalid value! Enter text.")
-            await engine.execute(query=query, values={"leave_str": value})
+            await cache.GUILD_SETTINGS.set(ctx.guild.id, leave_str=value)
             return await ctx.send(f"Leave text set to {value}")
 
         if setting == "coindrops":
             if not isinstance(value, bool):
                 return await ctx.send("Invalid value! Enter yes or no.")
-            await engine.execute(query=query, values={"coin_drops": value})
+            await cache.GUILD_SETTINGS.set(ctx.guild.id, coin_drops=value)
             return await ctx.send(f"Coin drops set to {value}")
 
         return await ctx.send("Setting not found!")
@@ -149,17 +145,22 @@ class AdminCommands(commands.Cog, name="Admin"):
         query = sa.select([sa.distinct(database.PurchasedWaifu.c.member)]).where(
             database.PurchasedWaifu.c.guild == ctx.guild.id
         )
-        waifu_owners = await engine.fetch_all(query)
+        waifu_owners = await engine.fetch_all(query, site="rescue_owners")
 
-        query = database.PurchasedWaifu.delete(None).where(
-            database.PurchasedWaifu.c.guild == ctx.guild.id
+        query = (
+            database.PurchasedWaifu.delete(None)
+            .where(database.PurchasedWaifu.c.guild == ctx.guild.id)
+            .returning(database.PurchasedWaifu.c.waifu_id)
         )
 
         all_member_ids = {i[database.PurchasedWaifu.c.member] for i in waifu_owners}
         for member_id in all_member_ids:
             if ctx.guild.get_member(member_id) is not None:
                 continue  # User still in guild
-            await engine.execute(query=query.where(database.PurchasedWaifu.c.member == member_id))
+            rescued = await engine.fetch_all(
+                query=query.where(database.PurchasedWaifu.c.member == member_id), site="rescue"
+            )
+            claims.CLAIMS.release(ctx.guild.id, *(row["waifu_id"] for row in rescued))
 
         await ctx.send(":skull_crossbones: Removed waifus from everyone who left the server!")
 
@@ -197,13 +198,16 @@ class AdminCommands(commands.Cog, name="Admin"):
 
         engine = await database.prepare_engine()
 
-        query = database.PurchasedWaifu.delete(None).where(
-            database.PurchasedWaifu.c.guild == ctx.guild.id
+        query = (
+            database.PurchasedWaifu.delete(None)
+            .where(database.PurchasedWaifu.c.guild == ctx.guild.id)
+            .returning(database.PurchasedWaifu.c.waifu_id)
         )
         if isinstance(who, discord.Member):
             query = query.where(database.PurchasedWaifu.c.member == who.id)
 
-        await engine.execute(query=query)
+        divorced = await engine.fetch_all(query=query, site="divorce")
+        claims.CLAIMS.release(ctx.guild.id, *(row["waifu_id"] for row in divorced))
 
         if isinstance(who, discord.Member):
             await ctx.send(f":skull_crossbones: Removed waifus from {who}!")
@@ -118,22 +118,22 @@ class AnimeCommands(commands.Cog, name="Anime"):
                 f"\nStatus: **{status}** | Score: **{anime['score']}**"
             )
 
-        pages = utils.smart_chunks(sentences, 1980)
+        pages = utils.page_bounds([len(sentence) for sentence in sentences], 1980)
         total_pages = len(pages)
 
         embed = discord.Embed(
             title=f"{mal_username}'s Anime List",
             color=ctx.author.color,
-            description="\n".join(pages[0]),
         )
         embed.add_field(name="Total Anime", value=len(animelist))
-        embed.set_footer(text=f"Page: {1}/{total_pages}")
 
-        async def modifier_func(page_num, **kwargs):
-            embed.description = "\n".join(pages[page_num])
-            embed.set_footer(text=f"Page: {page_num+1}/{total_pages}")
+        async def render_page(page_num):
+            page = embed.copy()
+            page.description = "\n".join(sentences[slice(*pages[page_num])])
+            page.set_footer(text=f"Page: {page_num+1}/{total_pages}")
+            return page
 
-        await utils.paginate_embed(ctx, embed, len(pages), modifier_func)
+        await utils.paginate_embed(ctx, total_pages, render_page)
 
     @commands.command(name="mymangalist", aliases=["mangalist", "mml"])
     @utils.typing_indicator()
@@ -166,22 +166,22 @@ class AnimeCommands(commands.Cog, name="Anime"):
                 f"\nStatus: **{status}** | Score: **{manga['score']}**"
             )
 
-        pages = utils.smart_chunks(sentences, 1980)
+        pages = utils.page_bounds([len(sentence) for sentence in sentences], 1980)
         total_pages = len(pages)
 
         embed = discord.Embed(
             title=f"{mal_username}'s Manga List",
             color=ctx.author.color,
-            description="\n".join(pages[0]),
         )
         embed.add_field(name="Total Manga", value=len(mangalist))
-        embed.set_footer(text=f"Page: {1}/{total_pages}")
 
-        async def modifier_func(page_num, **kwargs):
-            embed.description = "\n".join(pages[page_num])
-            embed.set_footer(text=f"Page: {page_num+1}/{total_pages}")
+        async def render_page(page_num):
+            page = embed.copy()
+            page.description = "\n".join(sentences[slice(*pages[page_num])])
+            page.set_footer(text=f"Page: {page_num+1}/{total_pages}")
+            return page
 
-        await utils.paginate_embed(ctx, embed, len(pages), modifier_func)
+        await utils.paginate_embed(ctx, total_pages, render_page)
 
     @commands.command(name="malprofile", aliases=["profile"])
     @utils.typing_indicator()
@@ -10,10 +10,12 @@ import discord
 from discoin import DiscoinError
 from discord.ext import commands
 
+import cache
 import config
 import database
 import errors
 import utils
+import waiters
 
 
 class CurrencyCommands(commands.Cog, name="Financial"):
@@ -44,14 +46,12 @@ class CurrencyCommands(commands.Cog, name="Financial"):
         """
         Get your daily money and become riiiich.
         """
-        engine = await database.prepare_engine()
-        fetch_query = database.Member.select().where(database.Member.c.member == ctx.author.id)
-        db_member = await engine.fetch_one(fetch_query)
+        db_member = await cache.MEMBER_PROFILES.get(ctx.author.id)
 
-        last_dailies = db_member[database.Member.c.last_dailies]
+        last_dailies = db_member["last_dailies"]
         if last_dailies is not None:
             last_dailies = datetime.datetime.fromisoformat(str(last_dailies))
-        member_tier = db_member[database.Member.c.tier]
+        member_tier = db_member["tier"]
 
         now = datetime.datetime.now()
         if last_dailies is not None and (now - last_dailies).days < 1:
@@ -61,12 +61,7 @@ class CurrencyCommands(commands.Cog, name="Financial"):
 
             return await ctx.send(f"Please wait for {next_reset} more to get dailies.")
 
-        update_query = (
-            database.Member.update(None)
-            .where(database.Member.c.member == ctx.author.id)
-            .values(last_dailies=now)
-        )
-        await engine.execute(update_query)
+        await cache.MEMBER_PROFILES.set(ctx.author.id, last_dailies=now)
 
         amount = config.DAILIES_AMOUNT
         jackpot = ""
@@ -80,20 +75,20 @@ class CurrencyCommands(commands.Cog, name="Financial"):
 
         if member_tier >= config.DONATOR_TIER_2:
             amount *= 4
-            await database.add_money(ctx.author, amount)
+            await database.add_money(ctx.author, amount, "daily")
             await ctx.send(
                 f"{jackpot}Recieved {amount} <:PIC:668725298388271105>! "
                 "4 times the usual amount for being a Tier 2 donator! <:uwu:575372762583924757>"
             )
         elif member_tier >= config.DONATOR_TIER_1:
             amount *= 2
-            await database.add_money(ctx.author, amount)
+            await database.add_money(ctx.author, amount, "daily")
             await ctx.send(
                 f"{jackpot}Recieved {amount} <:PIC:668725298388271105>! "
                 "Twice the usual amount for being a Tier 1 donator! <:uwu:575372762583924757>"
             )
         else:
-            await database.add_money(ctx.author, amount)
+            await database.add_money(ctx.author, amount, "daily")
             await ctx.send(
                 f"{jackpot}Recieved {amount} <:PIC:668725298388271105>! "
                 "<:SataniaThumb:575384688714317824>"
@@ -105,14 +100,12 @@ class CurrencyCommands(commands.Cog, name="Financial"):
         """
         Get your hourly money and become riiiicher. Only for donators.
         """
-        engine = await database.prepare_engine()
-        fetch_query = database.Member.select().where(database.Member.c.member == ctx.author.id)
-        db_member = await engine.fetch_one(fetch_query)
+        db_member = await cache.MEMBER_PROFILES.get(ctx.author.id)
 
-        last_hourlies = db_member[database.Member.c.last_hourlies]
+        last_hourlies = db_member["last_hourlies"]
         if last_hourlies is not None:
             last_hourlies = datetime.datetime.fromisoformat(str(last_hourlies))
-        member_tier = db_member[database.Member.c.tier]
+        member_tier = db_member["tier"]
 
         now = datetime.datetime.now()
         if last_hourlies is not None and (now - last_hourlies).total_seconds() < 3600:
@@ -122,24 +115,19 @@ class CurrencyCommands(commands.Cog, name="Financial"):
 
             return await ctx.send(f"Please wait for {next_reset} to get hourlies.")
 
-        update_query = (
-            database.Member.update(None)
-            .where(database.Member.c.member == ctx.author.id)
-            .values(last_hourlies=now)
-        )
-        await engine.execute(update_query)
+        await cache.MEMBER_PROFILES.set(ctx.author.id, last_hourlies=now)
 
         amount = config.HOURLIES_AMOUNT
 
         if member_tier >= config.DONATOR_TIER_2:
             amount *= 2
-            await database.add_money(ctx.author, amount)
+            await database.add_money(ctx.author, amount, "hourly")
             await ctx.send(
                 f"Recieved {amount} <:PIC:668725298388271105>! "
                 "2 times the usual amount for being a Tier 2 donator! <:uwu:575372762583924757>"
             )
         elif member_tier >= config.DONATOR_TIER_1:
-            await database.add_money(ctx.author, amount)
+            await database.add_money(ctx.author, amount, "hourly")
             await ctx.send(f"Recieved {amount} <:PIC:668725298388271105>!")
 
     @commands.command(
@@ -150,14 +138,11 @@ class CurrencyCommands(commands.Cog, name="Financial"):
     @commands.cooldown(rate=59, per=60)
     @utils.typing_indicator()
     async def claim_vote_rewards(self, ctx):
-        engine = await database.prepare_engine()
-
         headers = {"Authorization": config.DBL_TOKEN}
 
-        query = database.Member.select().where(database.Member.c.member == ctx.author.id)
-        member = await engine.fetch_one(query=query)
-        member_tier = member[database.Member.c.tier]
-        last_reward = member[database.Member.c.last_reward]
+        member = await cache.MEMBER_PROFILES.get(ctx.author.id)
+        member_tier = member["tier"]
+        last_reward = member["last_reward"]
         already_claimed = (last_reward is not None) and (
             (datetime.datetime.now() - last_reward).total_seconds() < 3600 * 12
         )
@@ -201,13 +186,8 @@ class CurrencyCommands(commands.Cog, name="Financial"):
                 "You get 2 times the usual amount for being a tier 1 donator! "
                 "<:AilunaHug:575373643551473665>"
             )
-        update_query = (
-            database.Member.update(None)
-            .where(database.Member.c.member == ctx.author.id)
-            .values(last_reward=datetime.datetime.now())
-        )
-        await engine.execute(update_query)
-        await database.add_money(ctx.author, coins)
+        await cache.MEMBER_PROFILES.set(ctx.author.id, last_reward=datetime.datetime.now())
+        await database.add_money(ctx.author, coins, "vote")
 
         msgtxts.append(f"{ctx.author} has got {coins} coins. <:SataniaThumb:575384688714317824>")
         await ctx.send("\n".join(msgtxts))
@@ -224,8 +204,7 @@ class CurrencyCommands(commands.Cog, name="Financial"):
             return await ctx.send("Cannot send to yourself!")
 
         try:
-            await database.remove_money(ctx.author, amount)
-            await database.add_money(user, amount)
+            await database.transfer_money(ctx.author, user, amount, "transfer")
             await ctx.send("Done <:SataniaThumb:575384688714317824>")
         except errors.NotEnoughBalance:
             await ctx.send("You do not have enough money to transfer! <:smug:575373306715439151>")
@@ -238,7 +217,7 @@ class CurrencyCommands(commands.Cog, name="Financial"):
         """
         currency = currency.upper()
         try:
-            await database.remove_money(ctx.author, amount)
+            await database.remove_money(ctx.author, amount, "discoin")
             transaction = await ctx.bot.discoin_client.create_transaction(
                 currency, amount, ctx.author.id
             )
@@ -309,7 +288,6 @@ where `currency` is the receiving bot's currency name.
     @commands.Cog.listener("on_message")
     async def passive_money_generator(self, message: discord.Message):
         user = message.author
-        bot = self.bot
 
         if user.bot or message.guild is None:
             return
@@ -319,7 +297,7 @@ where `currency` is the receiving bot's currency name.
         last = self.passive_money_users.setdefault(user.id, now)
         if now - last > 60:
             self.passive_money_users[user.id] = now
-            await database.add_money(user, random.randint(1, 5))
+            database.PASSIVE_INCOME.credit(user, random.randint(1, 5))
 
         _n = config.FREE_MONEY_SPAWN_LIMIT
         _e = self.free_money_channels.setdefault(message.channel.id, random.randint(1, _n))
@@ -327,12 +305,9 @@ where `currency` is the receiving bot's currency name.
             return
         self.free_money_channels[message.channel.id] = random.randint(1, _n)
 
-        engine = await database.prepare_engine()
+        db_guild = await cache.GUILD_SETTINGS.get(message.guild.id)
 
-        query = database.Guild.select().where(database.Guild.c.guild == message.guild.id)
-        db_guild = await engine.fetch_one(query=query)
-
-        coin_drops_enabled = db_guild[database.Guild.c.coin_drops]
+        coin_drops_enabled = db_guild["coin_drops"]
         if not coin_drops_enabled:
             return
 
@@ -346,19 +321,19 @@ where `currency` is the receiving bot's currency name.
         )
 
         def check(_m):
-            return (
-                _m.channel == message.channel and not _m.author.bot and _m.content == coin_message
-            )
+            return not _m.author.bot and _m.content == coin_message
 
         try:
-            msg = await bot.wait_for("message", check=check, timeout=20)
+            msg = await waiters.WAITERS.wait_for_message(
+                message.channel.id, check=check, timeout=20
+            )
         except asyncio.TimeoutError:
             fail_msg = await message.channel.send("Error: Timeout")
             await asyncio.sleep(3)
             await message.channel.delete_messages([drop_msg, fail_msg])
             return
 
-        await database.add_money(msg.author, amount)
+        await database.add_money(msg.author, amount, "drop")
         gain_msg = await message.channel.send(
             f"User {msg.author.mention} has gained {amount} <:PIC:668725298388271105>!"
         )
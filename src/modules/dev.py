@@ -6,8 +6,17 @@ import discord
 import psutil
 from discord.ext import commands
 
+import cache
+import catalog
+import claims
 import config
 import database
+import invalidation
+import locks
+import quota
+import trigram
+import utils
+import waiters
 from utils import check_tier_matches
 
 process = psutil.Process()
@@ -56,6 +65,41 @@ class DevCommands(commands.Cog, name="Developer"):
             name="Bot Uptime",
             value=str(timedelta(seconds=int(time.time() - process.create_time()))),
         )
+        engine = await database.prepare_engine()
+        # One line per subsystem, within the 25 field limit; dbstats has the full numbers.
+        internals = [
+            f"Write-behind: {len(database.PASSIVE_INCOME):,} passive credits, "
+            f"{len(database.LEDGER):,} ledger rows queued",
+            f"DB pool: {engine.pool.in_use}/{config.DATABASE_POOL_MAX_SIZE} in use, "
+            f"acquire p95 ≤{engine.pool.acquire_wait.percentile(95):g} ms",
+            f"Guild settings cache: {cache.GUILD_SETTINGS.hits:,} hits, "
+            f"{cache.GUILD_SETTINGS.misses:,} misses",
+            f"Member profile cache: {cache.MEMBER_PROFILES.hits:,} hits, "
+            f"{cache.MEMBER_PROFILES.misses:,} misses",
+            f"Invalidations: {invalidation.BUS.received:,} received, "
+            f"lag p95 ≤{invalidation.BUS.lag.percentile(95):g} ms",
+            f"Read replica: {database.READ_REPLICA.reads:,} reads, "
+            f"{database.READ_REPLICA.fallbacks:,} fallbacks",
+            f"Waifu catalog: {len(catalog.WAIFUS):,} waifus",
+            "Searches: "
+            + (
+                ", ".join(f"{tier} {n:,}" for tier, n in trigram.WAIFU_INDEX.tiers.most_common())
+                or "none yet"
+            ),
+            f"Search cache: {trigram.SEARCH_CACHE.hit_rate:.01%} hit rate",
+            f"Claim bitmaps: {len(claims.CLAIMS):,} guilds, "
+            f"{claims.CLAIMS.nbytes / 1048576:.02f} MB",
+            f"Roll quotas: {len(quota.ROLL_QUOTA):,} buckets, "
+            f"{quota.ROLL_QUOTA.dirty:,} unflushed",
+            f"Locks held: {locks.COMMANDS.held:,} command, {locks.PURCHASES.held:,} buy",
+            f"Paginations: {len(utils.PAGINATIONS):,} active",
+            f"Waiters: {len(waiters.WAITERS):,} pending",
+        ]
+        embed.add_field(
+            name="Internals",
+            inline=False,
+            value="\n".join(internals) + f"\nMore with `{ctx.prefix}dbstats`",
+        )
 
         embed.add_field(name="**__Links__**", inline=False, value="\u200b")
         embed.add_field(
@@ -87,6 +131,126 @@ class DevCommands(commands.Cog, name="Developer"):
         )
         await ctx.send(embed=embed)
 
+    @commands.command(name="dbstats")
+    async def view_db_stats(self, ctx):
+        """
+        Database pool, cache, queue and lock metrics.
+        """
+        embed = discord.Embed(title="Database Stats", color=ctx.author.color)
+
+        engine = await database.prepare_engine()
+        slowest_sites = sorted(
+            engine.query_latency.items(), key=lambda x: x[1].percentile(95), reverse=True
+        )[:5]
+
+        embed.add_field(
+            name="Connection Pool",
+            value=(
+                f"{engine.pool.in_use}/{config.DATABASE_POOL_MAX_SIZE} in use, "
+                f"{engine.pool.waiting} waiting"
+            ),
+        )
+        embed.add_field(name="Pool Acquire Wait", value=engine.pool.acquire_wait.summary())
+        replica = database.READ_REPLICA
+        embed.add_field(
+            name="Read Replica",
+            value=(
+                f"{replica.reads:,} reads, {replica.fallbacks:,} fallbacks, "
+                f"lag {replica.lag:.02f} s"
+                if replica.url is not None
+                else "Not configured"
+            ),
+        )
+        embed.add_field(
+            name="Slowest Query Sites (p95)",
+            inline=False,
+            value="\n".join(f"`{site}`: {hist.summary()}" for site, hist in slowest_sites)
+            or "No queries yet.",
+        )
+        embed.add_field(
+            name="Passive Income Queue",
+            value=(
+                f"{len(database.PASSIVE_INCOME):,} members, "
+                f"last flush {database.PASSIVE_INCOME.last_flush_ms:.02f} ms"
+            ),
+        )
+        embed.add_field(name="Coin Ledger Queue", value=f"{len(database.LEDGER):,} rows")
+        embed.add_field(
+            name="Guild Settings Cache",
+            value=(
+                f"{len(cache.GUILD_SETTINGS):,} guilds, "
+                f"{cache.GUILD_SETTINGS.hits:,} hits, {cache.GUILD_SETTINGS.misses:,} misses"
+            ),
+        )
+        embed.add_field(
+            name="Member Profile Cache",
+            value=(
+                f"{len(cache.MEMBER_PROFILES):,}/{cache.MEMBER_PROFILES.max_size:,} members, "
+                f"{cache.MEMBER_PROFILES.hits:,} hits, {cache.MEMBER_PROFILES.misses:,} misses"
+            ),
+        )
+        embed.add_field(
+            name="Waifu Catalog",
+            value=(
+                f"{len(catalog.WAIFUS):,} waifus, "
+                f"{catalog.WAIFUS.bytes_per_100k() / 1048576:.02f} MB per 100k"
+            ),
+        )
+        search_tiers = trigram.WAIFU_INDEX.tiers.most_common()
+        embed.add_field(
+            name="Waifu Search Tiers",
+            value=", ".join(f"{tier} {count:,}" for tier, count in search_tiers)
+            or "No searches yet.",
+        )
+        embed.add_field(
+            name="Search Result Cache",
+            value=(
+                f"{len(trigram.SEARCH_CACHE):,} queries, "
+                f"{trigram.SEARCH_CACHE.hit_rate:.01%} hit rate, "
+                f"{trigram.SEARCH_CACHE.bytes_per_entry():.0f} B per entry"
+            ),
+        )
+        embed.add_field(
+            name="Paginations",
+            value=(
+                f"{len(utils.PAGINATIONS):,} active, "
+                f"{sum(len(pages) for pages in utils.PAGINATIONS):,} cached pages, "
+                f"{sum(pages.nbytes for pages in utils.PAGINATIONS) / 1024:.01f} KB"
+            ),
+        )
+        embed.add_field(
+            name="Waiters",
+            value=(
+                f"{len(waiters.WAITERS):,} pending, "
+                f"{waiters.WAITERS.checks_per_event:.02f} checks per event"
+            ),
+        )
+        embed.add_field(name="Command Locks", value=locks.COMMANDS.summary())
+        embed.add_field(name="Buy Locks", value=locks.PURCHASES.summary())
+        embed.add_field(
+            name="Roll Quotas",
+            value=(
+                f"{len(quota.ROLL_QUOTA):,} buckets, {quota.ROLL_QUOTA.dirty:,} unflushed, "
+                f"{quota.ROLL_QUOTA.flushes:,} flushes, {quota.ROLL_QUOTA.expired:,} expired"
+            ),
+        )
+        embed.add_field(
+            name="Claim Bitmaps",
+            value=(
+                f"{len(claims.CLAIMS):,} guilds, {claims.CLAIMS.nbytes / 1048576:.02f} MB, "
+                f"{claims.CLAIMS.hits:,} hits, {claims.CLAIMS.loads:,} loads"
+            ),
+        )
+        embed.add_field(
+            name="Cache Invalidations",
+            value=(
+                f"{invalidation.BUS.received:,} received, {invalidation.BUS.skipped:,} own, "
+                f"lag {invalidation.BUS.lag.summary()}"
+            ),
+        )
+
+        await ctx.send(embed=embed)
+
     @commands.command(name="ping")
     async def ping(self, ctx):
         """
@@ -101,7 +265,7 @@ class DevCommands(commands.Cog, name="Developer"):
         Only for developer to use.
         """
         amount = int(amount)
-        balance = await database.add_money(ctx.author, amount)
+        balance = await database.add_money(ctx.author, amount, "dev")
         await ctx.send(f"Gave `{amount}` coins. You now have `{balance}` coins in your wallet.")
 
     @commands.command(name="removemoney", hidden=True)
@@ -114,11 +278,58 @@ class DevCommands(commands.Cog, name="Developer"):
             user = self.bot.get_user(user)
 
         amount = int(amount)
-        balance = await database.remove_money(user, amount)
+        balance = await database.remove_money(user, amount, "dev")
         await ctx.send(
             f"Removed `{amount}` coins. {user} now has `{balance}` coins in their wallet."
         )
 
+    @commands.command(name="verifyledger", hidden=True)
+    @commands.check(check_tier_matches(5))
+    async def verify_ledger(self, ctx):
+        """
+        Rebuild wallets from the coin ledger and diff them against the stored wallets. Dev only.
+        """
+        total, mismatches = await database.verify_ledger()
+        if total == 0:
+            return await ctx.send("All wallets match the coin ledger. :thumbsup:")
+
+        lines = [
+            f"{i['member']}: wallet {i['wallet']}, ledger {i['ledger_wallet']}" for i in mismatches
+        ]
+        await ctx.send(
+            f"{total} wallets do not match the coin ledger! Largest differences:\n"
+            "```" + "\n".join(lines) + "```"
+        )
+
+    @commands.command(name="rebuildnetworth", hidden=True)
+    @commands.check(check_tier_matches(5))
+    async def rebuild_networth(self, ctx):
+        """
+        Recompute the net worth table used by the world leaderboard. Dev only.
+        """
+        await database.rebuild_networth()
+        await ctx.send("Rebuilt the net worth table. :thumbsup:")
+
+    @commands.command(name="checknetworth", hidden=True)
+    @commands.check(check_tier_matches(5))
+    async def check_networth(self, ctx):
+        """
+        Check the net worth table against wallets and harems. Dev only.
+        """
+        total, mismatches = await database.check_networth()
+        if total == 0:
+            return await ctx.send("The net worth table is consistent. :thumbsup:")
+
+        lines = [
+            f"{i['member']}: stored {i['networth_total']}, actual {i['actual_total']}"
+            for i in mismatches
+        ]
+        await ctx.send(
+            f"{total} members have a wrong net worth! "
+            f"Run `{ctx.prefix}rebuildnetworth` to fix them.\n"
+            "```" + "\n".join(lines) + "```"
+        )
+
     @commands.command(name="awhois", hidden=True)
     @commands.check(check_tier_matches(5))
     async def whois_admin(self, ctx, user: typing.Union[discord.Member, str]):
@@ -134,7 +345,7 @@ SELECT member from members
                 """
 
                 found = False
-                results = await engine.fetch_all(query=query)
+                results = await engine.fetch_all(query=query, site="awhois_members")
                 for result in results:
                     member = self.bot.get_user(result["member"])
                     if str(member) == user:
@@ -150,7 +361,7 @@ SELECT member from members
             return await ctx.send("User not found!")
 
         query = database.Member.select().where(database.Member.c.member == user.id)
-        dbuser = await engine.fetch_one(query=query)
+        dbuser = await engine.fetch_one(query=query, site="awhois")
 
         last_dailies = dbuser[database.Member.c.last_dailies]
         if last_dailies:
@@ -1,7 +1,10 @@
+import collections
 import datetime
+import time
 import typing
 
 import discord
+import sqlalchemy as sa
 from discord.ext import commands
 
 import config
@@ -9,9 +12,26 @@ import database
 import utils
 
 
+GUILD_LEADERBOARD = database.PreparedQuery(
+    "guild_leaderboard",
+    sa.text(
+        """
+SELECT id,M.member,tier,COALESCE(wsum,0) as waifu_sum,wallet,(COALESCE(wsum, 0)+wallet) as total
+FROM members M LEFT JOIN (
+SELECT member_id,sum(purchased_for) as wsum FROM purchased_waifu
+WHERE guild = :guild GROUP BY member_id) PW ON (M.id = PW.member_id)
+WHERE (wallet > 0 OR COALESCE(wsum, 0) > 0) AND M.member = ANY(CAST(:members AS BIGINT[]))
+ORDER BY total DESC LIMIT 10;
+        """
+    ),
+    replica=True,
+)
+
+
 class GeneralCommands(commands.Cog, name="General"):
     def __init__(self, bot):
         self.bot = bot
+        self.guild_leaderboards = collections.OrderedDict()  # guild ID -> (expiry, results)
 
     @commands.command(name="donate")
     async def donate(self, ctx):
@@ -182,16 +202,13 @@ class GeneralCommands(commands.Cog, name="General"):
         """
         View the world's leaderboard
         """
-        engine = await database.prepare_engine()
         query = """
-SELECT id,M.member,tier,COALESCE(wsum,0) as waifu_sum,wallet,(COALESCE(wsum, 0)+wallet) as total
-FROM members M
-LEFT JOIN (select member_id, sum(purchased_for) as wsum from purchased_waifu group by member_id) PW
-ON (M.id = PW.member_id)
-WHERE wallet > 0 OR COALESCE(wsum, 0) > 0
+SELECT member_id as id,member,wallet,waifu_sum,total
+FROM member_networth
+WHERE total > 0
 ORDER BY total DESC LIMIT 50;
         """
-        results = await engine.fetch_all(query=query)
+        results = await database.READ_REPLICA.fetch_all(query=query, site="world_leaderboard")
         txt = generate_leaderboard_text(ctx.bot, results)
         embed = discord.Embed(
             title=":trophy: World Leaderboards",
@@ -215,17 +232,7 @@ ORDER BY total DESC LIMIT 50;
         """
         View this guild's leaderboard
         """
-        engine = await database.prepare_engine()
-        mlist = tuple([m.id for m in ctx.guild.members])
-        query = f"""
-SELECT id,M.member,tier,COALESCE(wsum,0) as waifu_sum,wallet,(COALESCE(wsum, 0)+wallet) as total
-FROM members M LEFT JOIN (
-SELECT member_id,sum(purchased_for) as wsum FROM purchased_waifu
-WHERE guild = {ctx.guild.id} GROUP BY member_id) PW ON (M.id = PW.member_id)
-WHERE (wallet > 0 OR COALESCE(wsum, 0) > 0) AND M.member in {mlist}
-ORDER BY total DESC LIMIT 10;
-        """
-        results = await engine.fetch_all(query=query)
+        results = await self.fetch_guild_leaderboard(ctx.guild)
         txt = generate_leaderboard_text(ctx.bot, results)
         embed = discord.Embed(
             title=":trophy: Guild Leaderboards",
@@ -243,6 +250,26 @@ ORDER BY total DESC LIMIT 10;
         )
         await ctx.send(embed=embed)
 
+    async def fetch_guild_leaderboard(self, guild):
+        # LRU with expiry like cache.MemberProfileCache: expired entries are replaced when
+        # asked for again, and the least recently used go once the cache is full.
+        entry = self.guild_leaderboards.get(guild.id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.guild_leaderboards.move_to_end(guild.id)
+            return entry[1]
+
+        results = await GUILD_LEADERBOARD.fetch_all(
+            guild=guild.id, members=[m.id for m in guild.members]
+        )
+        self.guild_leaderboards[guild.id] = (
+            time.monotonic() + config.GUILD_LEADERBOARD_TTL,
+            results,
+        )
+        self.guild_leaderboards.move_to_end(guild.id)
+        while len(self.guild_leaderboards) > config.GUILD_LEADERBOARD_CACHE_SIZE:
+            self.guild_leaderboards.popitem(last=False)
+        return results
+
 
 def generate_leaderboard_text(client, results):
     rtxt = []
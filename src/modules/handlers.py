@@ -5,6 +5,7 @@ import discord
 from discord.ext import commands, tasks
 from PIL import Image, ImageDraw, ImageFont
 
+import cache
 import database
 
 
@@ -31,7 +32,7 @@ class TasksCog(commands.Cog):
             transaction = await self.bot.discoin_client.handle_transaction(i.id)
             user = self.bot.get_user(int(transaction.user_id))
 
-            await database.add_money(user, round(transaction.payout))
+            await database.add_money(user, round(transaction.payout), "discoin")
 
             embed = discord.Embed(
                 title=(
@@ -96,13 +97,10 @@ async def make_join_leave_image(image_url, header, subtitle):
 
 
 async def send_on_member_join(member):
-    engine = await database.prepare_engine()
+    db_guild = await cache.GUILD_SETTINGS.get(member.guild.id)
 
-    query = database.Guild.select().where(database.Guild.c.guild == member.guild.id)
-    db_guild = await engine.fetch_one(query=query)
-
-    channel = member.guild.get_channel(db_guild[database.Guild.c.join_leave_channel])
-    welcome_str = db_guild[database.Guild.c.welcome_str]
+    channel = member.guild.get_channel(db_guild["join_leave_channel"])
+    welcome_str = db_guild["welcome_str"]
     if channel is None or welcome_str is None:
         return
 
@@ -115,13 +113,10 @@ async def send_on_member_join(member):
 
 
 async def send_on_member_leave(member):
-    engine = await database.prepare_engine()
-
-    query = database.Guild.select().where(database.Guild.c.guild == member.guild.id)
-    db_guild = await engine.fetch_one(query=query)
+    db_guild = await cache.GUILD_SETTINGS.get(member.guild.id)
 
-    channel = member.guild.get_channel(db_guild[database.Guild.c.join_leave_channel])
-    leave_str = db_guild[database.Guild.c.leave_str]
+    channel = member.guild.get_channel(db_guild["join_leave_channel"])
+    leave_str = db_guild["leave_str"]
     if channel is None or leave_str is None:
         return
 
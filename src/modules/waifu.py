@@ -7,30 +7,28 @@ import discord
 import sqlalchemy as sa
 from discord.ext import commands
 
+import cache
+import catalog
+import claims
 import config
 import database
 import errors
+import locks
+import quota
+import sampler
+import trigram
 import utils
-from database import add_money
-
-BUY_LOCK = []
-LOCKS_MAP = {}
+import waiters
 
 
 async def lock_command(ctx):
-    global LOCKS_MAP
-    key = f"{ctx.guild.id}:{ctx.author.id}"
-    if LOCKS_MAP.get(key) is not None:
+    if not await locks.COMMANDS.acquire(f"{ctx.guild.id}:{ctx.author.id}", ctx.message.id):
         raise errors.LockedCommand
-    LOCKS_MAP[key] = ctx.message.id
     return True
 
 
 async def unlock_command(ctx):
-    global LOCKS_MAP
-    key = f"{ctx.guild.id}:{ctx.author.id}"
-    if LOCKS_MAP.get(key) == ctx.message.id:
-        LOCKS_MAP[key] = None
+    await locks.COMMANDS.release(f"{ctx.guild.id}:{ctx.author.id}", ctx.message.id)
 
 
 class WaifuCommands(commands.Cog, name="Waifu"):
@@ -40,7 +38,6 @@ class WaifuCommands(commands.Cog, name="Waifu"):
             "m": "husbando",
             "f": "waifu",
         }
-        self.random_waifu_counter = {}
 
     @commands.command("search")
     @commands.guild_only()
@@ -48,10 +45,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         """
         Search for a waifu in the Dungeon of Waifus. Don't get lost!
         """
-        engine = await database.prepare_engine()
-
-        query = generate_search_query(search_str)
-        waifus = await engine.fetch_all(query=query)
+        waifus = await search_waifus(search_str)
 
         if len(waifus) == 0:
             return await ctx.send(
@@ -59,34 +53,28 @@ class WaifuCommands(commands.Cog, name="Waifu"):
                 "please join the support server! (`=support`) <a:thanks:699004469610020964>"
             )
 
-        pages = []
-        resp_string = ""
-        for row in waifus:
-            resp_string += (
+        def search_line(row):
+            return (
                 f"**{row['name']}**: ID is {row['id']}, from *{row['from_anime']}*. "
                 f"Costs **{row['price']:,}** <:PIC:668725298388271105>\n"
             )
-            if len(resp_string) > 1900:
-                pages.append(resp_string)
-                resp_string = ""
-        if resp_string != "":
-            pages.append(resp_string)
+
+        pages = utils.page_bounds([len(search_line(row)) for row in waifus], 1900)
 
         embed = discord.Embed(
             title=f"{len(waifus)} Waifus Found in the Dungeon!\n",
-            description=pages[0],
             color=ctx.author.color,
         )
         embed.set_footer(text=f"To view details, do {ctx.prefix}details <name/id>")
 
-        if len(pages) > 1:
-            embed.add_field(name="Page Number", value=f"1/{len(pages)}")
+        async def render_page(page_num):
+            page = embed.copy()
+            page.description = "".join(map(search_line, waifus[slice(*pages[page_num])]))
+            if len(pages) > 1:
+                page.add_field(name="Page Number", value=f"{page_num+1}/{len(pages)}")
+            return page
 
-        async def modifier_func(page_num, **kwargs):
-            embed.description = pages[page_num]
-            embed.set_field_at(index=0, name="Page Number", value=f"{page_num+1}/{len(pages)}")
-
-        await utils.paginate_embed(ctx, embed, len(pages), modifier_func)
+        await utils.paginate_embed(ctx, len(pages), render_page)
 
     @commands.command("details")
     @commands.guild_only()
@@ -94,33 +82,29 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         """
         Get details (and pictures) of a waifu! (But don't lewd them)
         """
-        engine = await database.prepare_engine()
-
-        query = generate_search_query(search_str, limit=1)
-        waifu = await engine.fetch_one(query=query)
+        waifu = await search_waifu(search_str)
         if waifu is None:
             return await ctx.send(
                 "Waifu not found! You can add the waifu yourself, please join "
                 "the support server! (`=support`) <a:thanks:699004469610020964>"
             )
 
-        query = (
-            database.PurchasedWaifu.select()
-            .where(database.PurchasedWaifu.c.waifu_id == waifu["id"])
-            .where(database.PurchasedWaifu.c.guild == ctx.guild.id)
-        )
-        db_owner = await engine.fetch_one(query=query)
+        db_owner = None
+        if await claims.CLAIMS.is_claimed(ctx.guild.id, waifu["id"]):
+            db_owner = await database.WAIFU_OWNER.fetch_one(
+                guild=ctx.guild.id, waifu_id=waifu["id"]
+            )
         has_owner = db_owner is not None
         owner = None
         purchased_for = 0
         if has_owner:
             try:
-                owner = ctx.guild.get_member(
-                    db_owner[database.PurchasedWaifu.c.member]
-                ) or await ctx.guild.fetch_member(db_owner[database.PurchasedWaifu.c.member])
+                owner = ctx.guild.get_member(db_owner["member"]) or await ctx.guild.fetch_member(
+                    db_owner["member"]
+                )
             except discord.NotFound:
                 owner = None
-            purchased_for = db_owner[database.PurchasedWaifu.c.purchased_for]
+            purchased_for = db_owner["purchased_for"]
 
         waifu = {
             "id": waifu["id"],
@@ -144,7 +128,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
             ] += f"\n\nYou need {waifu['price']} <:PIC:668725298388271105> to buy them."
         else:
             if owner is not None:
-                rstatus = "deep" if db_owner[database.PurchasedWaifu.c.favorite] else "casual"
+                rstatus = "deep" if db_owner["favorite"] else "casual"
                 waifu["desc"] += (
                     f"\n\nThey are already in a {rstatus} " f"relationship with {str(owner)}."
                 )
@@ -163,18 +147,13 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         images = []
         if waifu["image_url"] is not None:
             images = waifu["image_url"].split(",")
-            embed.set_image(url=images[0])
 
         embed.add_field(name="From", value=waifu["anime"], inline=False)
         embed.add_field(name="Cost", value=f"{waifu['price']:,} <:PIC:668725298388271105>")
         embed.add_field(name="ID", value=waifu["id"])
         embed.add_field(name="Gender", value=waifu["gender"])
-        image_field_id = 4
-        if owner and db_owner[database.PurchasedWaifu.c.favorite]:
+        if owner and db_owner["favorite"]:
             embed.add_field(name="Favorite", value="Purchaser's favorite waifu :heart:")
-            image_field_id += 1
-        if len(images) > 1:
-            embed.add_field(name="Image", inline=False, value=f"**Showing: 1/{len(images)}**")
         if has_owner:
             if owner is not None:
                 embed.set_footer(
@@ -184,16 +163,17 @@ class WaifuCommands(commands.Cog, name="Waifu"):
             else:
                 embed.set_footer(text=f"Purchased by someone who left for {purchased_for} PIC.")
 
-        async def modifier_func(page_num, **kwargs):
-            embed.set_image(url=images[page_num])
-            embed.set_field_at(
-                index=image_field_id,
-                name="Image",
-                inline=False,
-                value=f"**Showing: {page_num+1}/{len(images)}**",
-            )
+        async def render_page(page_num):
+            page = embed.copy()
+            if images:
+                page.set_image(url=images[page_num])
+            if len(images) > 1:
+                page.add_field(
+                    name="Image", inline=False, value=f"**Showing: {page_num+1}/{len(images)}**"
+                )
+            return page
 
-        await utils.paginate_embed(ctx, embed, len(images), modifier_func)
+        await utils.paginate_embed(ctx, len(images), render_page)
 
     @commands.command(name="favorite", aliases=["favourite"])
     @commands.guild_only()
@@ -223,66 +203,47 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         """
         user = user or ctx.author
 
-        engine = await database.prepare_engine()
-
-        query = (
-            database.PurchasedWaifu.select()
-            .where(database.PurchasedWaifu.c.member == user.id)
-            .where(database.PurchasedWaifu.c.guild == ctx.guild.id)
-        )
-        purchased_waifus = await engine.fetch_all(query=query)
-        if len(purchased_waifus) == 0:
+        harem = HaremQuery(ctx.guild.id, user.id, filter_opts)
+        totals = await harem.totals()
+        if totals["owned"] == 0:
             return await ctx.send(f"{user} does not have a harem. What a lonely life!")
-
-        waifu_ids = [x[database.PurchasedWaifu.c.waifu_id] for x in purchased_waifus]
-        query = database.Waifu.select().where(database.Waifu.c.id.in_(waifu_ids))
-        resp = await engine.fetch_all(query=query)
-        waifu_data = {x[database.Waifu.c.id]: x for x in resp}
-
-        purchased_waifus = filter_harem(purchased_waifus, waifu_data, filter_opts)
-
-        if len(purchased_waifus) == 0:
+        if totals["matched"] == 0:
             return await ctx.send("No harem found for specified filters.")
 
-        pages = []
-        _n = 0
-        n_each_page = 10
-        for i in range(0, len(purchased_waifus), n_each_page):
-            pages.append(
-                [(_n + m + 1, j) for m, j in enumerate(purchased_waifus[i : i + n_each_page])]
-            )
-            _n += n_each_page
+        total_pages = -(-totals["matched"] // HAREM_PAGE_SIZE)
+        cursors = [None]  # Keyset cursor each visited page starts after.
 
         embed = discord.Embed(
             title=f"{user.name}'s Harem",
             color=user.color,
-            description=prepare_harem_page(pages[0], waifu_data),
         )
 
-        embed.add_field(name="Waifus Inside Locker", value=len(purchased_waifus))
+        embed.add_field(name="Waifus Inside Locker", value=totals["matched"])
         embed.add_field(
             name="Net Harem Value",
-            value=str(sum([i[database.PurchasedWaifu.c.purchased_for] for i in purchased_waifus]))
-            + " <:PIC:668725298388271105>",
+            value=f"{totals['value']} <:PIC:668725298388271105>",
         )
         embed.add_field(
             name="\u200b",
             inline=False,
             value=f"To view details, do `{ctx.prefix}details <name/id>`",
         )
-        embed.set_footer(
-            text=f"{user} • Page {1}/{len(pages)}",
-            icon_url=user.avatar_url_as(size=128),
-        )
 
-        async def modifier_func(page_num, **kwargs):
-            embed.description = prepare_harem_page(pages[page_num], waifu_data)
-            embed.set_footer(
-                text=f"{user} • Page {page_num + 1}/{len(pages)}",
+        async def render_page(page_num):
+            rows = await harem.page(after=cursors[page_num])
+            if page_num + 1 == len(cursors) and rows:
+                cursors.append(harem.cursor(rows[-1]))
+            page = embed.copy()
+            page.description = prepare_harem_page(
+                enumerate(rows, start=page_num * HAREM_PAGE_SIZE + 1)
+            )
+            page.set_footer(
+                text=f"{user} • Page {page_num + 1}/{total_pages}",
                 icon_url=user.avatar_url_as(size=128),
             )
+            return page
 
-        await utils.paginate_embed(ctx, embed, len(pages), modifier_func)
+        await utils.paginate_embed(ctx, total_pages, render_page)
 
     @commands.command(name="buy")
     @commands.guild_only()
@@ -292,30 +253,24 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         Buy your own waifu to prove your love for her!
         (P.S: The waifus have consented. No trafficked waifus, promise!)
         """
-        global BUY_LOCK
-        engine = await database.prepare_engine()
-
-        query = generate_search_query(search_str, limit=1)
-        waifu = await engine.fetch_one(query=query)
+        waifu = await search_waifu(search_str)
         if waifu is None:
             return await ctx.send("Waifu not found!")
 
-        query = (
-            database.PurchasedWaifu.select()
-            .where(database.PurchasedWaifu.c.waifu_id == waifu["id"])
-            .where(database.PurchasedWaifu.c.guild == ctx.guild.id)
+        # Tells the buyer who owns it; buy_waifu checks again inside its transaction.
+        db_purchaser = await database.WAIFU_OWNER.fetch_one(
+            guild=ctx.guild.id, waifu_id=waifu["id"]
         )
-        db_purchaser = await engine.fetch_one(query=query)
         if db_purchaser is not None:
             purchaser = ctx.guild.get_member(
-                db_purchaser[database.PurchasedWaifu.c.member]
-            ) or await ctx.guild.fetch_member(db_purchaser[database.PurchasedWaifu.c.member])
+                db_purchaser["member"]
+            ) or await ctx.guild.fetch_member(db_purchaser["member"])
             if purchaser is None:
                 return await ctx.send(
                     "This waifu was purchased by someone who has now "
                     "left the server! Rescue them with `=rescuewaifus`."
                 )
-            if db_purchaser[database.PurchasedWaifu.c.member] == ctx.author.id:
+            if db_purchaser["member"] == ctx.author.id:
                 return await ctx.send(
                     "How many more times do you want to buy "
                     "this waifu? <:smug:575373306715439151>"
@@ -332,10 +287,9 @@ class WaifuCommands(commands.Cog, name="Waifu"):
                 f"You need {waifu['price']-wallet:,} <:PIC:668725298388271105> more."
             )
 
-        waifu_id = f"{ctx.guild.id}:{waifu['id']}"
-        if waifu_id in BUY_LOCK:
+        waifu_key = f"{ctx.guild.id}:{waifu['id']}"
+        if not await locks.PURCHASES.acquire(waifu_key, ctx.message.id):
             return await ctx.send("It looks like someone else is trying to buy this waifu already")
-        BUY_LOCK.append(waifu_id)
         await ctx.send(
             f"Want to buy {waifu['name']} for sure? Reply with `confirm` in 60s or `exit`."
         )
@@ -347,29 +301,24 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         except asyncio.TimeoutError:
             return await ctx.send("Error: Timed out.")
         finally:
-            BUY_LOCK.remove(waifu_id)
+            await locks.PURCHASES.release(waifu_key, ctx.message.id)
 
+        buyer = await cache.MEMBER_PROFILES.get(ctx.author.id)
         try:
-            await database.remove_money(ctx.author, waifu["price"])
+            bought = await database.buy_waifu(
+                ctx.author, buyer["id"], ctx.guild.id, waifu["id"], waifu["price"]
+            )
         except errors.NotEnoughBalance:
             wallet = await database.fetch_wallet(ctx.author)
             return await ctx.send(
                 "You do not have enough money! <:Eww:575373991640956938>\n"
                 f"You need {waifu['price']-wallet:,} <:PIC:668725298388271105> more."
             )
-
-        query = database.Member.select().where(database.Member.c.member == ctx.author.id)
-        buyer = await engine.fetch_one(query)
-        await engine.execute(
-            query=database.PurchasedWaifu.insert(None),
-            values={
-                "member_id": buyer[database.Member.c.id],
-                "waifu_id": waifu["id"],
-                "guild": ctx.guild.id,
-                "member": buyer[database.Member.c.member],
-                "purchased_for": waifu["price"],
-            },
-        )
+        if bought is None:
+            return await ctx.send(
+                "Someone else bought this waifu first! Ask them to sell it or trade with you!"
+            )
+        claims.CLAIMS.claim(ctx.guild.id, waifu["id"])
 
         await ctx.send(
             f"You're now in a relationship with {waifu['name']} "
@@ -385,8 +334,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         """
         engine = await database.prepare_engine()
 
-        query = generate_search_query(search_str, limit=1)
-        waifu = await engine.fetch_one(query=query)
+        waifu = await search_waifu(search_str)
         if waifu is None:
             return await ctx.send(
                 "Waifu not found! Don't sell your imaginary waifus <:smug:575373306715439151>"
@@ -398,7 +346,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
             .where(database.PurchasedWaifu.c.guild == ctx.guild.id)
             .where(database.PurchasedWaifu.c.member == ctx.author.id)
         )
-        db_purchaser = await engine.fetch_one(query=query)
+        db_purchaser = await engine.fetch_one(query=query, site="sell_owner")
         if db_purchaser is None:
             return await ctx.send(
                 "By what logic are you trying to sell "
@@ -423,11 +371,12 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         except asyncio.TimeoutError:
             return await ctx.send("Error: Timed out.")
 
-        query = database.PurchasedWaifu.delete(None).where(
-            database.PurchasedWaifu.c.id == db_purchaser[database.PurchasedWaifu.c.id]
+        sold, _ = await database.sell_waifus(
+            ctx.author, ctx.guild.id, [db_purchaser[database.PurchasedWaifu.c.id]]
         )
-        await engine.execute(query=query)
-        await add_money(ctx.author, selling_price)
+        if not sold:
+            return await ctx.send("Hey, don't try to cheat the system! Cancelling sale...")
+        claims.CLAIMS.release(ctx.guild.id, waifu["id"])
 
         await ctx.send(
             f"You successfully broke up with {waifu['name']} and they are "
@@ -437,8 +386,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
     async def toggle_favorite(self, ctx, search_str: str, favorite: bool = True):
         engine = await database.prepare_engine()
 
-        query = generate_search_query(search_str, limit=1)
-        waifu = await engine.fetch_one(query=query)
+        waifu = await search_waifu(search_str)
         if waifu is None:
             return await ctx.send("Waifu not found!")
 
@@ -448,7 +396,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
             .where(database.PurchasedWaifu.c.guild == ctx.guild.id)
             .where(database.PurchasedWaifu.c.member == ctx.author.id)
         )
-        purchased_waifu = await engine.fetch_one(query=query)
+        purchased_waifu = await engine.fetch_one(query=query, site="favorite_owner")
         if purchased_waifu is None:
             await ctx.send(
                 "You can't mark a waifu you don't own as a favorite <:smug:575373306715439151>"
@@ -459,7 +407,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
             .where(database.PurchasedWaifu.c.id == purchased_waifu[database.PurchasedWaifu.c.id])
             .values(favorite=favorite)
         )
-        await engine.execute(update_query)
+        await engine.execute(update_query, site="favorite")
         if favorite:
             gender = "him" if waifu["gender"] == "m" else "her"
             await ctx.send(
@@ -501,8 +449,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
 
         sender = ctx.author
 
-        query = generate_search_query(waifu, limit=1)
-        sender_waifu = await engine.fetch_one(query=query)
+        sender_waifu = await search_waifu(waifu)
 
         if sender_waifu is None:
             return await ctx.send(
@@ -515,7 +462,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
             .where(database.PurchasedWaifu.c.guild == ctx.guild.id)
             .where(database.PurchasedWaifu.c.member == sender.id)
         )
-        sender_pwaifu = await engine.fetch_one(query=pwaifu_query)
+        sender_pwaifu = await engine.fetch_one(query=pwaifu_query, site="trade_owner")
         if sender_pwaifu is None:
             return await ctx.send(
                 "Hey! You can't trade a waifu which you don't own <:smug:575373306715439151>"
@@ -558,32 +505,38 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         except asyncio.TimeoutError:
             return await ctx.send("Error: Timed out.")
 
-        if (await engine.fetch_one(query=pwaifu_query)) is None:
+        if (await engine.fetch_one(query=pwaifu_query, site="trade_owner")) is None:
             return await ctx.send("Hey, don't try to cheat the system! Cancelling trade...")
 
-        try:
-            await database.remove_money(receiver, price)
-        except errors.NotEnoughBalance:
-            return await ctx.send("Hey, don't try to cheat the system! Cancelling trade...")
+        db_receiver = await cache.MEMBER_PROFILES.get(receiver.id)
 
-        query = database.Member.select().where(database.Member.c.member == receiver.id)
-        db_receiver = await engine.fetch_one(query=query)
+        try:
+            async with database.transaction():
+                await database.transfer_money(receiver, sender, price, "trade")
 
-        query = database.PurchasedWaifu.delete(None).where(
-            database.PurchasedWaifu.c.id == sender_pwaifu[database.PurchasedWaifu.c.id]
-        )
-        await engine.execute(query=query)
-        await engine.execute(
-            query=database.PurchasedWaifu.insert(None),
-            values={
-                "member_id": db_receiver[database.Member.c.id],
-                "waifu_id": sender_waifu["id"],
-                "guild": ctx.guild.id,
-                "member": db_receiver[database.Member.c.member],
-                "purchased_for": 0,
-            },
-        )
-        await database.add_money(sender, price)
+                query = (
+                    database.PurchasedWaifu.delete(None)
+                    .where(
+                        database.PurchasedWaifu.c.id == sender_pwaifu[database.PurchasedWaifu.c.id]
+                    )
+                    .returning(database.PurchasedWaifu.c.id)
+                )
+                # Sold or traded away since the check above: roll the payment back.
+                if await engine.fetch_val(query=query, site="trade") is None:
+                    raise errors.WaifuNotOwned
+                await engine.execute(
+                    query=database.PurchasedWaifu.insert(None),
+                    values={
+                        "member_id": db_receiver["id"],
+                        "waifu_id": sender_waifu["id"],
+                        "guild": ctx.guild.id,
+                        "member": db_receiver["member"],
+                        "purchased_for": 0,
+                    },
+                    site="trade",
+                )
+        except (errors.NotEnoughBalance, errors.WaifuNotOwned):
+            return await ctx.send("Hey, don't try to cheat the system! Cancelling trade...")
 
         await ctx.send("Trade successful! <:SataniaThumb:575384688714317824>")
 
@@ -598,8 +551,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
 
         sender = ctx.author
 
-        query = generate_search_query(send_waifu_txt, limit=1)
-        sender_waifu = await engine.fetch_one(query=query)
+        sender_waifu = await search_waifu(send_waifu_txt)
 
         if sender_waifu is None:
             return await ctx.send(
@@ -612,7 +564,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
             .where(database.PurchasedWaifu.c.guild == ctx.guild.id)
             .where(database.PurchasedWaifu.c.member == sender.id)
         )
-        sender_pwaifu = await engine.fetch_one(query=sender_pwaifu_query)
+        sender_pwaifu = await engine.fetch_one(query=sender_pwaifu_query, site="trade_owner")
         if sender_pwaifu is None:
             return await ctx.send(
                 "Hey! You can't trade a waifu which you don't own <:smug:575373306715439151>"
@@ -629,8 +581,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         except asyncio.TimeoutError:
             return await ctx.send("Error: Timed out.")
 
-        query = generate_search_query(recv_waifu_txt, limit=1)
-        receiver_waifu = await engine.fetch_one(query=query)
+        receiver_waifu = await search_waifu(recv_waifu_txt)
         if receiver_waifu is None:
             return await ctx.send(
                 "Waifu not found! Don't trade your imaginary waifus <:smug:575373306715439151>"
@@ -642,7 +593,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
             .where(database.PurchasedWaifu.c.guild == ctx.guild.id)
             .where(database.PurchasedWaifu.c.member == receiver.id)
         )
-        receiver_pwaifu = await engine.fetch_one(query=receiver_pwaifu_query)
+        receiver_pwaifu = await engine.fetch_one(query=receiver_pwaifu_query, site="trade_owner")
         if receiver_pwaifu is None:
             return await ctx.send(
                 "Hey! You can't trade a waifu which you don't own <:smug:575373306715439151>"
@@ -663,100 +614,112 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         except asyncio.TimeoutError:
             return await ctx.send("Error: Timed out.")
 
-        if (await engine.fetch_one(query=sender_pwaifu_query)) is None or (
-            await engine.fetch_one(query=receiver_pwaifu_query) is None
+        if (await engine.fetch_one(query=sender_pwaifu_query, site="trade_owner")) is None or (
+            await engine.fetch_one(query=receiver_pwaifu_query, site="trade_owner") is None
         ):
             return await ctx.send("Hey, don't try to cheat the system! Cancelling trade...")
 
-        query = database.PurchasedWaifu.delete(None).where(
-            database.PurchasedWaifu.c.id.in_(
-                [
-                    sender_pwaifu[database.PurchasedWaifu.c.id],
-                    receiver_pwaifu[database.PurchasedWaifu.c.id],
-                ]
+        query = (
+            database.PurchasedWaifu.delete(None)
+            .where(
+                database.PurchasedWaifu.c.id.in_(
+                    [
+                        sender_pwaifu[database.PurchasedWaifu.c.id],
+                        receiver_pwaifu[database.PurchasedWaifu.c.id],
+                    ]
+                )
             )
+            .returning(database.PurchasedWaifu.c.id)
         )
 
-        await engine.execute(query=query)
-        await engine.execute_many(
-            query=database.PurchasedWaifu.insert(None),
-            values=[
-                {
-                    "member_id": sender_pwaifu[database.PurchasedWaifu.c.member_id],
-                    "waifu_id": receiver_pwaifu[database.PurchasedWaifu.c.waifu_id],
-                    "guild": ctx.guild.id,
-                    "member": sender_pwaifu[database.PurchasedWaifu.c.member],
-                    "purchased_for": 0,
-                },
-                {
-                    "member_id": receiver_pwaifu[database.PurchasedWaifu.c.member_id],
-                    "waifu_id": sender_pwaifu[database.PurchasedWaifu.c.waifu_id],
-                    "guild": ctx.guild.id,
-                    "member": receiver_pwaifu[database.PurchasedWaifu.c.member],
-                    "purchased_for": 0,
-                },
-            ],
-        )
+        try:
+            async with database.transaction():
+                # Either waifu sold or traded away since the check above: undo the swap.
+                if len(await engine.fetch_all(query=query, site="trade")) != 2:
+                    raise errors.WaifuNotOwned
+                await engine.execute_many(
+                    query=database.PurchasedWaifu.insert(None),
+                    values=[
+                        {
+                            "member_id": sender_pwaifu[database.PurchasedWaifu.c.member_id],
+                            "waifu_id": receiver_pwaifu[database.PurchasedWaifu.c.waifu_id],
+                            "guild": ctx.guild.id,
+                            "member": sender_pwaifu[database.PurchasedWaifu.c.member],
+                            "purchased_for": 0,
+                        },
+                        {
+                            "member_id": receiver_pwaifu[database.PurchasedWaifu.c.member_id],
+                            "waifu_id": sender_pwaifu[database.PurchasedWaifu.c.waifu_id],
+                            "guild": ctx.guild.id,
+                            "member": receiver_pwaifu[database.PurchasedWaifu.c.member],
+                            "purchased_for": 0,
+                        },
+                    ],
+                    site="trade",
+                )
+        except errors.WaifuNotOwned:
+            return await ctx.send("Hey, don't try to cheat the system! Cancelling trade...")
 
         await ctx.send("Trade successful! <:SataniaThumb:575384688714317824>")
 
     @commands.command(name="randomroll", aliases=["rr", "randomwaifu"])
     @commands.guild_only()
-    async def random_waifu(self, ctx):
+    async def random_waifu(self, ctx, mode: str = None):
         """
         Get a random waifu/husbando at a discounted price.
+        Use `randomroll unclaimed` to only roll waifus nobody in this server owns yet.
 
-        Amount of rolls per 3 hours:
+        Rolls refill gradually, all of them within 3 hours:
         Normal user: 10 rolls
         Tier 1 donator: 30 rolls
         Tier 2 donator: 90 rolls
         """
-        engine = await database.prepare_engine()
-
-        fetch_query = database.Member.select().where(database.Member.c.member == ctx.author.id)
-        waifu = await engine.fetch_one(query=fetch_query)
-        member_tier = waifu[database.Member.c.tier]
+        db_member = await cache.MEMBER_PROFILES.get(ctx.author.id)
+        member_tier = db_member["tier"]
         total_rolls = get_total_rolls(member_tier)
 
-        key = f"{ctx.guild.id}:{ctx.author.id}"
-        rolled, last_roll = self.random_waifu_counter.setdefault(key, (0, datetime.now()))
-        left_rolls = total_rolls - rolled
-        last_roll_interval = datetime.now() - last_roll
+        claimed = await claims.CLAIMS.get(ctx.guild.id)
+        unclaimed_only = mode is not None and mode.lower() == "unclaimed"
+        if not catalog.WAIFUS:
+            return await ctx.send("The Dungeon has no waifus yet, try again in a moment!")
+        if unclaimed_only and claimed.unclaimed == 0:
+            return await ctx.send("Every waifu in the Dungeon is already claimed here!")
 
-        if last_roll_interval.total_seconds() > config.ROLL_INTERVAL:
-            rolled = 0
-            left_rolls = total_rolls
-
-        if left_rolls <= 0:
-            tdelta = timedelta(seconds=config.ROLL_INTERVAL) - last_roll_interval
+        taken, _, wait = await quota.ROLL_QUOTA.take(ctx.guild.id, ctx.author.id, total_rolls)
+        if not taken:
+            tdelta = timedelta(seconds=round(wait))
             return await ctx.send(
                 f"You have no rolls left! Please try again in {tdelta}. "
                 f"You can donate to the bot (see `{ctx.prefix}donate`) "
                 "and get more rolls <a:thanks:699004469610020964>"
             )
 
-        self.random_waifu_counter[key] = (rolled + 1, datetime.now())
-
-        query = database.Waifu.select().order_by(sa.sql.func.random())
-        waifu = await engine.fetch_one(query=query)
+        if unclaimed_only:
+            # Never a uniform roll instead: that could land on a claimed waifu.
+            waifu = sampler.ROLLS.sample_unclaimed(claimed)
+            if waifu is None:
+                return await ctx.send("Every waifu in the Dungeon is already claimed here!")
+        else:
+            waifu = sampler.ROLLS.sample()
+        if waifu is None:
+            return await ctx.send("The Dungeon has no waifus yet, try again in a moment!")
 
-        query = (
-            database.PurchasedWaifu.select()
-            .where(database.PurchasedWaifu.c.waifu_id == waifu[database.Waifu.c.id])
-            .where(database.PurchasedWaifu.c.guild == ctx.guild.id)
-        )
-        db_purchaser = await engine.fetch_one(query=query)
+        db_purchaser = None
+        if waifu["id"] in claimed:
+            db_purchaser = await database.WAIFU_OWNER.fetch_one(
+                guild=ctx.guild.id, waifu_id=waifu["id"]
+            )
         purchaseable = db_purchaser is None
         purchaser = None
         if db_purchaser is not None:
             purchaser = ctx.guild.get_member(
-                db_purchaser[database.PurchasedWaifu.c.member]
-            ) or await ctx.guild.fetch_member(db_purchaser[database.PurchasedWaifu.c.member])
+                db_purchaser["member"]
+            ) or await ctx.guild.fetch_member(db_purchaser["member"])
 
-        gender = self.gender_table.get(waifu[database.Waifu.c.gender], "trap")
-        name = waifu[database.Waifu.c.name]
-        from_anime = waifu[database.Waifu.c.from_anime]
-        price = int(waifu[database.Waifu.c.price] * config.PRICE_CUT)
+        gender = self.gender_table.get(waifu["gender"], "trap")
+        name = waifu["name"]
+        from_anime = waifu["from_anime"]
+        price = int(waifu["price"] * config.PRICE_CUT)
 
         if purchaseable:
             description = (
@@ -784,13 +747,13 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         )
 
         images = []
-        if waifu[database.Waifu.c.image_url] is not None:
-            images = waifu[database.Waifu.c.image_url].split(",")
+        if waifu["image_url"] is not None:
+            images = waifu["image_url"].split(",")
             embed.set_image(url=images[0])
 
         embed.add_field(name="From", value=from_anime, inline=False)
         embed.add_field(name="Cost", value=f"{price:,} <:PIC:668725298388271105>")
-        embed.add_field(name="ID", value=waifu[database.Waifu.c.id])
+        embed.add_field(name="ID", value=waifu["id"])
         embed.add_field(name="Gender", value=gender)
         if len(images) > 1:
             embed.add_field(
@@ -799,7 +762,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
                 value=f"**Showing: 1/{len(images)}**",
             )
         if purchaser is not None:
-            purchased_for = db_purchaser[database.PurchasedWaifu.c.purchased_for]
+            purchased_for = db_purchaser["purchased_for"]
             embed.set_footer(
                 text=f"Purchased by {purchaser} for {purchased_for} PIC.",
                 icon_url=purchaser.avatar_url_as(size=128),
@@ -815,15 +778,15 @@ class WaifuCommands(commands.Cog, name="Waifu"):
             await msg.add_reaction("⬅")
             await msg.add_reaction("➡")
 
-        def check(reaction, user):
-            return not user.bot and reaction.message.id == msg.id
+        def check(_reaction, user):
+            return not user.bot
 
         curr_page = 0
         purchased = False
         try:
             while not purchased:
-                reaction, purchaser = await ctx.bot.wait_for(
-                    "reaction_add", timeout=10.0, check=check
+                reaction, purchaser = await waiters.WAITERS.wait_for_reaction(
+                    msg.id, check=check, timeout=10.0
                 )
                 react_emoji = str(reaction.emoji)
                 if react_emoji in ["➡", "⬅"]:
@@ -841,12 +804,17 @@ class WaifuCommands(commands.Cog, name="Waifu"):
                     await msg.edit(embed=embed)
                     await msg.remove_reaction(react_emoji, purchaser)
                 elif react_emoji == "❤":
+                    buyer = await cache.MEMBER_PROFILES.get(purchaser.id)
                     try:
-                        await database.remove_money(purchaser, price)
+                        bought = await database.buy_waifu(
+                            purchaser, buyer["id"], ctx.guild.id, waifu["id"], price
+                        )
                     except errors.NotEnoughBalance:
                         return await ctx.send(
                             "You don't have enough coins to buy me <:smug:575373306715439151>"
                         )
+                    if bought is None:
+                        return await ctx.send("Someone else bought me first, bye-bye!")
                     purchased = True
         except asyncio.TimeoutError:
             embed.description = "You were too late to buy me, bye-bye!"
@@ -862,18 +830,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         except discord.errors.Forbidden:
             pass
 
-        query = database.Member.select().where(database.Member.c.member == purchaser.id)
-        buyer = await engine.fetch_one(query=query)
-        await engine.execute(
-            query=database.PurchasedWaifu.insert(None),
-            values={
-                "member_id": buyer[database.Member.c.id],
-                "waifu_id": waifu[database.Waifu.c.id],
-                "guild": ctx.guild.id,
-                "member": buyer[database.Member.c.member],
-                "purchased_for": price,
-            },
-        )
+        claims.CLAIMS.claim(ctx.guild.id, waifu["id"])
         embed.description = f"I am now in a relationship with {purchaser.name}!"
         await msg.edit(embed=embed)
 
@@ -886,36 +843,31 @@ class WaifuCommands(commands.Cog, name="Waifu"):
     @commands.guild_only()
     async def rolls_left(self, ctx):
         """
-        Check how many rolls you have left. Resets every 3 hours
+        Check how many rolls you have left. They refill gradually, all of them within 3 hours
         """
-        engine = await database.prepare_engine()
-
-        query = database.Member.select().where(database.Member.c.member == ctx.author.id)
-        db_member = await engine.fetch_one(query=query)
-        member_tier = db_member[database.Member.c.tier]
+        db_member = await cache.MEMBER_PROFILES.get(ctx.author.id)
+        member_tier = db_member["tier"]
         total_rolls = get_total_rolls(member_tier)
 
-        key = f"{ctx.guild.id}:{ctx.author.id}"
-        rolled, last_roll = self.random_waifu_counter.setdefault(key, (0, datetime.now()))
-        last_roll_interval = datetime.now() - last_roll
-
-        if last_roll_interval.total_seconds() > config.ROLL_INTERVAL:
+        left_rolls, next_roll, refilled = await quota.ROLL_QUOTA.peek(
+            ctx.guild.id, ctx.author.id, total_rolls
+        )
+        if left_rolls >= total_rolls:
             return await ctx.send(
                 f"You have {total_rolls} available!\n"
                 f"You can donate to the bot (see `{ctx.prefix}donate`) "
                 "and get more rolls <a:thanks:699004469610020964>"
             )
 
-        left_rolls = total_rolls - rolled
-
-        tdelta = datetime.utcfromtimestamp(
-            (timedelta(seconds=config.ROLL_INTERVAL) - last_roll_interval).total_seconds()
-        ).strftime("%H Hours %M Minutes")
+        next_roll, refilled = (
+            datetime.utcfromtimestamp(seconds).strftime("%H Hours %M Minutes")
+            for seconds in (next_roll, refilled)
+        )
 
         left_rolls = "no" if left_rolls <= 0 else left_rolls
         await ctx.send(
             f"You have {left_rolls} rolls left! "
-            f"Rolls reset in {tdelta}.\n"
+            f"Next roll in {next_roll}, all rolls back in {refilled}.\n"
             f"You can donate to the bot (see `{ctx.prefix}donate`) "
             "and get more rolls <a:thanks:699004469610020964>"
         )
@@ -934,7 +886,7 @@ class WaifuCommands(commands.Cog, name="Waifu"):
             .where(database.PurchasedWaifu.c.member == ctx.author.id)
             .where(database.PurchasedWaifu.c.guild == ctx.guild.id)
         )
-        all_waifus = await engine.fetch_all(query=query)
+        all_waifus = await engine.fetch_all(query=query, site="sellharem_waifus")
         if len(all_waifus) == 0:
             return await ctx.send("You don't have any harem in the first place, sad!")
 
@@ -957,12 +909,13 @@ class WaifuCommands(commands.Cog, name="Waifu"):
             return await ctx.send("Error: Timed out.")
 
         ids = [i[database.PurchasedWaifu.c.id] for i in all_waifus]
-        await engine.execute(
-            database.PurchasedWaifu.delete(None).where(database.PurchasedWaifu.c.id.in_(ids))
-        )
-        await database.add_money(ctx.author, total_cost)
+        # Waifus traded away since the list was read are left out of the payout.
+        sold, payout = await database.sell_waifus(ctx.author, ctx.guild.id, ids)
+        if not sold:
+            return await ctx.send("You don't have any harem in the first place, sad!")
+        claims.CLAIMS.release(ctx.guild.id, *(row["waifu_id"] for row in sold))
 
-        await ctx.send(f"Done! You got back {total_cost} <:PIC:668725298388271105>.")
+        await ctx.send(f"Done! You got back {payout} <:PIC:668725298388271105>.")
 
     @commands.command("moneytrade", hidden=True)
     async def deprecated_moneytrade(self, ctx):
@@ -980,31 +933,31 @@ class WaifuCommands(commands.Cog, name="Waifu"):
         await unlock_command(ctx)
 
 
-def prepare_harem_page(purchased_waifus, waifu_data):
+def prepare_harem_page(numbered_rows):
     txt = ""
-    for i, row in purchased_waifus:
-        data = waifu_data[row[database.PurchasedWaifu.c.waifu_id]]
-        favorite_txt = " :heart:" if row[database.PurchasedWaifu.c.favorite] else ""
+    for i, row in numbered_rows:
+        favorite_txt = " :heart:" if row["favorite"] else ""
         txt += (
-            f"{i}: **__{data[database.Waifu.c.name]}__**{favorite_txt}\n"
-            f"**ID:** {data[database.Waifu.c.id]} | "
-            f"**Purchased For:** {row[database.PurchasedWaifu.c.purchased_for]} "
-            f"<:PIC:668725298388271105> | **From:** {data[database.Waifu.c.from_anime]}\n"
+            f"{i}: **__{row['name']}__**{favorite_txt}\n"
+            f"**ID:** {row['waifu_id']} | "
+            f"**Purchased For:** {row['purchased_for']} "
+            f"<:PIC:668725298388271105> | **From:** {row['from_anime']}\n"
         )
     return txt
 
 
-def generate_search_query(inp, limit=30):
+def generate_search_query(by_id=False):
     query = database.Waifu.select()
-    if inp.isdigit():
-        query = query.where(database.Waifu.c.id == int(inp))
+    if by_id:
+        query = query.where(database.Waifu.c.id == sa.bindparam("waifu_id"))
     else:
+        search = sa.bindparam("search")
         union_list = [
-            sa.select([database.Waifu, database.Waifu.c.name.op("<->")(inp).label("sim")]),
+            sa.select([database.Waifu, database.Waifu.c.name.op("<->")(search).label("sim")]),
             sa.select(
                 [
                     database.Waifu,
-                    database.Waifu.c.from_anime.op("<->")(inp).label("sim"),
+                    database.Waifu.c.from_anime.op("<->")(search).label("sim"),
                 ]
             ),
         ]
@@ -1026,84 +979,166 @@ def generate_search_query(inp, limit=30):
         ).select_from(query.alias("q"))
         query = query.group_by(*columns)
         query = query.order_by(sa.asc("sim"))
-    query = query.limit(limit)
+    query = query.limit(sa.bindparam("limit"))
     return query
 
 
-SORT_FILTER_REGEX = re.compile(r"([a-z]+)[_\-+]?([a-z]+)?")
-
+WAIFU_BY_ID = database.PreparedQuery(
+    "waifu_by_id", generate_search_query(by_id=True), replica=True
+)
+WAIFU_SEARCH = database.PreparedQuery("waifu_search", generate_search_query(), replica=True)
 
-def filter_harem(purchased_waifus, waifu_data, filter_opts):
-    def sort_id(reverse=False):
-        purchased_waifus.sort(key=lambda x: x[database.PurchasedWaifu.c.waifu_id], reverse=reverse)
 
-    def sort_price(reverse=False):
-        purchased_waifus.sort(
-            key=lambda x: x[database.PurchasedWaifu.c.purchased_for], reverse=reverse
-        )
+def use_local_search():
+    # The in-process index once it has been built; catches it up with the catalog if needed.
+    if not config.LOCAL_SEARCH or len(catalog.WAIFUS) == 0:
+        return False
+    trigram.WAIFU_INDEX.sync()
+    return trigram.WAIFU_INDEX.ready
 
-    def sort_name(reverse=False):
-        purchased_waifus.sort(
-            key=lambda x: waifu_data[x[database.PurchasedWaifu.c.waifu_id]][database.Waifu.c.name],
-            reverse=reverse,
-        )
-
-    def sort_series(reverse=False):
-        purchased_waifus.sort(
-            key=lambda x: waifu_data[x[database.PurchasedWaifu.c.waifu_id]][
-                database.Waifu.c.from_anime
-            ],
-            reverse=reverse,
-        )
 
-    sort_headers = {
-        "name": sort_name,
-        "series": sort_series,
-        "anime": sort_series,
-        "id": sort_id,
-        "price": sort_price,
-    }
-    sort_types = ("asc", "desc")
-    gender_opts = {
-        "waifu": "f",
-        "husbando": "m",
-        "female": "f",
-        "male": "m",
-    }
-
-    for opt in filter_opts:
-        opt = opt.lower()
-
-        if opt in gender_opts:
-            g_opt = gender_opts[opt]
-            purchased_waifus = [
-                x
-                for x in purchased_waifus
-                if waifu_data[x[database.PurchasedWaifu.c.waifu_id]][database.Waifu.c.gender]
-                == g_opt
-            ]
-            continue
+async def search_waifus(inp, limit=30):
+    tiers = trigram.WAIFU_INDEX.tiers
+    if inp.isdigit():
+        waifu = catalog.WAIFUS.get(int(inp))
+        if waifu is not None:
+            tiers["id"] += 1
+            return [waifu]
+        tiers["sql"] += 1
+        return await WAIFU_BY_ID.fetch_all(waifu_id=int(inp), limit=limit)
+    if use_local_search():
+        tiers["fuzzy"] += 1
+        return trigram.SEARCH_CACHE.search(inp, limit)
+    tiers["sql"] += 1
+    return await WAIFU_SEARCH.fetch_all(search=inp, limit=limit)
+
+
+async def search_waifu(inp):
+    # Names copied from search or harem resolve exactly, without fuzzy ranking.
+    if not inp.isdigit() and use_local_search():
+        waifu, tier = trigram.WAIFU_INDEX.lookup(inp)
+        if waifu is not None:
+            trigram.WAIFU_INDEX.tiers[tier] += 1
+            return waifu
+    waifus = await search_waifus(inp, limit=1)
+    return waifus[0] if waifus else None
 
-        s_opt = SORT_FILTER_REGEX.findall(opt)
-        if len(s_opt) != 1:
-            continue
 
-        s_opt = s_opt[0]
-        s_head = sort_headers.get(s_opt[0])
-        if not s_head:
-            continue
+SORT_FILTER_REGEX = re.compile(r"([a-z]+)[_\-+]?([a-z]+)?")
 
-        s_type = s_opt[1]
-        s_type = s_type if s_type in sort_types else sort_types[0]
-        reverse = s_type == "desc"
 
-        s_head(reverse)
+HAREM_PAGE_SIZE = 10
+HAREM_SORT_KEYS = {
+    "name": database.Waifu.c.name,
+    "series": database.Waifu.c.from_anime,
+    "anime": database.Waifu.c.from_anime,
+    "id": database.PurchasedWaifu.c.waifu_id,
+    "price": database.PurchasedWaifu.c.purchased_for,
+}
+HAREM_GENDERS = {
+    "waifu": "f",
+    "husbando": "m",
+    "female": "f",
+    "male": "m",
+}
+HAREM_COLUMNS = [
+    database.PurchasedWaifu.c.id,
+    database.PurchasedWaifu.c.waifu_id,
+    database.PurchasedWaifu.c.purchased_for,
+    database.PurchasedWaifu.c.favorite,
+    database.Waifu.c.name,
+    database.Waifu.c.from_anime,
+]
+
+
+class HaremQuery:
+    """
+    A member's harem with the harem filter options applied in SQL: gender filters, at
+    most one sort key, and favorites first. Pages are read with keyset pagination on
+    (favorite, sort key, purchase ID), so any page costs about the same as the first.
+    Text sorts use the "C" collation to order like Python string comparison.
+    """
+
+    def __init__(self, guild_id, member_id, filter_opts):
+        self.guild_id = guild_id
+        self.member_id = member_id
+        self.genders = set()
+        # (row key, expression, descending), most significant first.
+        self.order = [("favorite", database.PurchasedWaifu.c.favorite, True)]
+
+        sort_key = None
+        for opt in filter_opts:
+            opt = opt.lower()
+            if opt in HAREM_GENDERS:
+                self.genders.add(HAREM_GENDERS[opt])
+                continue
+
+            s_opt = SORT_FILTER_REGEX.findall(opt)
+            if sort_key is not None or len(s_opt) != 1 or s_opt[0][0] not in HAREM_SORT_KEYS:
+                continue  # only 1 sort type allowed
+            sort_key = HAREM_SORT_KEYS[s_opt[0][0]]
+            expression = (
+                sa.collate(sort_key, "C") if sort_key.type.python_type is str else sort_key
+            )
+            self.order.append((sort_key.name, expression, s_opt[0][1] == "desc"))
+        self.order.append(("id", database.PurchasedWaifu.c.id, False))
 
-        break  # only 1 sort type allowed
+    def _select(self, columns, gendered=True):
+        query = (
+            sa.select(columns)
+            .select_from(
+                database.PurchasedWaifu.join(
+                    database.Waifu, database.Waifu.c.id == database.PurchasedWaifu.c.waifu_id
+                )
+            )
+            .where(database.PurchasedWaifu.c.guild == self.guild_id)
+            .where(database.PurchasedWaifu.c.member == self.member_id)
+        )
+        if gendered:
+            query = query.where(self._gender_filter())
+        return query
 
-    purchased_waifus.sort(key=lambda x: x[database.PurchasedWaifu.c.favorite], reverse=True)
+    def _gender_filter(self):
+        return sa.and_(sa.true(), *(database.Waifu.c.gender == gender for gender in self.genders))
 
-    return purchased_waifus
+    async def totals(self):
+        # Owned waifus, those matching the filters, and the value of the matching ones.
+        matched = self._gender_filter()
+        query = self._select(
+            [
+                sa.func.count().label("owned"),
+                sa.func.count().filter(matched).label("matched"),
+                sa.func.coalesce(
+                    sa.func.sum(database.PurchasedWaifu.c.purchased_for).filter(matched), 0
+                ).label("value"),
+            ],
+            gendered=False,
+        )
+        return await database.READ_REPLICA.fetch_one(query=query, site="harem_totals")
+
+    async def page(self, after=None, limit=HAREM_PAGE_SIZE):
+        query = self._select(HAREM_COLUMNS)
+        if after is not None:
+            query = query.where(self._after(after))
+        query = query.order_by(
+            *(
+                expression.desc() if desc else expression.asc()
+                for _, expression, desc in self.order
+            )
+        )
+        return await database.READ_REPLICA.fetch_all(query=query.limit(limit), site="harem_page")
+
+    def _after(self, cursor):
+        # Rows strictly after `cursor` in the page order, one OR branch per order column.
+        branches, equal = [], []
+        for (_, expression, desc), value in zip(self.order, cursor):
+            value = sa.literal(value, expression.type)  # Also binds booleans.
+            branches.append(sa.and_(*equal, expression < value if desc else expression > value))
+            equal.append(expression == value)
+        return sa.or_(*branches)
+
+    def cursor(self, row):
+        return tuple(row[key] for key, _, _ in self.order)
 
 
 def get_total_rolls(member_tier):
@@ -0,0 +1,165 @@
+import asyncio
+import collections
+import datetime
+import logging
+import time
+
+import sqlalchemy as sa
+
+import config
+import database
+
+BUCKET_ROW = database.PreparedQuery(
+    "roll_quota_bucket",
+    sa.select([database.RollQuota.c.tokens, database.RollQuota.c.updated_at])
+    .where(database.RollQuota.c.guild == sa.bindparam("guild"))
+    .where(database.RollQuota.c.member == sa.bindparam("member")),
+)
+
+# unnest() keeps the statement text constant, so its prepared plan is reused.
+UPSERT_QUERY = """
+INSERT INTO roll_quota (guild, member, tokens, updated_at)
+SELECT * FROM unnest(
+    CAST(:guilds AS BIGINT[]), CAST(:members AS BIGINT[]),
+    CAST(:tokens AS FLOAT8[]), CAST(:stamps AS TIMESTAMP[])
+)
+ON CONFLICT (guild, member) DO UPDATE
+SET tokens = EXCLUDED.tokens, updated_at = EXCLUDED.updated_at;
+"""
+
+
+class RollQuotaStore:  # pylint: disable=too-many-instance-attributes
+    """
+    Token buckets for randomroll, keyed by (guild, member). A bucket holds up to `capacity`
+    rolls and refills at capacity per `interval`, so it is full again `interval` seconds
+    after its last roll. Buckets are read through from roll_quota on first use and written
+    back in batches every `flush_interval` seconds; buckets idle for `interval` are full,
+    so they are dropped from memory and from the table. A guild is served by one shard,
+    so each bucket only ever lives in one process.
+    """
+
+    def __init__(
+        self, interval=config.ROLL_INTERVAL, flush_interval=config.ROLL_QUOTA_FLUSH_INTERVAL
+    ):
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self._buckets = collections.OrderedDict()  # (guild, member) -> [tokens, timestamp]
+        self._dirty = set()
+        self._task = None
+        self._last_cleanup = time.time()
+        self.flushes = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    @property
+    def dirty(self):
+        return len(self._dirty)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            await self.expire()
+
+    async def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            row = await BUCKET_ROW.fetch_one(guild=key[0], member=key[1])
+            # Another roll may have loaded it while we waited.
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if row is None:
+                    bucket = [float("inf"), time.time()]  # Clamped to capacity on refill.
+                else:
+                    bucket = [row["tokens"], row["updated_at"].timestamp()]
+                self._buckets[key] = bucket
+        self._buckets.move_to_end(key)
+        return bucket
+
+    def _refill(self, bucket, capacity, now):
+        rate = capacity / self.interval
+        bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+
+    def _waits(self, bucket, capacity):
+        # Seconds until the next roll and until the bucket is full again.
+        rate = capacity / self.interval
+        next_roll = max(0.0, 1 - bucket[0]) / rate
+        return next_roll, (capacity - bucket[0]) / rate
+
+    async def take(self, guild_id, member_id, capacity):
+        """
+        Spend one roll if there is one. Returns whether a roll was spent, the whole rolls
+        left, and the seconds until the next one.
+        """
+        key = (guild_id, member_id)
+        bucket = await self._bucket(key)
+        self._refill(bucket, capacity, time.time())
+        taken = bucket[0] >= 1
+        if taken:
+            bucket[0] -= 1
+            self._dirty.add(key)
+        return taken, int(bucket[0]), self._waits(bucket, capacity)[0]
+
+    async def peek(self, guild_id, member_id, capacity):
+        """
+        Whole rolls left, seconds until the next roll and seconds until all rolls are back.
+        """
+        bucket = await self._bucket((guild_id, member_id))
+        self._refill(bucket, capacity, time.time())
+        return (int(bucket[0]), *self._waits(bucket, capacity))
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        keys, self._dirty = [key for key in self._dirty if key in self._buckets], set()
+        rows = [(key, self._buckets[key][0], self._buckets[key][1]) for key in keys]
+
+        engine = await database.prepare_engine()
+        try:
+            await engine.execute(
+                query=UPSERT_QUERY,
+                values={
+                    "guilds": [key[0] for key, _, _ in rows],
+                    "members": [key[1] for key, _, _ in rows],
+                    "tokens": [tokens for _, tokens, _ in rows],
+                    "stamps": [datetime.datetime.fromtimestamp(stamp) for _, _, stamp in rows],
+                },
+                site="roll_quota_flush",
+            )
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Failed to flush %d roll quotas, retrying later.", len(rows))
+            self._dirty.update(keys)
+            return
+        self.flushes += 1
+
+    async def expire(self):
+        cutoff = time.time() - self.interval
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if bucket[1] > cutoff or key in self._dirty:
+                break
+            del self._buckets[key]
+            self.expired += 1
+
+        if self._last_cleanup > cutoff:
+            return
+        engine = await database.prepare_engine()
+        query = database.RollQuota.delete(None).where(
+            database.RollQuota.c.updated_at < datetime.datetime.fromtimestamp(cutoff)
+        )
+        try:
+            await engine.execute(query=query, site="roll_quota_expire")
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Failed to delete idle roll quotas.")
+            return
+        self._last_cleanup = time.time()
+
+
+ROLL_QUOTA = RollQuotaStore()
@@ -0,0 +1,100 @@
+import array
+import logging
+import random
+import time
+
+import catalog
+import config
+
+
+class AliasTable:
+    """
+    Walker/Vose alias table: after an O(n) build, draws index i with probability
+    weights[i] / sum(weights) using one uniform index and one coin flip.
+    """
+
+    def __init__(self, weights):
+        count = len(weights)
+        total = sum(weights)
+        self.prob = array.array("d", (w * count / total for w in weights))
+        self.alias = array.array("I", range(count))
+
+        small = [i for i, p in enumerate(self.prob) if p < 1.0]
+        large = [i for i, p in enumerate(self.prob) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.alias[less] = more
+            self.prob[more] -= 1.0 - self.prob[less]
+            (small if self.prob[more] < 1.0 else large).append(more)
+        for i in small + large:  # Only rounding error left.
+            self.prob[i] = 1.0
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self):
+        idx = random.randrange(len(self.prob))
+        return idx if random.random() < self.prob[idx] else self.alias[idx]
+
+
+def price_band_weight(price):
+    # Cheaper bands roll more often; anything above the last band uses weight 1.
+    for ceiling, weight in config.ROLL_PRICE_BANDS:
+        if price < ceiling:
+            return weight
+    return 1
+
+
+WEIGHTINGS = {
+    "uniform": None,
+    "price_band": price_band_weight,
+}
+
+
+class WaifuSampler:
+    """
+    Picks a random catalog entry in constant time. Uniform mode indexes the catalog's dense
+    ID array directly; weighted modes keep an alias table over the catalog's prices,
+    rebuilt when the catalog generation changes. Unclaimed-only rolls are always uniform.
+    Samples are None while the catalog is empty.
+    """
+
+    def __init__(self, waifus=catalog.WAIFUS, weighting=config.ROLL_WEIGHTING):
+        self.waifus = waifus
+        self.weight = WEIGHTINGS[weighting]
+        self.generation = None
+        self.columns = None
+        self.table = None
+
+    def _sync(self):
+        if self.generation == self.waifus.generation:
+            return
+        start = time.perf_counter()
+        columns = self.waifus.columns
+        self.table = AliasTable([self.weight(price) for price in columns.prices])
+        self.columns = columns
+        self.generation = self.waifus.generation
+        logging.info(
+            "Built roll alias table over %d waifus in %.2f ms.",
+            len(self.table),
+            (time.perf_counter() - start) * 1000,
+        )
+
+    def sample(self):
+        if self.weight is None:
+            return self.waifus.random()
+        self._sync()
+        if not self.table:
+            return None
+        return catalog.WaifuRecord(self.columns, self.table.sample())
+
+    @staticmethod
+    def sample_unclaimed(claimed):
+        # Uniform over the entries not set in a claims.ClaimBitmap, or None if all are claimed.
+        if claimed.unclaimed == 0:
+            return None
+        idx = claimed.nth_unclaimed(random.randrange(claimed.unclaimed))
+        return catalog.WaifuRecord(claimed.columns, idx)
+
+
+ROLLS = WaifuSampler()
@@ -0,0 +1,277 @@
+import array
+import asyncio
+import bisect
+import collections
+import heapq
+import logging
+import re
+import sys
+import time
+
+import catalog
+import config
+
+WORD_REGEX = re.compile(r"[^\W_]+")
+
+
+def trigrams(text):
+    """
+    Trigram set of `text` the way pg_trgm's show_trgm() builds it: lowercased alphanumeric
+    words, each padded with two spaces in front and one behind.
+    """
+    result = set()
+    for word in WORD_REGEX.findall(text.lower()):
+        padded = f"  {word} "
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def normalize(text):
+    # Casefolded, with whitespace and punctuation dropped: "Hatsune-Miku " -> "hatsunemiku".
+    return "".join(char for char in text.casefold() if char.isalnum())
+
+
+class TrigramIndex:  # pylint: disable=too-many-instance-attributes
+    """
+    Inverted trigram index over waifu names and series, ranking like the
+    `least(name <-> q, from_anime <-> q)` SQL search: similarity is shared / (query +
+    string - shared) trigrams. Distinct strings are indexed once and kept across catalog
+    refreshes, so a refresh only indexes new strings and remaps them to catalog entries;
+    strings no entry uses any more are dropped and the rest renumbered.
+    Also keeps normalized names in a hash and a sorted list for exact and prefix lookups.
+
+    Refreshes are built in the default executor from copies of the current index, which
+    keeps serving searches until the new one is swapped in.
+    """
+
+    def __init__(self, waifus=catalog.WAIFUS, max_postings=config.SEARCH_MAX_POSTINGS):
+        self.waifus = waifus
+        self.max_postings = max_postings
+        self.generation = None
+        self.columns = None
+        self._string_ids = {}
+        self._sizes = array.array("I")  # string ID -> trigram count
+        self._postings = {}
+        self._owners = {}  # string ID -> catalog indices
+        self._names = {}  # normalized name -> first catalog index
+        self._name_keys = []
+        self._rebuild = None
+        self.tiers = collections.Counter()  # How searches were resolved.
+
+    @property
+    def ready(self):
+        return self.columns is not None
+
+    def sync(self):
+        """
+        Starts a rebuild if the catalog has moved on and none is running. Returns the
+        running rebuild task, if any.
+        """
+        if self._rebuild is None and self.generation != self.waifus.generation:
+            self._rebuild = asyncio.ensure_future(self._rebuild_and_swap())
+        return self._rebuild
+
+    async def rebuild(self):
+        # Waits until the index has caught up with the catalog, as at startup.
+        task = self.sync()
+        if task is not None:
+            await task
+
+    async def _rebuild_and_swap(self):
+        generation, columns = self.waifus.generation, self.waifus.columns
+        start = time.perf_counter()
+        try:
+            built = await asyncio.get_event_loop().run_in_executor(
+                None, self._build, columns, self._string_ids, self._sizes, self._postings
+            )
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Failed to index the waifu catalog.")
+            return
+        finally:
+            self._rebuild = None
+
+        # No await from here on: searches see the old index or the new one, never a mix.
+        self._string_ids, self._sizes, self._postings, self._owners, self._names = built
+        self._name_keys = sorted(self._names)
+        self.columns = columns
+        self.generation = generation
+        logging.info(
+            "Indexed %d distinct waifu names and series in %.2f ms.",
+            len(self._sizes),
+            (time.perf_counter() - start) * 1000,
+        )
+
+    @staticmethod
+    def _build(columns, string_ids, sizes, postings):
+        # Runs in an executor thread, so it only reads the live index and returns new parts.
+        string_ids = dict(string_ids)
+        sizes = array.array("I", sizes)
+        added = collections.defaultdict(list)
+
+        def string_id(text):
+            sid = string_ids.get(text)
+            if sid is None:
+                sid = string_ids[text] = len(sizes)
+                grams = trigrams(text)
+                sizes.append(len(grams))
+                for gram in grams:
+                    added[gram].append(sid)
+            return sid
+
+        owners = collections.defaultdict(list)
+        names = {}
+        for idx, (name, series) in enumerate(zip(columns.names, columns.series)):
+            owners[string_id(name)].append(idx)
+            owners[string_id(series)].append(idx)
+            names.setdefault(normalize(name), idx)
+
+        merged = {}
+        for gram in postings.keys() | added.keys():
+            merged[gram] = array.array("I", postings.get(gram, ()))
+            merged[gram].extend(added.get(gram, ()))
+        return TrigramIndex._prune(string_ids, sizes, merged, owners) + (names,)
+
+    @staticmethod
+    def _prune(string_ids, sizes, postings, owners):
+        # Forgets strings that left the catalog and renumbers the rest.
+        live = sorted(owners)
+        if len(live) == len(sizes):
+            return string_ids, sizes, postings, owners
+        remap = {old: new for new, old in enumerate(live)}
+        string_ids = {
+            text: remap[string_id] for text, string_id in string_ids.items() if string_id in remap
+        }
+        sizes = array.array("I", (sizes[string_id] for string_id in live))
+        pruned = {}
+        for gram, posting in postings.items():
+            kept = array.array("I", (remap[s] for s in posting if s in remap))
+            if kept:
+                pruned[gram] = kept
+        owners = {remap[string_id]: indices for string_id, indices in owners.items()}
+        return string_ids, sizes, pruned, owners
+
+    def lookup(self, text):
+        """
+        Exact or unique-prefix match of `text` against normalized names. Returns the
+        record and the tier ("exact" or "prefix") that matched, or (None, None).
+        """
+        self.sync()
+        key = normalize(text)
+        if not key or not self.ready:
+            return None, None
+
+        idx = self._names.get(key)
+        if idx is not None:
+            return catalog.WaifuRecord(self.columns, idx), "exact"
+
+        keys = self._name_keys
+        pos = bisect.bisect_left(keys, key)
+        if pos < len(keys) and keys[pos].startswith(key):
+            if pos + 1 == len(keys) or not keys[pos + 1].startswith(key):
+                return catalog.WaifuRecord(self.columns, self._names[keys[pos]]), "prefix"
+        return None, None
+
+    def _ranked(self, shared, query_size):
+        # Heap of (-similarity, string ID) over the strings sharing trigrams with the query.
+        ranked = [
+            (-count / (query_size + self._sizes[string_id] - count), string_id)
+            for string_id, count in shared.items()
+        ]
+        heapq.heapify(ranked)
+        return ranked
+
+    def _collect(self, ranked, limit):
+        # An entry scores its better match of name and series, the first string reaching it.
+        top, seen = [], set()
+        while ranked and len(top) < limit:
+            _, string_id = heapq.heappop(ranked)
+            for idx in self._owners.get(string_id, ()):
+                if idx not in seen:
+                    seen.add(idx)
+                    top.append(idx)
+        return top, seen
+
+    def search(self, text, limit):
+        return [catalog.WaifuRecord(self.columns, idx) for idx in self.search_indices(text, limit)]
+
+    def search_indices(self, text, limit):
+        # Catalog indices of the best `limit` matches, in self.columns.
+        self.sync()
+        if not self.ready:
+            return []
+        grams = trigrams(text)
+        # Rarest trigrams first. Once max_postings string IDs have been counted, the more
+        # common trigrams are left out, so a query of common trigrams stays cheap.
+        postings = sorted(filter(None, map(self._postings.get, grams)), key=len)
+        shared = collections.Counter()
+        budget = self.max_postings
+        for posting in postings:
+            if len(posting) > budget:
+                break
+            budget -= len(posting)
+            shared.update(posting)
+        top, seen = self._collect(self._ranked(shared, len(grams)), limit)
+
+        # Like the SQL, fill up to the limit with zero-similarity entries.
+        idx = 0
+        while len(top) < limit and idx < len(self.columns.ids):
+            if idx not in seen:
+                top.append(idx)
+            idx += 1
+        return top[:limit]
+
+
+class SearchResultCache:
+    """
+    Bounded LRU of fuzzy search results, stored as catalog index arrays and keyed by the query's
+    lowercased words (all its trigrams depend on) and the limit. Emptied whenever the
+    index is rebuilt, since rankings may have changed.
+    """
+
+    def __init__(self, index, max_size=config.SEARCH_CACHE_SIZE):
+        self.index = index
+        self.max_size = max_size
+        self.generation = None
+        self._results = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def search(self, text, limit):
+        self.index.sync()
+        if self.generation != self.index.generation:
+            self._results.clear()
+            self.generation = self.index.generation
+
+        key = (" ".join(WORD_REGEX.findall(text.lower())), limit)
+        indices = self._results.get(key)
+        if indices is not None:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return [catalog.WaifuRecord(self.index.columns, idx) for idx in indices]
+
+        self.misses += 1
+        indices = self._results[key] = array.array("I", self.index.search_indices(text, limit))
+        if len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+        return [catalog.WaifuRecord(self.index.columns, idx) for idx in indices]
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def bytes_per_entry(self):
+        if not self._results:
+            return 0
+        total = sum(
+            sys.getsizeof(key) + sys.getsizeof(key[0]) + sys.getsizeof(indices)
+            for key, indices in self._results.items()
+        )
+        return total / len(self._results)
+
+
+WAIFU_INDEX = TrigramIndex()
+SEARCH_CACHE = SearchResultCache(WAIFU_INDEX)
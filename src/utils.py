@@ -1,12 +1,14 @@
 import asyncio
+import collections
 import functools
 
 import discord
 from discord.ext import commands
 
+import cache
 import config
-import database
 import errors
+import waiters
 
 num_to_emote = {
     0: "zero",
@@ -49,8 +51,45 @@ uni_emote_to_num = {
 }
 
 
-async def paginate_embed(ctx, embed, total_pages, modifier_func):
-    og_msg = await ctx.send(embed=embed)
+class PageCache:
+    """
+    Rendered pages of one pagination session, the `max_pages` most recently shown ones.
+    `render_page(page_num)` is an async callable returning a discord.Embed for that page;
+    it must return a new embed each time (e.g. from `base.copy()`), since pages are kept.
+    """
+
+    def __init__(self, render_page, max_pages=config.PAGINATION_CACHE_PAGES):
+        self.render_page = render_page
+        self.max_pages = max_pages
+        self._pages = collections.OrderedDict()
+        self.renders = 0
+
+    def __len__(self):
+        return len(self._pages)
+
+    @property
+    def nbytes(self):
+        # Approximate, by the size of the embed payloads.
+        return sum(len(str(page.to_dict())) for page in self._pages.values())
+
+    async def get(self, page_num):
+        page = self._pages.get(page_num)
+        if page is None:
+            self.renders += 1
+            page = self._pages[page_num] = await self.render_page(page_num)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        self._pages.move_to_end(page_num)
+        return page
+
+
+# Page caches of paginations still waiting for reactions.
+PAGINATIONS = set()
+
+
+async def paginate_embed(ctx, total_pages, render_page):
+    pages = PageCache(render_page)
+    og_msg = await ctx.send(embed=await pages.get(0))
     if total_pages <= 1:
         return
 
@@ -59,18 +98,20 @@ async def paginate_embed(ctx, embed, total_pages, modifier_func):
     await og_msg.add_reaction("⬅")
     await og_msg.add_reaction("➡")
 
-    def check(reaction, user):
-        return not user.bot and reaction.message.id == og_msg.id
+    def check(_reaction, user):
+        return not user.bot
 
+    PAGINATIONS.add(pages)
     seen = False
     try:
         while not seen:
-            reaction, user = await ctx.bot.wait_for("reaction_add", timeout=120.0, check=check)
+            reaction, user = await waiters.WAITERS.wait_for_reaction(
+                og_msg.id, check=check, timeout=120.0
+            )
             if str(reaction.emoji) == "➡":
                 if curr_page < total_pages - 1:
                     curr_page += 1
-                    await modifier_func(page_num=curr_page, direction="forward")
-                    await og_msg.edit(embed=embed)
+                    await og_msg.edit(embed=await pages.get(curr_page))
                 try:
                     await og_msg.remove_reaction("➡", user)
                 except discord.errors.Forbidden:
@@ -78,8 +119,7 @@ async def paginate_embed(ctx, embed, total_pages, modifier_func):
             elif str(reaction.emoji) == "⬅":
                 if curr_page > 0:
                     curr_page -= 1
-                    await modifier_func(page_num=curr_page, direction="backward")
-                    await og_msg.edit(embed=embed)
+                    await og_msg.edit(embed=await pages.get(curr_page))
                 try:
                     await og_msg.remove_reaction("⬅", user)
                 except discord.errors.Forbidden:
@@ -90,36 +130,31 @@ async def paginate_embed(ctx, embed, total_pages, modifier_func):
         except discord.errors.Forbidden:
             pass
         return
-
-
-def chunks(list_, division):
-    for i in range(0, len(list_), division):
-        yield list_[i : i + division]
-
-
-def smart_chunks(list_, max_line):
-    _ll = []
-    _l = []
-    _wc = 0
-    for i in list_:
-        _wc += len(i)
-        if _wc > max_line:
-            _ll.append(_l)
-            _l = []
-            _wc = len(i)
-        _l.append(i)
-    if len(_l) > 0:
-        _ll.append(_l)
-    return _ll
+    finally:
+        PAGINATIONS.discard(pages)
+
+
+def page_bounds(lengths, max_length):
+    """
+    Split items with the given text lengths into pages of at most `max_length` characters
+    (an item longer than that gets a page of its own). Returns (start, end) index pairs.
+    """
+    bounds = []
+    start, total = 0, 0
+    for i, length in enumerate(lengths):
+        if total + length > max_length and i > start:
+            bounds.append((start, i))
+            start, total = i, 0
+        total += length
+    if start < len(lengths) or not bounds:
+        bounds.append((start, len(lengths)))
+    return bounds
 
 
 async def wait_for_message(ctx, timeout=60, user=None):
     user = user or ctx.author
 
-    def check(m_ctx):
-        return m_ctx.channel.id == ctx.channel.id and m_ctx.author.id == user.id
-
-    msg = await ctx.bot.wait_for("message", check=check, timeout=timeout)
+    msg = await waiters.WAITERS.wait_for_message(ctx.channel.id, user.id, timeout=timeout)
     if msg.content.lower() in ["exit", "quit", "cancel"]:
         await ctx.send("Okay, exiting...")
         return False
@@ -181,11 +216,8 @@ def ensure_bot_ready():
 
 def check_tier_matches(tier):
     async def check(ctx):
-        engine = await database.prepare_engine()
-        member = ctx.author
-        fetch_query = database.Member.select().where(database.Member.c.member == member.id)
-        conn = await engine.fetch_one(query=fetch_query)
-        member_tier = conn[database.Member.c.tier]
+        profile = await cache.MEMBER_PROFILES.get(ctx.author.id)
+        member_tier = profile["tier"]
         can_access = member_tier >= tier
 
         if not can_access:
@@ -0,0 +1,87 @@
+import asyncio
+import collections
+
+
+class WaiterRegistry:
+    """
+    Replacement for bot.wait_for on busy events. discord.py runs the check of every pending
+    wait_for on every event; here waiters are indexed by what they wait on, so an event only
+    runs the checks of the waiters it can concern:
+
+    - message waiters by (channel ID, author ID), or (channel ID, None) for any author;
+    - reaction_add waiters by message ID.
+    """
+
+    def __init__(self):
+        self._waiters = collections.defaultdict(list)  # (event, key) -> [(future, check)]
+        self.events = 0
+        self.checks = 0
+
+    def __len__(self):
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    @property
+    def checks_per_event(self):
+        return self.checks / self.events if self.events else 0.0
+
+    def attach(self, bot):
+        bot.add_listener(self.on_message, "on_message")
+        bot.add_listener(self.on_reaction_add, "on_reaction_add")
+
+    async def wait(self, event, key, check=None, timeout=None):
+        """
+        Wait for `event` under `key` for which check(*args) is true, like bot.wait_for:
+        returns the event's argument (or a tuple of them) and raises asyncio.TimeoutError.
+        """
+        future = asyncio.get_event_loop().create_future()
+        waiter = (future, check)
+        waiters = self._waiters[(event, key)]
+        waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            waiters = self._waiters.get((event, key))
+            if waiters is not None and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[(event, key)]
+
+    def wait_for_message(self, channel_id, author_id=None, check=None, timeout=None):
+        return self.wait("message", (channel_id, author_id), check, timeout)
+
+    def wait_for_reaction(self, message_id, check=None, timeout=None):
+        return self.wait("reaction_add", message_id, check, timeout)
+
+    def _dispatch(self, event, key, *args):
+        waiters = self._waiters.get((event, key))
+        if not waiters:
+            return
+        for waiter in list(waiters):
+            future, check = waiter
+            if future.done():
+                continue
+            if check is not None:
+                self.checks += 1
+                try:
+                    matched = check(*args)
+                except Exception as err:  # pylint: disable=broad-except
+                    future.set_exception(err)
+                    continue
+                if not matched:
+                    continue
+            future.set_result(args[0] if len(args) == 1 else args)
+            waiters.remove(waiter)
+        if not waiters:
+            self._waiters.pop((event, key), None)
+
+    async def on_message(self, message):
+        self.events += 1
+        self._dispatch("message", (message.channel.id, message.author.id), message)
+        self._dispatch("message", (message.channel.id, None), message)
+
+    async def on_reaction_add(self, reaction, user):
+        self.events += 1
+        self._dispatch("reaction_add", reaction.message.id, reaction, user)
+
+
+WAITERS = WaiterRegistry()
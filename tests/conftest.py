@@ -0,0 +1,52 @@
+import asyncio
+import os
+import sys
+
+import pytest
+import sqlalchemy as sa
+
+# The bot's modules read these from the environment when they are imported. Tests never
+# touch DATABASE_URL: anything that needs PostgreSQL runs against TEST_DATABASE_URL.
+os.environ.setdefault("TOKEN", "test")
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", "postgresql://localhost/test")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+
+import database  # pylint: disable=wrong-import-position
+
+
+@pytest.fixture(scope="session")
+def database_url():
+    url = os.getenv("TEST_DATABASE_URL")
+    if url is None:
+        pytest.skip("set TEST_DATABASE_URL to a scratch PostgreSQL database")
+    return url
+
+
+@pytest.fixture(scope="session")
+def tables(database_url):
+    # The same startup path as the bot: tables, triggers, then indexes.
+    sa.create_engine(database_url).execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    database.prepare_tables()
+    return database_url
+
+
+@pytest.fixture
+def run():
+    """
+    Run a coroutine on a new event loop, with database.ENGINE created on that loop and
+    closed afterwards.
+    """
+
+    def runner(coroutine):
+        async def main():
+            database.ENGINE = None
+            try:
+                return await coroutine
+            finally:
+                if database.ENGINE is not None:
+                    await database.ENGINE.disconnect()
+                    database.ENGINE = None
+
+        return asyncio.run(main())
+
+    return runner
@@ -0,0 +1,36 @@
+"""
+The second bot process for test_invalidation. It listens on the invalidation bus, prints
+"ready" once it is listening, then prints "evicted <guild> <unix time>" for every guild key
+it evicts until its stdin is closed, and finally its received and skipped counts.
+"""
+
+# pylint: disable=wrong-import-position
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+
+import invalidation
+
+
+def evict(key):
+    print(f"evicted {key} {time.time()}", flush=True)
+
+
+async def main():
+    bus = invalidation.InvalidationBus()
+    bus.subscribe("guild", evict, lambda: None)
+    bus.start()
+    while not bus.listening:
+        await asyncio.sleep(0.01)
+    print("ready", flush=True)
+
+    await asyncio.get_event_loop().run_in_executor(None, sys.stdin.read)
+    await bus.stop()
+    print(f"received {bus.received} skipped {bus.skipped}", flush=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
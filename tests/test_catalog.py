@@ -0,0 +1,40 @@
+"""
+In-memory catalog and roll sampler, built from rows without a database.
+"""
+
+import catalog
+import sampler
+
+ROW = {
+    "id": 1,
+    "name": "Rem",
+    "from_anime": "Re:Zero",
+    "gender": "f",
+    "price": 1000,
+    "description": None,
+    "image_url": None,
+}
+
+
+def test_empty_catalog_rolls_nothing():
+    waifus = catalog.WaifuCatalog()
+    assert waifus.random() is None
+    for weighting in sampler.WEIGHTINGS:
+        assert sampler.WaifuSampler(waifus, weighting).sample() is None
+
+
+def test_rolls_come_from_the_catalog():
+    waifus = catalog.WaifuCatalog()
+    waifus.columns.append(ROW)
+    waifus.generation += 1
+    assert waifus.random()["name"] == "Rem"
+    for weighting in sampler.WEIGHTINGS:
+        assert sampler.WaifuSampler(waifus, weighting).sample()["id"] == 1
+
+
+def test_genders_outside_latin_1_round_trip():
+    columns = catalog.WaifuColumns()
+    for waifu_id, gender in enumerate(("f", "♀", "⚧", None), start=1):
+        columns.append(dict(ROW, id=waifu_id, gender=gender))
+    genders = [catalog.WaifuRecord(columns, idx)["gender"] for idx in range(4)]
+    assert genders == ["f", "♀", "⚧", None]
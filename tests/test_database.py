@@ -0,0 +1,88 @@
+"""
+Connection handling of InstrumentedDatabase that needs no database server.
+"""
+
+# pylint: disable=protected-access
+import asyncio
+
+import database
+
+
+def make_engine():
+    return database.InstrumentedDatabase("postgresql://localhost/test")
+
+
+def test_concurrent_tasks_get_their_own_connection():
+    async def main():
+        engine = make_engine()
+        # Like a boot query run in the main task before bot.start() spawns handlers.
+        parent = engine.connection()
+        assert engine.connection() is parent
+
+        async def handler():
+            first = engine.connection()
+            await asyncio.sleep(0)
+            assert engine.connection() is first
+            return first
+
+        children = await asyncio.gather(handler(), handler())
+        return parent, children
+
+    parent, (first, second) = asyncio.run(main())
+    assert first is not second
+    assert parent not in (first, second)
+
+
+def test_detached_tasks_leave_the_caller_context_alone():
+    async def connection_of(engine):
+        return engine.connection()
+
+    async def main():
+        engine = make_engine()
+        inner = await database.detached(connection_of(engine))
+        return inner, engine._connection_context.get(None)
+
+    inner, leaked = asyncio.run(main())
+    assert inner is not None
+    assert leaked is None
+
+
+class StubConnection:
+    def __init__(self):
+        self.copied = []
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.copied.append((table, records, columns))
+
+
+class StubPool:
+    def __init__(self):
+        self.acquired = []
+
+    async def acquire(self, timeout=None):  # pylint: disable=unused-argument
+        connection = StubConnection()
+        self.acquired.append(connection)
+        return connection
+
+    async def release(self, _connection):
+        return None
+
+
+def test_ledger_flushes_on_its_own_connection(monkeypatch):
+    engine = make_engine()
+    pool = engine._backend._pool = StubPool()
+    monkeypatch.setattr(database, "ENGINE", engine)
+    ledger = database.LedgerWriter()
+    ledger._pending.append((1, 10, "daily", None))
+
+    async def main():
+        # A command holding its connection, say inside a transaction, while the ledger flushes.
+        async with engine.connection() as connection:
+            await ledger.flush()
+            return connection.raw_connection
+
+    command_connection = asyncio.run(main())
+    flushed = [connection for connection in pool.acquired if connection.copied]
+    assert len(flushed) == 1
+    assert flushed[0] is not command_connection
+    assert ledger._pending == []
@@ -0,0 +1,220 @@
+"""
+EXPLAIN checks that the hot purchased_waifu and members lookups are served by an index.
+Seeds 50,000 purchases across 100 guilds in reserved ID ranges and deletes them after.
+"""
+
+# pylint: disable=protected-access
+import asyncio
+import json
+
+import asyncpg
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+import claims
+import database
+import migrate
+from modules.waifu import HaremQuery
+
+BASE_ID = 7 * 10 ** 18
+WAIFUS = 1000
+MEMBERS = 200
+GUILDS = 100
+PER_GUILD = 500
+INDEX_SCANS = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+
+async def seed(url):
+    connection = await asyncpg.connect(url)
+    try:
+        await connection.execute(
+            "INSERT INTO waifu (id, name, from_anime, gender, price) "
+            "SELECT $1::BIGINT + i, 'Waifu ' || i, 'Anime ' || i % 50, 'f', 100 + i "
+            "FROM generate_series(0, $2 - 1) AS i;",
+            BASE_ID,
+            WAIFUS,
+        )
+        member_ids = await connection.fetch(
+            "INSERT INTO members (member, wallet) "
+            "SELECT $1::BIGINT + i, 1000 FROM generate_series(0, $2 - 1) AS i RETURNING id;",
+            BASE_ID,
+            MEMBERS,
+        )
+        member_ids = [row["id"] for row in member_ids]
+        rows = []
+        for guild in range(GUILDS):
+            for k in range(PER_GUILD):
+                member = (guild * 31 + k) % MEMBERS
+                rows.append(
+                    (
+                        member_ids[member],
+                        BASE_ID + (guild * 7 + k) % WAIFUS,
+                        BASE_ID + guild,
+                        BASE_ID + member,
+                        100 + k,
+                    )
+                )
+        await connection.copy_records_to_table(
+            "purchased_waifu",
+            records=rows,
+            columns=["member_id", "waifu_id", "guild", "member", "purchased_for"],
+        )
+        await connection.execute("ANALYZE purchased_waifu; ANALYZE members; ANALYZE waifu;")
+        return member_ids
+    finally:
+        await connection.close()
+
+
+async def unseed(url):
+    connection = await asyncpg.connect(url)
+    try:
+        # Purchases and net worth rows go with their members and waifus.
+        await connection.execute("DELETE FROM members WHERE member >= $1;", BASE_ID)
+        await connection.execute("DELETE FROM waifu WHERE id >= $1;", BASE_ID)
+        await connection.execute("DELETE FROM coin_ledger WHERE member >= $1;", BASE_ID)
+    finally:
+        await connection.close()
+
+
+@pytest.fixture(scope="module")
+def seeded(tables):
+    member_ids = asyncio.run(seed(tables))
+    yield tables, member_ids
+    asyncio.run(unseed(tables))
+
+
+def literal_sql(query):
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+async def explain(url, sql, *args):
+    connection = await asyncpg.connect(url)
+    try:
+        return json.loads(await connection.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args))
+    finally:
+        await connection.close()
+
+
+def plan_nodes(plan):
+    stack = [plan[0]["Plan"]]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.get("Plans", ()))
+
+
+def index_scans(plan, table):
+    return {
+        node.get("Index Name")
+        for node in plan_nodes(plan)
+        if node["Node Type"] in INDEX_SCANS
+        and (node.get("Relation Name", table) == table or "Relation Name" not in node)
+    }
+
+
+def assert_uses_index(url, sql, args, table, *expected):
+    plan = asyncio.run(explain(url, sql, *args))
+    used = index_scans(plan, table)
+    assert used & set(expected), f"expected an index scan on {expected}, plan: {plan}"
+
+
+def test_waifu_owner_lookup(seeded):
+    url, _ = seeded
+    # details, buy, randomroll and trades: who owns waifu X in guild G.
+    assert_uses_index(
+        url,
+        database.WAIFU_OWNER.sql,
+        database.WAIFU_OWNER._args({"guild": BASE_ID + 3, "waifu_id": BASE_ID + 42}),
+        "purchased_waifu",
+        "purchased_waifu_guild_waifu",
+    )
+
+
+def test_guild_claims(seeded):
+    url, _ = seeded
+    assert_uses_index(
+        url,
+        claims.GUILD_CLAIMS.sql,
+        claims.GUILD_CLAIMS._args({"guild": BASE_ID + 3}),
+        "purchased_waifu",
+        "purchased_waifu_guild_waifu",
+        "purchased_waifu_key",
+    )
+
+
+def test_member_waifu_value(seeded):
+    url, member_ids = seeded
+    query = sa.select([sa.func.sum(database.PurchasedWaifu.c.purchased_for)]).where(
+        database.PurchasedWaifu.c.member_id == member_ids[5]
+    )
+    assert_uses_index(
+        url, literal_sql(query), (), "purchased_waifu", "purchased_waifu_member_value"
+    )
+
+
+def test_harem_page(seeded):
+    url, _ = seeded
+    harem = HaremQuery(BASE_ID + 3, BASE_ID + 5, ())
+    query = harem._select([database.PurchasedWaifu.c.id]).limit(10)
+    assert_uses_index(url, literal_sql(query), (), "purchased_waifu", "purchased_waifu_key")
+
+
+def test_member_wallet(seeded):
+    url, _ = seeded
+    assert_uses_index(
+        url,
+        database.MEMBER_WALLET.sql,
+        database.MEMBER_WALLET._args({"member": BASE_ID + 5}),
+        "members",
+        "members_member_key",
+    )
+
+
+def test_duplicate_claims_block_the_unique_index_until_migrated(seeded):
+    url, member_ids = seeded
+    engine = sa.create_engine(url)
+    index = next(i for i in database.indexes if i.name == "purchased_waifu_guild_waifu")
+    guild, waifu = BASE_ID + GUILDS, BASE_ID + 1
+
+    engine.execute(f"DROP INDEX {index.name};")
+    engine.execute(
+        database.PurchasedWaifu.insert(None),
+        [
+            {
+                "member_id": member_ids[i],
+                "waifu_id": waifu,
+                "guild": guild,
+                "member": BASE_ID + i,
+                "purchased_for": 100 * (i + 1),
+            }
+            for i in range(3)
+        ],
+    )
+    with pytest.raises(sa.exc.IntegrityError):
+        database.create_index(index, engine)
+    assert len(migrate.dedupe_purchases(engine)) == 2
+    database.create_index(index, engine)
+
+    owners = engine.execute(
+        sa.select([database.PurchasedWaifu.c.member])
+        .where(database.PurchasedWaifu.c.guild == guild)
+        .where(database.PurchasedWaifu.c.waifu_id == waifu)
+    ).fetchall()
+    assert [row.member for row in owners] == [BASE_ID]
+
+    wallets = dict(
+        engine.execute(
+            sa.select([database.Member.c.member, database.Member.c.wallet]).where(
+                database.Member.c.member.in_([BASE_ID + 1, BASE_ID + 2])
+            )
+        ).fetchall()
+    )
+    assert wallets == {BASE_ID + 1: 1200, BASE_ID + 2: 1300}
+    refunds = engine.execute(
+        sa.select([sa.func.count()])
+        .select_from(database.CoinLedger)
+        .where(database.CoinLedger.c.reason == "dedupe")
+        .where(database.CoinLedger.c.member.in_([BASE_ID + 1, BASE_ID + 2]))
+    ).scalar()
+    assert refunds == 2
@@ -0,0 +1,78 @@
+"""
+Two bot processes on one database, both listening on the invalidation bus. This process
+updates a guild row; the peer process must evict that guild within EVICTION_BOUND of each
+write, while this process skips its own notifications.
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+import database
+import invalidation
+
+GUILD_ID = 7 * 10 ** 18
+UPDATES = 20
+EVICTION_BOUND = 1.0  # seconds
+PEER = os.path.join(os.path.dirname(__file__), "invalidation_peer.py")
+
+
+async def write_updates():
+    bus = invalidation.InvalidationBus()
+    evicted = []
+    bus.subscribe("guild", evicted.append, evicted.clear)
+    bus.start()
+    while not bus.listening:
+        await asyncio.sleep(0.01)
+
+    engine = await database.prepare_engine()
+    await engine.execute(
+        postgresql.insert(database.Guild).values(guild=GUILD_ID).on_conflict_do_nothing()
+    )
+    written_at = []
+    for _ in range(UPDATES):
+        written_at.append(time.time())
+        await engine.execute(
+            database.Guild.update()
+            .where(database.Guild.c.guild == GUILD_ID)
+            .values(coin_drops=sa.not_(database.Guild.c.coin_drops))
+        )
+    await asyncio.sleep(EVICTION_BOUND)  # Let our own notifications arrive too.
+    await bus.stop()
+    return written_at, evicted, bus.skipped
+
+
+def test_peer_evicts_within_bound(tables, run):
+    peer = subprocess.Popen(
+        [sys.executable, PEER],
+        env={**os.environ, "DATABASE_URL": tables, "INSTANCE_NAME": "pinocchio-test-peer"},
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    try:
+        assert peer.stdout.readline().strip() == "ready"
+        written_at, own_evicted, own_skipped = run(write_updates())
+        output, _ = peer.communicate(timeout=10)
+    finally:
+        if peer.poll() is None:
+            peer.kill()
+        sa.create_engine(tables).execute(
+            database.Guild.delete().where(database.Guild.c.guild == GUILD_ID)
+        )
+
+    *evictions, counts = output.splitlines()
+    assert counts == f"received {UPDATES} skipped 0"
+    assert len(evictions) == UPDATES
+    for sent, line in zip(written_at, evictions):
+        _, key, evicted_at = line.split()
+        assert int(key) == GUILD_ID
+        assert float(evicted_at) - sent < EVICTION_BOUND
+
+    assert own_evicted == []
+    assert own_skipped == UPDATES
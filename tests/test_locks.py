@@ -0,0 +1,22 @@
+"""
+LockManager with the advisory backend when Postgres cannot be reached. Needs no database.
+"""
+
+import asyncio
+
+import locks
+
+
+class UnreachableBackend(locks.AdvisoryBackend):
+    async def _query(self, sql, lock_id):
+        raise ConnectionRefusedError()
+
+
+def test_advisory_lock_fails_closed_when_postgres_is_down():
+    manager = locks.LockManager("test", backend=None)
+    manager.advisory = UnreachableBackend()
+
+    acquired = asyncio.run(manager.acquire("key", owner=1))
+
+    assert not acquired
+    assert (manager.held, manager.acquired, len(manager)) == (0, 0, 0)
@@ -0,0 +1,66 @@
+"""
+Balance changes that go with a purchased_waifu change: coins only move when the row did.
+"""
+
+import asyncio
+import types
+
+import sqlalchemy as sa
+
+import config
+import database
+
+MEMBER_ID = 7 * 10 ** 18 + 1
+GUILD_ID = 7 * 10 ** 18 + 2
+WAIFU_ID = 7 * 10 ** 18 + 3
+PRICE = 1000
+
+
+async def seed_purchase():
+    engine = await database.prepare_engine()
+    profile_id = await engine.fetch_val(
+        database.Member.insert(None)
+        .values(member=MEMBER_ID, wallet=0)
+        .returning(database.Member.c.id)
+    )
+    await engine.execute(
+        database.Waifu.insert(None).values(
+            id=WAIFU_ID, name="Rem", from_anime="Re:Zero", gender="f", price=PRICE
+        )
+    )
+    return await engine.fetch_val(
+        database.PurchasedWaifu.insert(None)
+        .values(
+            member_id=profile_id,
+            waifu_id=WAIFU_ID,
+            guild=GUILD_ID,
+            member=MEMBER_ID,
+            purchased_for=PRICE,
+        )
+        .returning(database.PurchasedWaifu.c.id)
+    )
+
+
+def test_selling_twice_pays_once(tables, run, monkeypatch):
+    monkeypatch.setattr(database, "LEDGER", database.LedgerWriter())
+    member = types.SimpleNamespace(id=MEMBER_ID)
+
+    async def main():
+        purchase_id = await seed_purchase()
+        # Two sells of the same waifu racing, like a double confirm.
+        results = await asyncio.gather(
+            database.sell_waifus(member, GUILD_ID, [purchase_id]),
+            database.sell_waifus(member, GUILD_ID, [purchase_id]),
+        )
+        return results, await database.fetch_wallet(member)
+
+    try:
+        results, wallet = run(main())
+    finally:
+        engine = sa.create_engine(tables)
+        engine.execute(database.Member.delete().where(database.Member.c.member == MEMBER_ID))
+        engine.execute(database.Waifu.delete().where(database.Waifu.c.id == WAIFU_ID))
+
+    payouts = sorted(payout for _, payout in results)
+    assert payouts == [0, int(PRICE * config.SELL_WAIFU_DEPRECIATION)]
+    assert wallet == int(PRICE * config.SELL_WAIFU_DEPRECIATION)
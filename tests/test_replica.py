@@ -0,0 +1,103 @@
+"""
+ReadReplica against stub engines: reads go to the replica while it is healthy and fall
+back to the primary when it errors or lags. Needs no database.
+"""
+
+import asyncio
+
+import asyncpg
+import pytest
+
+import database
+
+REPLICA_URL = "postgresql://replica/test"
+
+
+class StubEngine:
+    def __init__(self, name, lag=0.0, error=None):
+        self.name = name
+        self.lag = lag
+        self.error = error  # Raised by every call, the lag check included.
+        self.queries = []
+
+    async def fetch_val(self, query, values=None, site=None):
+        if self.error is not None:
+            raise self.error
+        if query == database.REPLICA_LAG_QUERY:
+            return self.lag
+        self.queries.append(site)
+        return self.name
+
+    fetch_one = fetch_all = fetch_val
+
+    async def fetch_prepared(self, method, site, sql, args):  # pylint: disable=unused-argument
+        return await self.fetch_val(sql, args, site=site)
+
+
+@pytest.fixture
+def primary(monkeypatch):
+    engine = StubEngine("primary")
+    monkeypatch.setattr(database, "ENGINE", engine)
+    return engine
+
+
+def make_replica(**kwargs):
+    replica = database.ReadReplica(url=REPLICA_URL)
+    replica.engine = StubEngine("replica", **kwargs)
+    return replica
+
+
+def test_healthy_replica_serves_reads(primary):
+    replica = make_replica()
+    assert asyncio.run(replica.fetch_val("SELECT 1", site="read")) == "replica"
+    assert asyncio.run(replica.fetch_prepared("fetchval", "read", "SELECT 1", [])) == "replica"
+    assert (replica.reads, replica.fallbacks) == (2, 0)
+    assert primary.queries == []
+
+
+def test_lagging_replica_falls_back_to_primary(primary):
+    replica = make_replica(lag=database.REPLICA_MAX_LAG + 1)
+    assert asyncio.run(replica.fetch_all("SELECT 1", site="read")) == "primary"
+    assert (replica.reads, replica.fallbacks) == (0, 1)
+    assert replica.engine.queries == []
+    assert primary.queries == ["read"]
+
+
+def test_replica_without_wal_receiver_falls_back_to_primary(primary):
+    # REPLICA_LAG_QUERY returns NULL when the replica lost its primary.
+    replica = make_replica(lag=None)
+    assert asyncio.run(replica.fetch_val("SELECT 1", site="read")) == "primary"
+    assert replica.lag == float("inf")
+    assert (replica.reads, replica.fallbacks) == (0, 1)
+
+
+@pytest.mark.parametrize(
+    "error", [ConnectionRefusedError(), asyncio.TimeoutError(), asyncpg.InterfaceError("closed")]
+)
+def test_failing_replica_falls_back_to_primary(primary, error):
+    replica = make_replica(error=error)
+    assert asyncio.run(replica.fetch_one("SELECT 1", site="read")) == "primary"
+    assert (replica.reads, replica.fallbacks) == (0, 1)
+    assert primary.queries == ["read"]
+
+
+def test_replica_failing_mid_read_is_skipped_until_rechecked(primary):
+    replica = make_replica()
+    asyncio.run(replica.fetch_val("SELECT 1", site="read"))  # Healthy at the lag check.
+
+    replica.engine.error = ConnectionResetError()
+    assert asyncio.run(replica.fetch_val("SELECT 1", site="read")) == "primary"
+    replica.engine.error = None
+    assert asyncio.run(replica.fetch_val("SELECT 1", site="read")) == "primary"
+    assert (replica.reads, replica.fallbacks) == (1, 2)
+
+    replica.checked_at -= database.REPLICA_LAG_CHECK_INTERVAL
+    assert asyncio.run(replica.fetch_val("SELECT 1", site="read")) == "replica"
+    assert primary.queries == ["read", "read"]
+
+
+def test_no_replica_reads_primary_without_counting_fallbacks(primary):
+    replica = database.ReadReplica(url=None)
+    assert asyncio.run(replica.fetch_val("SELECT 1", site="read")) == "primary"
+    assert (replica.reads, replica.fallbacks) == (0, 0)
+    assert primary.queries == ["read"]
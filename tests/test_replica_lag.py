@@ -0,0 +1,66 @@
+"""
+REPLICA_LAG_QUERY on a real primary and streaming replica: TEST_DATABASE_URL and
+TEST_REPLICA_DATABASE_URL, a hot standby of it. Cutting replication needs a role that may
+terminate the primary's WAL senders.
+"""
+
+import asyncio
+import os
+import time
+
+import asyncpg
+import pytest
+
+import database
+
+
+@pytest.fixture(scope="module")
+def replica_url(database_url):
+    url = os.getenv("TEST_REPLICA_DATABASE_URL")
+    if url is None:
+        pytest.skip("set TEST_REPLICA_DATABASE_URL to a streaming replica of TEST_DATABASE_URL")
+    return database_url, url
+
+
+async def replica_lag(url):
+    connection = await asyncpg.connect(url)
+    try:
+        return await connection.fetchval(database.REPLICA_LAG_QUERY)
+    finally:
+        await connection.close()
+
+
+async def primary_execute(url, sql):
+    connection = await asyncpg.connect(url)
+    try:
+        return await connection.execute(sql)
+    finally:
+        await connection.close()
+
+
+async def poll_lag(url, accept, timeout=5):
+    # The first lag `accept` takes, or the last one seen after `timeout` seconds.
+    deadline = time.monotonic() + timeout
+    while True:
+        lag = await replica_lag(url)
+        if accept(lag) or time.monotonic() > deadline:
+            return lag
+        await asyncio.sleep(0.05)
+
+
+def test_streaming_replica_reports_no_lag_once_caught_up(replica_url):
+    primary, replica = replica_url
+    asyncio.run(primary_execute(primary, "SELECT pg_switch_wal();"))
+    lag = asyncio.run(poll_lag(replica, lambda lag: lag == 0))
+    assert lag == 0
+
+
+def test_replica_cut_off_from_primary_reports_unknown_lag(replica_url):
+    primary, replica = replica_url
+    # The replica has replayed everything it received, which used to read as zero lag.
+    asyncio.run(poll_lag(replica, lambda lag: lag == 0))
+    asyncio.run(
+        primary_execute(primary, "SELECT pg_terminate_backend(pid) FROM pg_stat_replication;")
+    )
+    # Its WAL receiver exits and only retries after wal_retrieve_retry_interval (5 s).
+    assert asyncio.run(poll_lag(replica, lambda lag: lag is None, timeout=2)) is None
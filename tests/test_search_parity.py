@@ -0,0 +1,85 @@
+"""
+The in-process trigram search must rank like the pg_trgm SQL search it replaces. On a
+generated fixture catalog, each query's top LIMIT must have the same similarity at every
+rank (ties may be ordered differently, similarities may not).
+"""
+
+import random
+import string
+
+import pytest
+
+import catalog
+import database
+import trigram
+from modules.waifu import WAIFU_SEARCH
+
+FIXTURE_SIZE = 20000
+FIXTURE_BASE_ID = 8 * 10 ** 18
+LIMIT = 30
+QUERIES = ["naruto", "rem", "kaguya shinomiya", "a", "x y", "zzzz", "Hatsune-Miku", "re:zero"]
+
+
+def fake_words(rng, count):
+    return " ".join(
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))).capitalize()
+        for _ in range(count)
+    )
+
+
+def fixture_rows():
+    rng = random.Random(FIXTURE_SIZE)
+    series = [fake_words(rng, rng.randint(1, 4)) for _ in range(FIXTURE_SIZE // 20)]
+    return [
+        {
+            "id": FIXTURE_BASE_ID + i,
+            "name": fake_words(rng, 2),
+            "from_anime": rng.choice(series),
+            "gender": rng.choice("mf"),
+            "price": rng.randint(100, 100000),
+        }
+        for i in range(FIXTURE_SIZE)
+    ]
+
+
+def similarity(query, waifu):
+    grams = trigram.trigrams(query)
+
+    def score(text):
+        other = trigram.trigrams(text)
+        shared = len(grams & other)
+        return shared / (len(grams) + len(other) - shared) if shared else 0.0
+
+    return max(score(waifu["name"]), score(waifu["from_anime"]))
+
+
+async def compare_rankings():
+    engine = await database.prepare_engine()
+    rows = fixture_rows()
+    await engine.execute_many(query=database.Waifu.insert(None), values=rows)
+    try:
+        waifus = catalog.WaifuCatalog()
+        await waifus.load()
+        index = trigram.TrigramIndex(waifus)
+        await index.rebuild()
+        rng = random.Random(LIMIT)
+        queries = QUERIES + [rng.choice(rows)["name"] for _ in range(10)]
+        queries += [rng.choice(rows)["from_anime"][:6] for _ in range(10)]
+
+        mismatches = {}
+        for query in queries:
+            sql_rows = await WAIFU_SEARCH.fetch_all(search=query, limit=LIMIT)
+            sql_sims = [round(1 - row["sim"], 5) for row in sql_rows]
+            local_sims = [round(similarity(query, row), 5) for row in index.search(query, LIMIT)]
+            if sql_sims != local_sims:
+                mismatches[query] = (sql_sims, local_sims)
+        return mismatches
+    finally:
+        await engine.execute(
+            query=database.Waifu.delete().where(database.Waifu.c.id >= FIXTURE_BASE_ID)
+        )
+
+
+@pytest.mark.usefixtures("tables")
+def test_trigram_index_ranks_like_sql(run):
+    assert run(compare_rankings()) == {}
@@ -0,0 +1,93 @@
+"""
+TrigramIndex kept in step with catalog refreshes, without a database.
+"""
+
+# pylint: disable=protected-access
+import asyncio
+
+import catalog
+import trigram
+
+
+def make_catalog(*entries):
+    waifus = catalog.WaifuCatalog()
+    replace(waifus, *entries)
+    return waifus
+
+
+def replace(waifus, *entries):
+    # A refresh: a new WaifuColumns swapped in under a new generation.
+    columns = catalog.WaifuColumns()
+    for waifu_id, (name, series) in enumerate(entries, start=1):
+        columns.append(
+            {
+                "id": waifu_id,
+                "name": name,
+                "from_anime": series,
+                "gender": "f",
+                "price": 100,
+                "description": None,
+                "image_url": None,
+            }
+        )
+    waifus.columns = columns
+    waifus.generation += 1
+
+
+def rebuild(index):
+    asyncio.run(index.rebuild())
+
+
+def test_refresh_prunes_strings_that_left_the_catalog():
+    waifus = make_catalog(("Rem", "Re:Zero"), ("Kaguya Shinomiya", "Kaguya-sama"))
+    index = trigram.TrigramIndex(waifus)
+    rebuild(index)
+
+    replace(waifus, ("Rem", "Re:Zero"), ("Hatsune Miku", "Vocaloid"))
+    rebuild(index)
+
+    assert set(index._string_ids) == {"Rem", "Re:Zero", "Hatsune Miku", "Vocaloid"}
+    assert len(index._sizes) == 4
+    assert "kag" not in index._postings
+    assert all(posting and max(posting) < 4 for posting in index._postings.values())
+    assert [w["name"] for w in index.search("kaguya", 2)] == ["Rem", "Hatsune Miku"]
+    assert index.search("miku", 1)[0]["name"] == "Hatsune Miku"
+    assert index.search("zero", 1)[0]["name"] == "Rem"
+
+
+def test_refresh_without_removals_keeps_string_ids():
+    waifus = make_catalog(("Rem", "Re:Zero"))
+    index = trigram.TrigramIndex(waifus)
+    rebuild(index)
+    before = dict(index._string_ids)
+
+    replace(waifus, ("Rem", "Re:Zero"), ("Ram", "Re:Zero"))
+    rebuild(index)
+
+    assert {text: index._string_ids[text] for text in before} == before
+    assert index.search("ram", 1)[0]["name"] == "Ram"
+
+
+def test_searches_use_the_old_index_until_the_rebuild_is_swapped_in():
+    waifus = make_catalog(("Rem", "Re:Zero"))
+    index = trigram.TrigramIndex(waifus)
+    rebuild(index)
+    replace(waifus, ("Hatsune Miku", "Vocaloid"))
+
+    async def main():
+        during = index.search("rem", 1)
+        await index.rebuild()
+        return during, index.search("rem", 1)
+
+    during, after = asyncio.run(main())
+    assert during[0]["name"] == "Rem"
+    assert after[0]["name"] == "Hatsune Miku"
+
+
+def test_common_trigrams_beyond_the_posting_budget_are_skipped():
+    waifus = make_catalog(*((f"Sakura {i}", "Naruto") for i in range(50)), ("Sakuya", "Touhou"))
+    index = trigram.TrigramIndex(waifus, max_postings=10)
+    rebuild(index)
+
+    # "sak" and "aku" are shared by every Sakura; only the rarer "kuy" and "uya" are counted.
+    assert index.search("sakuya", 1)[0]["name"] == "Sakuya"